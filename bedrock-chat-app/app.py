@@ -4,27 +4,67 @@ bedrock-chat-app — single-file FastAPI application.
 This module is the entry point. On import / startup it:
   1. Loads environment variables from .env
   2. Validates required variables and exits with code 1 on failure
-  3. Constructs the boto3 Bedrock client as a module-level singleton
+  3. Prepares the Bedrock backend (a boto3 client, built on first use)
   4. Registers routes, serves the embedded frontend, etc.
 """
 
+import asyncio
+import atexit
 import base64
 import binascii
+import bisect
+import contextlib
+import contextvars
+import functools
+import gzip
+import hashlib
+import hmac
+import json
 import logging
+import logging.handlers
 import os
+import math
+import queue
+import random
+import re
+import secrets
+import signal
+import sqlite3
 import sys
+import threading
+import time
 import traceback
-from typing import AsyncGenerator, Dict, List, Literal, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    AsyncGenerator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Literal,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Tuple,
+    Union,
+    runtime_checkable,
+)
 
-import boto3
 from botocore.exceptions import ClientError
-from dotenv import load_dotenv
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, Response, StreamingResponse
-from pydantic import BaseModel, field_validator, model_validator
-from starlette.middleware.base import BaseHTTPMiddleware
+from dotenv import dotenv_values, load_dotenv
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, field_validator, model_validator
 from starlette.requests import Request
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:  # optional: brotli-compressed page assets; gzip is always available
+    import brotli
+except ImportError:
+    brotli = None
 
 # ---------------------------------------------------------------------------
 # Logging — configure before any validation so error messages are visible
@@ -36,325 +76,3934 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ---------------------------------------------------------------------------
+# Password hashing — defined before any configuration is read, so
+# `python app.py hash-password` works without AWS credentials or a .env
+# ---------------------------------------------------------------------------
+# scrypt cost for newly hashed passwords: roughly 100 ms and 32 MiB per check
+_SCRYPT_N, _SCRYPT_R, _SCRYPT_P = 2 ** 15, 8, 1
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def hash_password(password: str) -> str:
+    """Hash *password* as ``scrypt$N$r$p$salt$hash`` for an AUTH_USERS_FILE."""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=_SCRYPT_N, r=_SCRYPT_R, p=_SCRYPT_P,
+        maxmem=256 * 1024 * 1024, dklen=32,
+    )
+    return f"scrypt${_SCRYPT_N}${_SCRYPT_R}${_SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["hash-password"]:
+    # python app.py hash-password  — print a hash for AUTH_USERS_FILE; the
+    # password is prompted for on a terminal, else read from stdin
+    import getpass
+
+    if sys.stdin.isatty():
+        print(hash_password(getpass.getpass("Password: ")))
+    else:
+        print(hash_password(sys.stdin.readline().rstrip("\r\n")))
+    sys.exit(0)
+
 # ---------------------------------------------------------------------------
 # Environment loading
 # ---------------------------------------------------------------------------
+# Variables set by the real environment take precedence over .env, both now
+# and when the configuration is reloaded (see reload_config)
+#
+# With WORKERS > 1 the supervisor passes its real environment's names here.
+# Workers inherit its os.environ, .env values included; they drop those and
+# read .env afresh, so a worker restarted after a reload sees the new file.
+_PROCESS_ENV_NAMES_ENV = "BEDROCK_CHAT_PROCESS_ENV"
+if _PROCESS_ENV_NAMES_ENV in os.environ:
+    _PROCESS_ENV_NAMES = frozenset(json.loads(os.environ[_PROCESS_ENV_NAMES_ENV]))
+    for _name in set(os.environ) - _PROCESS_ENV_NAMES:
+        del os.environ[_name]
+else:
+    _PROCESS_ENV_NAMES = frozenset(os.environ)
 load_dotenv()
 
 # ---------------------------------------------------------------------------
 # Startup validation
 # ---------------------------------------------------------------------------
 
-# Support both IAM credentials (access key/secret key) and ABSK bearer tokens.
-# IAM credentials take priority if both AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY are set.
-aws_access_key = os.environ.get("AWS_ACCESS_KEY_ID", "").strip()
-aws_secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY", "").strip()
-aws_bearer_token = os.environ.get("AWS_BEARER_TOKEN_BEDROCK", "").strip()
 
-if not aws_access_key and not aws_bearer_token:
-    logger.error("ERROR: Either AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY or AWS_BEARER_TOKEN_BEDROCK must be set")
-    sys.exit(1)
+class ConfigError(Exception):
+    """A required setting is missing or invalid."""
+
 
-# Requirement 2.2 — AWS_REGION with default
-aws_region: str = os.environ.get("AWS_REGION", "us-east-1")
+class RuntimeSettings(NamedTuple):
+    """Settings that a configuration reload can change without a restart."""
 
-# Requirement 2.3 — BEDROCK_MODEL_ID with default
-bedrock_model_id: str = os.environ.get(
+    aws_access_key: str
+    aws_secret_key: str
+    aws_session_token: Optional[str]
+    aws_bearer_token: str
+    aws_region: str
+    bedrock_model_id: str
+    auth_users_file: str
+    auth_username: str
+    auth_password: str
+
+
+# Environment variable behind each RuntimeSettings field
+_RUNTIME_SETTING_NAMES = dict(zip(RuntimeSettings._fields, (
+    "AWS_ACCESS_KEY_ID",
+    "AWS_SECRET_ACCESS_KEY",
+    "AWS_SESSION_TOKEN",
+    "AWS_BEARER_TOKEN_BEDROCK",
+    "AWS_REGION",
     "BEDROCK_MODEL_ID",
-    "anthropic.claude-3-5-sonnet-20241022-v2:0",
-)
+    "AUTH_USERS_FILE",
+    "AUTH_USERNAME",
+    "AUTH_PASSWORD",
+)))
+
+
+def read_runtime_settings(env: Mapping[str, str], auth_enabled: bool) -> RuntimeSettings:
+    """Validate the reloadable settings in *env*; raise ConfigError if invalid."""
+    # Support both IAM credentials (access key/secret key) and ABSK bearer tokens.
+    # IAM credentials take priority if both AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY are set.
+    aws_access_key = env.get("AWS_ACCESS_KEY_ID", "").strip()
+    aws_secret_key = env.get("AWS_SECRET_ACCESS_KEY", "").strip()
+    aws_bearer_token = env.get("AWS_BEARER_TOKEN_BEDROCK", "").strip()
+
+    if not aws_access_key and not aws_bearer_token:
+        raise ConfigError("Either AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY or AWS_BEARER_TOKEN_BEDROCK must be set")
+
+    # Optional file of "username:password-hash" lines; replaces AUTH_USERNAME /
+    # AUTH_PASSWORD when set
+    auth_users_file = env.get("AUTH_USERS_FILE", "").strip()
+
+    # Requirement 7.2 — Optional auth validation
+    if auth_enabled and auth_users_file:
+        if not os.path.isfile(auth_users_file):
+            raise ConfigError(f"AUTH_USERS_FILE {auth_users_file} does not exist")
+        auth_username = ""
+        auth_password = ""
+    elif auth_enabled:
+        auth_username = env.get("AUTH_USERNAME", "").strip()
+        if not auth_username:
+            raise ConfigError("AUTH_USERNAME is not set or empty")
+
+        auth_password = env.get("AUTH_PASSWORD", "").strip()
+        if not auth_password:
+            raise ConfigError("AUTH_PASSWORD is not set or empty")
+    else:
+        auth_username = env.get("AUTH_USERNAME", "")
+        auth_password = env.get("AUTH_PASSWORD", "")
+
+    return RuntimeSettings(
+        aws_access_key=aws_access_key,
+        aws_secret_key=aws_secret_key,
+        aws_session_token=env.get("AWS_SESSION_TOKEN", "").strip() or None,
+        aws_bearer_token=aws_bearer_token,
+        # Requirement 2.2 — AWS_REGION with default
+        aws_region=env.get("AWS_REGION", "us-east-1"),
+        # Requirement 2.3 — BEDROCK_MODEL_ID with default
+        bedrock_model_id=env.get("BEDROCK_MODEL_ID", "anthropic.claude-3-5-sonnet-20241022-v2:0"),
+        auth_users_file=auth_users_file,
+        auth_username=auth_username,
+        auth_password=auth_password,
+    )
+
 
-# Requirement 7.2 — Optional auth validation
 auth_enabled: bool = os.environ.get("AUTH_ENABLED", "false").strip().lower() == "true"
 
-if auth_enabled:
-    auth_username = os.environ.get("AUTH_USERNAME", "").strip()
-    if not auth_username:
-        logger.error("ERROR: AUTH_USERNAME is not set or empty")
+try:
+    runtime_settings = read_runtime_settings(os.environ, auth_enabled)
+except ConfigError as exc:
+    logger.error("ERROR: %s", exc)
+    sys.exit(1)
+
+# Reassigned together by reload_config; requests read them when they start
+aws_region: str = runtime_settings.aws_region
+bedrock_model_id: str = runtime_settings.bedrock_model_id
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    """Read an integer tuning knob from the environment; exit 1 if invalid."""
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.error("ERROR: %s must be an integer, got %r", name, raw)
         sys.exit(1)
+    if value < minimum:
+        logger.error("ERROR: %s must be >= %d, got %d", name, minimum, value)
+        sys.exit(1)
+    return value
+
 
-    auth_password = os.environ.get("AUTH_PASSWORD", "").strip()
-    if not auth_password:
-        logger.error("ERROR: AUTH_PASSWORD is not set or empty")
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a "true"/"false" flag from the environment."""
+    raw = os.environ.get(name, "").strip().lower()
+    if not raw:
+        return default
+    return raw == "true"
+
+
+def _env_float(name: str, default: float, minimum: float = 0.0) -> float:
+    """Read a float tuning knob from the environment; exit 1 if invalid."""
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        logger.error("ERROR: %s must be a number, got %r", name, raw)
+        sys.exit(1)
+    if value < minimum:
+        logger.error("ERROR: %s must be >= %s, got %s", name, minimum, value)
         sys.exit(1)
+    return value
+
+
+# Production launch with `python app.py`: uvicorn worker processes, and how
+# many seconds a shutdown waits for open streams to finish.  With several
+# workers each process gets an equal share of the concurrency and rate limits
+# below, and state that must agree across processes lives in SHARED_STATE_DB.
+WORKERS: int = _env_int("WORKERS", 1, minimum=1)
+SHUTDOWN_DRAIN_SECONDS: int = _env_int("SHUTDOWN_DRAIN_SECONDS", 30)
+SHARED_STATE_DB: str = os.environ.get("SHARED_STATE_DB", "shared-state.db").strip()
+
+
+def _per_worker(total: int) -> int:
+    """This process's share of a service-wide integer limit (rounded up)."""
+    return math.ceil(total / WORKERS)
+
+
+# Upstream concurrency limits — see AdmissionController below
+MAX_CONCURRENT_STREAMS: int = _env_int("MAX_CONCURRENT_STREAMS", 32, minimum=1)
+MAX_QUEUED_STREAMS: int = _env_int("MAX_QUEUED_STREAMS", 64)
+QUEUE_TIMEOUT_SECONDS: float = _env_float("QUEUE_TIMEOUT_SECONDS", 15.0)
+
+# Transparent retries for upstream failures that happen before the first token
+BEDROCK_MAX_RETRIES: int = _env_int("BEDROCK_MAX_RETRIES", 3)
+BEDROCK_RETRY_BASE_DELAY: float = _env_float("BEDROCK_RETRY_BASE_DELAY", 0.5)
+BEDROCK_RETRY_MAX_DELAY: float = _env_float("BEDROCK_RETRY_MAX_DELAY", 8.0)
+
+# Client-side adaptive rate limit; it only engages after Bedrock throttles us
+BEDROCK_RATE_LIMIT_MIN: float = _env_float("BEDROCK_RATE_LIMIT_MIN", 0.5)
+BEDROCK_RATE_LIMIT_MAX: float = _env_float("BEDROCK_RATE_LIMIT_MAX", 50.0)
+
+# botocore HTTP connection pool and transport settings.  Every in-flight
+# stream holds one pooled connection, so the pool defaults to the admission
+# limit; a smaller pool would force a fresh TLS handshake per extra stream.
+BEDROCK_MAX_POOL_CONNECTIONS: int = _env_int(
+    "BEDROCK_MAX_POOL_CONNECTIONS", max(10, MAX_CONCURRENT_STREAMS), minimum=1
+)
+if BEDROCK_MAX_POOL_CONNECTIONS < MAX_CONCURRENT_STREAMS:
+    logger.warning(
+        "BEDROCK_MAX_POOL_CONNECTIONS=%d is below MAX_CONCURRENT_STREAMS=%d; "
+        "connections will be re-established under load.",
+        BEDROCK_MAX_POOL_CONNECTIONS,
+        MAX_CONCURRENT_STREAMS,
+    )
+BEDROCK_CONNECT_TIMEOUT: float = _env_float("BEDROCK_CONNECT_TIMEOUT", 5.0)
+BEDROCK_READ_TIMEOUT: float = _env_float("BEDROCK_READ_TIMEOUT", 60.0)
+BEDROCK_TCP_KEEPALIVE: bool = _env_bool("BEDROCK_TCP_KEEPALIVE", True)
+
+# botocore's own retries.  The app already retries before the first token
+# (BEDROCK_MAX_RETRIES) and must see throttles to tune its rate limiter, so
+# the SDK makes a single attempt unless told otherwise.
+BEDROCK_SDK_RETRY_MODE: str = os.environ.get("BEDROCK_SDK_RETRY_MODE", "standard").strip().lower()
+if BEDROCK_SDK_RETRY_MODE not in ("legacy", "standard", "adaptive"):
+    logger.error(
+        "ERROR: BEDROCK_SDK_RETRY_MODE must be legacy, standard or adaptive, got %r",
+        BEDROCK_SDK_RETRY_MODE,
+    )
+    sys.exit(1)
+BEDROCK_SDK_MAX_ATTEMPTS: int = _env_int("BEDROCK_SDK_MAX_ATTEMPTS", 1, minimum=1)
+
+# When the Bedrock client (and boto3 with it) is built: "startup" warms it up
+# in the background once the server starts, "lazy" waits for the first chat,
+# "import" builds it while app.py is imported.
+BEDROCK_CLIENT_INIT: str = os.environ.get("BEDROCK_CLIENT_INIT", "startup").strip().lower()
+if BEDROCK_CLIENT_INIT not in ("startup", "lazy", "import"):
+    logger.error(
+        "ERROR: BEDROCK_CLIENT_INIT must be startup, lazy or import, got %r",
+        BEDROCK_CLIENT_INIT,
+    )
+    sys.exit(1)
+
+# Send Bedrock calls here instead of bedrock-runtime.<region>.amazonaws.com,
+# e.g. the offline server in benchmarks/mock_bedrock.py
+BEDROCK_ENDPOINT_URL: str = os.environ.get("BEDROCK_ENDPOINT_URL", "").strip()
+
+# Server-side conversation store: "memory" (LRU), "sqlite" or "none"
+CONVERSATION_STORE: str = os.environ.get("CONVERSATION_STORE", "memory").strip().lower()
+if CONVERSATION_STORE not in ("memory", "sqlite", "none"):
+    logger.error(
+        "ERROR: CONVERSATION_STORE must be memory, sqlite or none, got %r",
+        CONVERSATION_STORE,
+    )
+    sys.exit(1)
+CONVERSATION_STORE_MAX: int = _env_int("CONVERSATION_STORE_MAX", 1000, minimum=1)
+CONVERSATION_DB_PATH: str = os.environ.get("CONVERSATION_DB_PATH", "conversations.db")
+
+# Estimated-token budget for the history sent to Bedrock.  0 keeps the
+# classic 100-turn message cap; any positive value prunes by size instead.
+HISTORY_TOKEN_BUDGET: int = _env_int("HISTORY_TOKEN_BUDGET", 0)
+
+# Bedrock prompt caching: mark the stable conversation prefix with cache
+# checkpoints.  Off by default; only some models support it.
+BEDROCK_PROMPT_CACHING: bool = _env_bool("BEDROCK_PROMPT_CACHING", False)
+PROMPT_CACHE_MIN_TOKENS: int = _env_int("PROMPT_CACHE_MIN_TOKENS", 1024)
+
+# Response cache for byte-identical requests, with single-flight coalescing
+RESPONSE_CACHE: bool = _env_bool("RESPONSE_CACHE", False)
+RESPONSE_CACHE_TTL_SECONDS: float = _env_float("RESPONSE_CACHE_TTL_SECONDS", 300.0)
+RESPONSE_CACHE_MAX_ENTRIES: int = _env_int("RESPONSE_CACHE_MAX_ENTRIES", 256, minimum=1)
+RESPONSE_CACHE_MAX_BYTES: int = _env_int("RESPONSE_CACHE_MAX_BYTES", 16 * 1024 * 1024, minimum=1)
+
+# Resumable generations: events buffered per answer, how long an answer keeps
+# generating with nobody connected, and how long a finished one stays resumable
+GENERATION_BUFFER_EVENTS: int = _env_int("GENERATION_BUFFER_EVENTS", 4096, minimum=1)
+GENERATION_ORPHAN_TIMEOUT: float = _env_float("GENERATION_ORPHAN_TIMEOUT", 15.0)
+GENERATION_RETENTION_SECONDS: float = _env_float("GENERATION_RETENTION_SECONDS", 60.0)
+
+# Authorization header values already verified by BasicAuthMiddleware, and
+# how long a verification is trusted before the password hash is checked again
+AUTH_CACHE_SIZE: int = _env_int("AUTH_CACHE_SIZE", 128, minimum=1)
+AUTH_CACHE_TTL_SECONDS: float = _env_float("AUTH_CACHE_TTL_SECONDS", 300.0)
+# Threads that check password hashes; each scrypt check holds 32 MiB
+AUTH_VERIFY_WORKERS: int = _env_int("AUTH_VERIFY_WORKERS", 2, minimum=1)
+
+# Coalesce streamed text deltas into fewer SSE frames: flush after this many
+# bytes or this many milliseconds, whichever comes first.  0 ms disables it.
+SSE_COALESCE_BYTES: int = _env_int("SSE_COALESCE_BYTES", 2048, minimum=1)
+SSE_COALESCE_WINDOW_MS: float = _env_float("SSE_COALESCE_WINDOW_MS", 20.0)
+
+# Per-identity quotas (the Basic Auth user, else the client IP); 0 disables a
+# limit.  QUOTA_DB_PATH keeps today's usage across restarts.
+QUOTA_MAX_CONCURRENT_STREAMS: int = _env_int("QUOTA_MAX_CONCURRENT_STREAMS", 0)
+QUOTA_REQUESTS_PER_MINUTE: int = _env_int("QUOTA_REQUESTS_PER_MINUTE", 0)
+QUOTA_OUTPUT_TOKENS_PER_DAY: int = _env_int("QUOTA_OUTPUT_TOKENS_PER_DAY", 0)
+QUOTA_DB_PATH: str = os.environ.get("QUOTA_DB_PATH", "").strip()
+
+# Basic Auth users allowed to use the /admin/... endpoints
+ADMIN_USERS: frozenset = frozenset(
+    user.strip() for user in os.environ.get("ADMIN_USERS", "").split(",") if user.strip()
+)
+# Without Basic Auth the /admin/... endpoints are closed, unless this opts in
+# to requests from this host.  A tunnel (ngrok, cloudflared) delivers remote
+# requests from 127.0.0.1, so leave it off behind one.
+ADMIN_ALLOW_LOCALHOST: bool = _env_bool("ADMIN_ALLOW_LOCALHOST", False)
+
+# Logging after startup: "text" or "json" lines, written by a background thread
+# from a bounded queue.  User message bodies are logged truncated to
+# LOG_MESSAGE_MAX_CHARS, as a hash, in "full" or not at all ("off"), and only
+# LOG_SAMPLE_RATE of the per-request INFO lines are kept.
+LOG_FORMAT: str = os.environ.get("LOG_FORMAT", "text").strip().lower()
+if LOG_FORMAT not in ("text", "json"):
+    logger.error("ERROR: LOG_FORMAT must be text or json, got %r", LOG_FORMAT)
+    sys.exit(1)
+LOG_QUEUE_SIZE: int = _env_int("LOG_QUEUE_SIZE", 10000, minimum=1)
+LOG_MESSAGE_BODIES: str = os.environ.get("LOG_MESSAGE_BODIES", "truncate").strip().lower()
+if LOG_MESSAGE_BODIES not in ("truncate", "hash", "full", "off"):
+    logger.error(
+        "ERROR: LOG_MESSAGE_BODIES must be truncate, hash, full or off, got %r",
+        LOG_MESSAGE_BODIES,
+    )
+    sys.exit(1)
+LOG_MESSAGE_MAX_CHARS: int = _env_int("LOG_MESSAGE_MAX_CHARS", 200)
+LOG_SAMPLE_RATE: float = _env_float("LOG_SAMPLE_RATE", 1.0)
+if LOG_SAMPLE_RATE > 1.0:
+    logger.error("ERROR: LOG_SAMPLE_RATE must be between 0 and 1, got %s", LOG_SAMPLE_RATE)
+    sys.exit(1)
+
+# Tracing spans for /chat: "off", "console" (one log line per span) or
+# "otlp-file" (OTLP/JSON lines appended to TRACING_FILE)
+TRACING: str = os.environ.get("TRACING", "off").strip().lower()
+if TRACING not in ("off", "console", "otlp-file"):
+    logger.error("ERROR: TRACING must be off, console or otlp-file, got %r", TRACING)
+    sys.exit(1)
+TRACING_FILE: str = os.environ.get("TRACING_FILE", "traces.jsonl").strip()
+
+# ---------------------------------------------------------------------------
+# Metrics registry — rendered in Prometheus text format at GET /metrics
+# ---------------------------------------------------------------------------
+
+
+class Counter:
+    """Monotonic counter with optional labels.
+
+    Only updated from the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        if not self._values:
+            lines.append(f"{self.name} 0")
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._read = read
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self._read():g}",
+        ]
+
+
+class Histogram:
+    """Cumulative histogram over fixed bucket upper bounds (plus +Inf).
+
+    Only updated from the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum:g}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+# Bucket bounds in seconds, from sub-second first tokens to long answers
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...]) -> str:
+    if not key:
+        return ""
+    parts = []
+    for label, value in key:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{label}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class MetricsRegistry:
+    """Named collection of metrics, rendered in registration order."""
+
+    def __init__(self) -> None:
+        self._metrics: "OrderedDict[str, object]" = OrderedDict()
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self._metrics[name] = metric
+        return metric
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+        metric = Gauge(name, help_text, read)
+        self._metrics[name] = metric
+        return metric
+
+    def histogram(
+        self, name: str, help_text: str, buckets: Tuple[float, ...] = _LATENCY_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())  # type: ignore[attr-defined]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# ---------------------------------------------------------------------------
+# Non-blocking logging
+# ---------------------------------------------------------------------------
+# Startup validation above logs straight to stdout.  From here on, records are
+# put on a bounded queue and written by a QueueListener thread, so a large
+# message or a slow stdout reader never stalls the event loop.
+
+# LogRecord attributes; anything else on a record came from ``extra=``
+# (uvicorn's color_message is the message again with terminal colours)
+_LOG_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "color_message",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra=`` fields become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _LOG_RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DrainingQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() waits for room in a full queue, then drains it."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self) -> None:
+        """Write out everything queued and stop the writer thread."""
+        if self.listener is not None:
+            atexit.unregister(self.listener.stop)
+            self.listener.stop()
+            self.listener = None
+
+
+def configure_async_logging(
+    target: logging.Logger, formatter: logging.Formatter, queue_size: int
+) -> Optional[NonBlockingQueueHandler]:
+    """Move ``target``'s plain stream handlers behind a bounded queue.
+
+    The handlers (normally the stdout one from ``logging.basicConfig``) are
+    driven by a QueueListener thread and ``target`` keeps only a
+    :class:`NonBlockingQueueHandler`.  Handlers a host installed, such as a
+    test runner's, are left alone.  Calling it again replaces the previous
+    queue.  Returns None when there was nothing to move.
+    """
+    writers: List[logging.Handler] = []
+    for handler in list(target.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            if handler.listener is not None:
+                writers.extend(handler.listener.handlers)
+            handler.stop()
+        elif type(handler) is logging.StreamHandler:
+            writers.append(handler)
+        else:
+            continue
+        target.removeHandler(handler)
+    if not writers:
+        return None
+
+    for writer in writers:
+        writer.setFormatter(formatter)
+    queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    queue_handler.listener = _DrainingQueueListener(
+        queue_handler.queue, *writers, respect_handler_level=True
+    )
+    queue_handler.listener.start()
+    atexit.register(queue_handler.listener.stop)
+    target.addHandler(queue_handler)
+    return queue_handler
+
+
+def loggable_body(text: str) -> str:
+    """Render a user message for the logs according to LOG_MESSAGE_BODIES."""
+    if LOG_MESSAGE_BODIES == "full":
+        return text
+    if LOG_MESSAGE_BODIES == "off":
+        return f"<{len(text)} chars>"
+    if LOG_MESSAGE_BODIES == "hash":
+        digest = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+        return f"sha256:{digest[:16]} ({len(text)} chars)"
+    if len(text) <= LOG_MESSAGE_MAX_CHARS:
+        return text
+    return f"{text[:LOG_MESSAGE_MAX_CHARS]}... ({len(text)} chars)"
+
+
+def log_sampled() -> bool:
+    """Whether to log this occurrence of a per-request INFO event."""
+    return LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+
+
+_log_queue_handler = configure_async_logging(
+    logging.getLogger(),
+    JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(asctime)s %(levelname)s %(message)s"),
+    LOG_QUEUE_SIZE,
+)
+metrics.gauge(
+    "log_records_dropped",
+    "Log records dropped because the logging queue was full.",
+    lambda: _log_queue_handler.dropped if _log_queue_handler is not None else 0,
+)
+
+# ---------------------------------------------------------------------------
+# Tracing
+# ---------------------------------------------------------------------------
+# Spans follow OpenTelemetry's data model so the OTLP/JSON file loads into
+# standard tools (e.g. the Collector's otlpjsonfile receiver), but nothing
+# beyond the standard library is needed.  With TRACING=off, start_span hands
+# out one shared no-op span and TracingMiddleware is not installed.
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """One timed operation.  ``end()`` hands it to the tracer's exporter.
+
+    Used as a context manager it also becomes the parent of spans started
+    inside the block (including tasks created there) and records an
+    exception escaping the block as its error.
+    """
+
+    __slots__ = (
+        "_tracer", "_token", "name", "trace_id", "span_id", "parent_id",
+        "kind", "attributes", "start_ns", "end_ns", "error",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: str,
+        kind: int,
+        start_ns: int,
+    ) -> None:
+        self._tracer = tracer
+        self._token: Optional[contextvars.Token] = None
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, object] = {}
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: object) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, description: str) -> None:
+        self.error = description
+
+    def end(self, end_ns: int = 0) -> None:
+        """Finish the span; later calls do nothing."""
+        if self.end_ns:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        self._tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self._token)
+        if exc is not None and self.error is None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+
+
+class _NoopSpan:
+    """Stands in for every span while tracing is off."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: object) -> None:
+        pass
+
+    def set_error(self, description: str) -> None:
+        pass
+
+    def end(self, end_ns: int = 0) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Creates spans and passes finished ones to ``export`` (None disables tracing)."""
+
+    def __init__(self, export: Optional[Callable[[Span], None]]) -> None:
+        self.enabled = export is not None
+        self._export = export
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        start_ns: int = 0,
+    ):
+        """Start a span under ``parent``, else under the current span, else a new trace."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        if parent is None:
+            parent = _current_span.get()
+        if parent is None:
+            return Span(self, name, secrets.token_hex(16), "", kind, start_ns)
+        return Span(self, name, parent.trace_id, parent.span_id, kind, start_ns)
+
+    def export(self, span: Span) -> None:
+        self._export(span)
+
+
+def current_span():
+    """The innermost active span, or the no-op span."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def _otlp_value(value: object) -> Dict[str, object]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_json_line(span: Span) -> str:
+    """One OTLP/JSON ``ExportTraceServiceRequest`` holding ``span``."""
+    otlp_span: Dict[str, object] = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {},
+    }
+    if span.parent_id:
+        otlp_span["parentSpanId"] = span.parent_id
+    return json.dumps({"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": "bedrock-chat-app"}},
+        ]},
+        "scopeSpans": [{"scope": {"name": "bedrock-chat-app"}, "spans": [otlp_span]}],
+    }]})
+
+
+def _console_exporter(span: Span) -> None:
+    logger.info(
+        "span %s %.1fms%s %s",
+        span.name,
+        (span.end_ns - span.start_ns) / 1e6,
+        f" error={span.error!r}" if span.error else "",
+        json.dumps(span.attributes, default=str),
+        extra={"trace_id": span.trace_id, "span_id": span.span_id, "parent_span_id": span.parent_id},
+    )
+
+
+def _otlp_file_exporter(path: str) -> Callable[[Span], None]:
+    """Append spans to ``path`` as OTLP/JSON lines, written through a logging queue."""
+    trace_log = logging.getLogger("bedrock_chat_app.traces")
+    trace_log.propagate = False
+    trace_log.setLevel(logging.INFO)
+    for handler in list(trace_log.handlers):  # left by an earlier import
+        trace_log.removeHandler(handler)
+        if isinstance(handler, NonBlockingQueueHandler):
+            handler.stop()
+    trace_log.addHandler(logging.StreamHandler(open(path, "a", encoding="utf-8")))
+    configure_async_logging(trace_log, logging.Formatter("%(message)s"), LOG_QUEUE_SIZE)
+    return lambda span: trace_log.info("%s", otlp_json_line(span))
+
+
+if TRACING == "console":
+    tracer = Tracer(_console_exporter)
+elif TRACING == "otlp-file":
+    tracer = Tracer(_otlp_file_exporter(TRACING_FILE))
 else:
-    auth_username = os.environ.get("AUTH_USERNAME", "")
-    auth_password = os.environ.get("AUTH_PASSWORD", "")
+    tracer = Tracer(None)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware that opens the root span of every /chat request.
+
+    The span stays current while the route runs, so request validation, the
+    route's own stages and the generation task it starts nest under it.  It
+    ends when the response body is complete.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/chat"):
+            await self.app(scope, receive, send)
+            return
+
+        if path.startswith("/chat/generations/"):
+            path = "/chat/generations/{generation_id}"
+        span = tracer.start_span(f"{scope['method']} {path}", kind=SPAN_KIND_SERVER)
+        span.set_attribute("http.request.method", scope["method"])
+        span.set_attribute("http.route", path)
+
+        async def _send(message) -> None:
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.set_error(f"HTTP {message['status']}")
+            await send(message)
+
+        with span:
+            await self.app(scope, receive, _send)
 
 # ---------------------------------------------------------------------------
 # BedrockClient — module-level singleton (Requirement 6.1, 6.2)
 # ---------------------------------------------------------------------------
+# Importing boto3 and loading the bedrock-runtime service model take a few
+# hundred milliseconds, so the client is built on first use (or warmed up at
+# startup, see BEDROCK_CLIENT_INIT) rather than while app.py is imported.
+
+
+@runtime_checkable
+class BedrockBackend(Protocol):
+    """What answers chats; a boto3 bedrock-runtime client fits as is.
+
+    Any object with a matching ``converse_stream`` will do, no subclassing
+    needed.  It is called from a worker thread with Bedrock's keyword
+    arguments and returns ``{"stream": <iterable of event dicts>}``.
+    Service errors are raised as botocore ``ClientError`` with Bedrock's
+    error codes, before or during iteration.  See benchmarks/mock_bedrock.py
+    for an offline implementation.
+    """
 
-from botocore.config import Config as BotoConfig  # noqa: E402
+    def converse_stream(self, **kwargs) -> Dict:
+        ...
 
-if aws_access_key and aws_secret_key:
-    # Use standard IAM credentials (access key + secret key)
-    logger.info("Using IAM credentials for Bedrock authentication")
-    aws_session_token = os.environ.get("AWS_SESSION_TOKEN", "").strip() or None
-    _session = boto3.Session(
-        aws_access_key_id=aws_access_key,
-        aws_secret_access_key=aws_secret_key,
-        aws_session_token=aws_session_token,
-        region_name=aws_region,
+
+def _bearer_token_handler(token: str) -> Callable[..., None]:
+    """A request-created handler that sends *token* as the ABSK bearer token.
+
+    Registered per client, so streams and retries on a client replaced by a
+    reload keep the token that client was built with.
+    """
+
+    def _add_bearer_token(request, **kwargs) -> None:
+        request.headers["Authorization"] = f"Bearer {token}"
+
+    return _add_bearer_token
+
+
+def build_bedrock_client(settings: RuntimeSettings):
+    """Create a bedrock-runtime client for *settings*' credentials and region."""
+    import boto3
+    from botocore import UNSIGNED
+    from botocore.config import Config as BotoConfig
+
+    # Shared transport settings for both authentication paths
+    boto_config = BotoConfig(
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        tcp_keepalive=BEDROCK_TCP_KEEPALIVE,
+        retries={
+            "mode": BEDROCK_SDK_RETRY_MODE,
+            "total_max_attempts": BEDROCK_SDK_MAX_ATTEMPTS,
+        },
     )
-    bedrock_client = _session.client("bedrock-runtime")
-else:
+
+    if settings.aws_access_key and settings.aws_secret_key:
+        # Use standard IAM credentials (access key + secret key)
+        logger.info("Using IAM credentials for Bedrock authentication")
+        return boto3.client(
+            "bedrock-runtime",
+            aws_access_key_id=settings.aws_access_key,
+            aws_secret_access_key=settings.aws_secret_key,
+            aws_session_token=settings.aws_session_token,
+            region_name=settings.aws_region,
+            endpoint_url=BEDROCK_ENDPOINT_URL or None,
+            config=boto_config,
+        )
+
     # Fallback: Use ABSK bearer token authentication
     logger.info("Using ABSK bearer token for Bedrock authentication")
-    os.environ["AWS_BEARER_TOKEN_BEDROCK"] = aws_bearer_token
-
-    _session = boto3.Session(region_name=aws_region)
-    bedrock_client = _session.client(
+    client = boto3.client(
         "bedrock-runtime",
-        endpoint_url=f"https://bedrock-runtime.{aws_region}.amazonaws.com",
-        config=BotoConfig(
-            signature_version="bearer",
-            request_min_compression_size_bytes=1024,
+        region_name=settings.aws_region,
+        endpoint_url=BEDROCK_ENDPOINT_URL or f"https://bedrock-runtime.{settings.aws_region}.amazonaws.com",
+        config=boto_config.merge(
+            BotoConfig(
+                # botocore signs nothing; the handler adds the Authorization header
+                signature_version=UNSIGNED,
+                request_min_compression_size_bytes=1024,
+            )
         ),
     )
+    client.meta.events.register(
+        "request-created.bedrock-runtime", _bearer_token_handler(settings.aws_bearer_token)
+    )
+    return client
 
-    # Inject the bearer token into the Authorization header
-    import botocore.auth  # noqa: E402
-
-    def _patched_add_auth(self, request, **kwargs):
-        """Inject the ABSK bearer token into the Authorization header."""
-        request.headers["Authorization"] = f"Bearer {aws_bearer_token}"
-        return
 
-    botocore.auth.BearerAuth.add_auth = _patched_add_auth
+# None until get_bedrock_client() first runs; create_app(backend=...) and
+# tests may assign any BedrockBackend.  _bedrock_client_lock guards
+# bedrock_client and runtime_settings and is only held briefly;
+# _bedrock_build_lock lets one thread at a time build a client.
+bedrock_client: Optional[BedrockBackend] = None
+_bedrock_client_lock = threading.Lock()
+_bedrock_build_lock = threading.Lock()
 
 
-async def stream_response(messages: List[Dict]) -> AsyncGenerator[str, None]:
-    """Call Bedrock converse_stream and yield SSE-formatted strings.
+def get_bedrock_client() -> BedrockBackend:
+    """Return the Bedrock client, building it on first use.
 
-    Yields:
-        ``data: <token>\\n\\n`` for each content delta token.
-        ``event: done\\ndata: \\n\\n`` when the stream ends normally.
-        ``event: error\\ndata: <message>\\n\\n`` on any Bedrock error.
+    Blocks while boto3 is imported, so event-loop code should call it
+    through an executor unless ``bedrock_client`` is already set.  A client
+    is only kept if the settings it was built from are still current; if a
+    reload or create_app() changed them meanwhile, theirs wins.
     """
-    try:
-        response = bedrock_client.converse_stream(
-            modelId=bedrock_model_id,
-            messages=messages,
-            inferenceConfig={"maxTokens": 8192},
-        )
+    global bedrock_client
+    with _bedrock_build_lock:
+        while True:
+            with _bedrock_client_lock:
+                if bedrock_client is not None:
+                    return bedrock_client
+                settings = runtime_settings
+            started = time.perf_counter()
+            client = build_bedrock_client(settings)
+            with _bedrock_client_lock:
+                if bedrock_client is None and runtime_settings == settings:
+                    bedrock_client = client
+                    logger.info("Bedrock client ready in %.0f ms", (time.perf_counter() - started) * 1000)
 
-        stream = response.get("stream")
-        if stream is None:
-            yield "event: error\ndata: Bedrock returned no stream.\n\n"
-            return
 
-        for event in stream:
-            # contentBlockDelta carries incremental text tokens
-            if "contentBlockDelta" in event:
-                delta = event["contentBlockDelta"].get("delta", {})
-                text = delta.get("text", "")
-                if text:
-                    yield f"data: {text}\n\n"
-
-    except ClientError as exc:
-        error_code = exc.response["Error"]["Code"]
-
-        if error_code == "ThrottlingException":
-            yield (
-                "event: error\n"
-                "data: Request throttled by AWS Bedrock. Please try again.\n\n"
-            )
-        elif error_code in ("UnauthorizedException", "AccessDeniedException"):
-            yield (
-                "event: error\n"
-                "data: Invalid or unauthorized API key. "
-                "Check AWS_BEARER_TOKEN_BEDROCK.\n\n"
-            )
-        else:
-            reason = exc.response["Error"].get("Message", str(exc))
-            yield f"event: error\ndata: Bedrock service error: {reason}\n\n"
-        return
+if BEDROCK_CLIENT_INIT == "import":
+    get_bedrock_client()
 
-    # Signal stream completion
-    yield "event: done\ndata: \n\n"
 
 # ---------------------------------------------------------------------------
-# BasicAuthMiddleware (Requirements 7.1, 7.3, 7.4)
+# Off-loop upstream streaming
 # ---------------------------------------------------------------------------
+# converse_stream() and iteration of the returned botocore EventStream both
+# block on socket reads.  They run on a bounded worker pool so a slow upstream
+# read never stalls the event loop (and with it every other request).
+# Defaults to the admission limit so every admitted stream gets a worker.
+BEDROCK_STREAM_WORKERS: int = _env_int(
+    "BEDROCK_STREAM_WORKERS", MAX_CONCURRENT_STREAMS, minimum=1
+)
+if BEDROCK_STREAM_WORKERS < MAX_CONCURRENT_STREAMS:
+    logger.warning(
+        "BEDROCK_STREAM_WORKERS=%d is below MAX_CONCURRENT_STREAMS=%d; "
+        "admitted streams may wait for a worker.",
+        BEDROCK_STREAM_WORKERS,
+        MAX_CONCURRENT_STREAMS,
+    )
 
-_WWW_AUTH_HEADER = 'Basic realm="Bedrock Chat"'
+_bedrock_executor = ThreadPoolExecutor(
+    max_workers=BEDROCK_STREAM_WORKERS,
+    thread_name_prefix="bedrock-stream",
+)
 
+# Queue markers passed from the worker thread to the event loop
+_STREAM_END = object()
+_NO_STREAM = object()
 
-class BasicAuthMiddleware(BaseHTTPMiddleware):
-    """HTTP Basic Authentication middleware.
 
-    Only added to the app when AUTH_ENABLED=true.  Parses the
-    ``Authorization: Basic <b64>`` header and returns HTTP 401 with a
-    ``WWW-Authenticate`` challenge if the header is absent, malformed, or
-    the decoded credentials do not match (case-sensitive) the configured
-    AUTH_USERNAME / AUTH_PASSWORD.
-    """
+async def _converse_stream_events(client, **kwargs) -> AsyncGenerator[Optional[dict], None]:
+    """Yield *client*'s ``converse_stream`` events without blocking the event loop.
+
+    The blocking call and the EventStream iteration run on a worker from
+    ``_bedrock_executor``; events are handed back through an ``asyncio.Queue``.
+    Exceptions raised on the worker are re-raised here, in the caller's task.
+    If Bedrock returns no stream at all, a single ``None`` is yielded.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def _put(item) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # Event loop already closed — nobody is listening any more
+            cancelled.set()
+
+    def _worker() -> None:
+        stream = None
+        try:
+            response = client.converse_stream(**kwargs)
+            stream = response.get("stream")
+            if stream is None:
+                _put(_NO_STREAM)
+                return
+            for event in stream:
+                if cancelled.is_set():
+                    break
+                _put(event)
+        except BaseException as exc:  # noqa: BLE001 — re-raised on the loop
+            _put(exc)
+        finally:
+            if cancelled.is_set() and hasattr(stream, "close"):
+                stream.close()
+            _put(_STREAM_END)
+
+    loop.run_in_executor(_bedrock_executor, _worker)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if item is _NO_STREAM:
+                yield None
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+    finally:
+        # Tell the worker to stop reading if the consumer went away early
+        cancelled.set()
+
+
+# ---------------------------------------------------------------------------
+# Adaptive rate limiting and retries around converse_stream
+# ---------------------------------------------------------------------------
+
+# Bedrock error codes worth retrying before any token has been sent
+_RETRYABLE_ERROR_CODES = frozenset({
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "InternalServerException",
+})
+
+_retries_total = metrics.counter(
+    "bedrock_retries_total", "Upstream calls retried before the first token, by error code."
+)
+_retry_wait_seconds_total = metrics.counter(
+    "bedrock_retry_wait_seconds_total", "Seconds spent in retry backoff."
+)
+_throttles_total = metrics.counter(
+    "bedrock_throttles_total", "ThrottlingException responses received from Bedrock."
+)
+_rate_limit_wait_seconds_total = metrics.counter(
+    "bedrock_rate_limit_wait_seconds_total", "Seconds spent waiting on the client-side rate limiter."
+)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket that learns Bedrock's effective request rate.
+
+    The bucket is disabled until the first throttle.  Each throttle cuts the
+    fill rate to ``beta`` times the rate we were actually sending at; each
+    successful call raises it additively.  Once the rate climbs back to
+    ``max_rate`` the limiter disables itself again.  Waiters reserve tokens
+    up front (the balance may go negative), so they are served in FIFO order.
+
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(
+        self,
+        min_rate: float,
+        max_rate: float,
+        beta: float = 0.7,
+        increase: float = 0.1,
+        window_seconds: float = 10.0,
+    ) -> None:
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.beta = beta
+        self.increase = increase
+        self.window_seconds = window_seconds
+        self.enabled = False
+        self.fill_rate = max_rate
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._sends: Deque[float] = deque()
+
+    def current_rate(self) -> float:
+        """Effective fill rate in requests/second; 0 while the limiter is idle."""
+        return self.fill_rate if self.enabled else 0.0
+
+    async def acquire(self) -> float:
+        """Reserve one send; sleep until it is due.  Returns seconds waited."""
+        now = time.monotonic()
+        self._record_send(now)
+        if not self.enabled:
+            return 0.0
+
+        self._refill(now)
+        self._tokens -= 1.0
+        if self._tokens >= 0:
+            return 0.0
+        wait = -self._tokens / self.fill_rate
+        _rate_limit_wait_seconds_total.inc(wait)
+        await asyncio.sleep(wait)
+        return wait
+
+    def on_throttle(self) -> None:
+        measured = self._measured_rate()
+        base = min(self.fill_rate, measured) if self.enabled else measured
+        self.fill_rate = max(self.min_rate, base * self.beta)
+        self._refill(time.monotonic())
+        self._tokens = min(self._tokens, 0.0)
+        self.enabled = True
+        logger.info("Bedrock throttled; client rate limit set to %.2f req/s.", self.fill_rate)
+
+    def on_success(self) -> None:
+        if not self.enabled:
+            return
+        self._refill(time.monotonic())
+        self.fill_rate = min(self.max_rate, self.fill_rate + self.increase)
+        if self.fill_rate >= self.max_rate:
+            self.enabled = False
+            self._tokens = 1.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        capacity = max(1.0, self.fill_rate)
+        self._tokens = min(capacity, self._tokens + elapsed * self.fill_rate)
+
+    def _record_send(self, now: float) -> None:
+        self._sends.append(now)
+        cutoff = now - self.window_seconds
+        while self._sends and self._sends[0] < cutoff:
+            self._sends.popleft()
+
+    def _measured_rate(self) -> float:
+        if len(self._sends) < 2:
+            return self.min_rate
+        span = max(self._sends[-1] - self._sends[0], 1.0)
+        return len(self._sends) / span
+
+
+rate_limiter = AdaptiveRateLimiter(
+    min_rate=BEDROCK_RATE_LIMIT_MIN / WORKERS,
+    max_rate=BEDROCK_RATE_LIMIT_MAX / WORKERS,
+)
+metrics.gauge(
+    "bedrock_rate_limit_rps",
+    "Current client-side request rate limit (0 when not limiting).",
+    rate_limiter.current_rate,
+)
+
+
+def _error_code(exc: ClientError) -> str:
+    """Return the Bedrock error code, normalised to the exception-name form.
+
+    Errors raised mid-stream arrive as event names such as
+    ``throttlingException``; the initial call reports ``ThrottlingException``.
+    """
+    code = exc.response.get("Error", {}).get("Code", "") or ""
+    return code[:1].upper() + code[1:]
+
+
+def _next_backoff(previous: float) -> float:
+    """Decorrelated jitter: uniform in [base, 3 * previous], capped."""
+    upper = max(BEDROCK_RETRY_BASE_DELAY, previous * 3)
+    return min(BEDROCK_RETRY_MAX_DELAY, random.uniform(BEDROCK_RETRY_BASE_DELAY, upper))
+
+
+# ---------------------------------------------------------------------------
+# Prompt caching and token usage
+# ---------------------------------------------------------------------------
+
+_CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+_input_tokens_total = metrics.counter(
+    "bedrock_input_tokens_total", "Uncached input tokens reported by Bedrock."
+)
+_output_tokens_total = metrics.counter(
+    "bedrock_output_tokens_total", "Output tokens reported by Bedrock."
+)
+_cache_read_tokens_total = metrics.counter(
+    "bedrock_cache_read_input_tokens_total", "Input tokens served from the prompt cache."
+)
+_cache_write_tokens_total = metrics.counter(
+    "bedrock_cache_write_input_tokens_total", "Input tokens written to the prompt cache."
+)
+
+
+def add_cache_points(messages: List[Dict]) -> List[Dict]:
+    """Return a copy of ``messages`` with prompt-cache checkpoints added.
+
+    A checkpoint goes after the newest user message, so the next turn can
+    read everything up to here from the cache, and after the previous user
+    message, which is where the last turn wrote its checkpoint.  Prefixes
+    shorter than PROMPT_CACHE_MIN_TOKENS are not worth caching and are left
+    alone.  The input list and its dicts are never modified.
+    """
+    user_indexes = [i for i, m in enumerate(messages) if m["role"] == "user"][-2:]
+    marked = list(messages)
+    prefix_tokens = 0
+    next_index = 0
+    for index in user_indexes:
+        prefix_tokens += sum(
+            estimate_message_tokens(m) for m in messages[next_index:index + 1]
+        )
+        next_index = index + 1
+        if prefix_tokens >= PROMPT_CACHE_MIN_TOKENS:
+            message = messages[index]
+            marked[index] = {**message, "content": list(message["content"]) + [_CACHE_POINT]}
+    return marked
+
+
+def _record_usage(usage: Dict) -> None:
+    """Count the token usage from a converse_stream ``metadata`` event."""
+    input_tokens = usage.get("inputTokens", 0)
+    output_tokens = usage.get("outputTokens", 0)
+    cache_read = usage.get("cacheReadInputTokens", 0)
+    cache_write = usage.get("cacheWriteInputTokens", 0)
+    _input_tokens_total.inc(input_tokens)
+    _output_tokens_total.inc(output_tokens)
+    _cache_read_tokens_total.inc(cache_read)
+    _cache_write_tokens_total.inc(cache_write)
+    if log_sampled():
+        logger.info(
+            "Bedrock usage: input=%d output=%d cache_read=%d cache_write=%d",
+            input_tokens,
+            output_tokens,
+            cache_read,
+            cache_write,
+        )
+
+
+class StreamEvent(NamedTuple):
+    """One streamed outcome: ``kind`` is "text", "error", "done" or "pruned".
+
+    ``id`` is set once the event is published by a SharedGeneration.
+    """
+
+    kind: str
+    data: str = ""
+    id: Optional[int] = None
+
+
+# Any of these ends an SSE line, so none may appear inside a data: field
+_SSE_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+def format_sse(event: StreamEvent) -> str:
+    """Render a StreamEvent as an SSE frame.
+
+    A payload containing line breaks is sent as one ``data:`` line per line;
+    SSE clients join them back together with "\\n".  CR and CRLF line
+    endings therefore arrive as LF.
+    """
+    frame = f"id: {event.id}\n" if event.id is not None else ""
+    if event.kind != "text":
+        frame += f"event: {event.kind}\n"
+    data = event.data
+    if "\n" not in data and "\r" not in data:
+        return frame + f"data: {data}\n\n"
+    for line in _SSE_LINE_BREAK.split(data):
+        frame += f"data: {line}\n"
+    return frame + "\n"
+
+
+# Inference parameters sent with every converse_stream call
+INFERENCE_CONFIG: Dict = {"maxTokens": 8192}
+
+# Per-stream latency and outcome metrics, observed by bedrock_events
+_ttft_seconds = metrics.histogram(
+    "bedrock_time_to_first_token_seconds",
+    "Seconds from sending converse_stream to the first text delta.",
+)
+_stream_duration_seconds = metrics.histogram(
+    "bedrock_stream_duration_seconds",
+    "Seconds from sending converse_stream to the end of a completed stream.",
+)
+_output_tokens_per_second = metrics.histogram(
+    "bedrock_output_tokens_per_second",
+    "Output tokens per second after the first token, per completed stream.",
+    buckets=(5.0, 10.0, 20.0, 40.0, 60.0, 80.0, 100.0, 150.0, 200.0, 400.0),
+)
+_bedrock_latency_seconds = metrics.histogram(
+    "bedrock_server_latency_seconds",
+    "Server-side latency Bedrock reports in the stream metadata.",
+)
+_stop_reasons_total = metrics.counter(
+    "bedrock_stop_reasons_total", "Completed streams by messageStop stop reason."
+)
+_bedrock_errors_total = metrics.counter(
+    "bedrock_errors_total", "Streams that ended in an error sent to the client, by error code."
+)
+
+
+async def bedrock_events(
+    messages: List[Dict],
+    on_usage: Optional[Callable[[Dict], None]] = None,
+) -> AsyncGenerator[StreamEvent, None]:
+    """Call Bedrock converse_stream and yield StreamEvents.
+
+    With BEDROCK_PROMPT_CACHING on, cache checkpoints are added to the
+    request (see add_cache_points).  Token usage from the stream's
+    ``metadata`` event, including cache reads/writes, is logged and counted,
+    then passed to *on_usage* if given.
+
+    Retryable failures (throttling, transient service errors) that happen
+    before the first token are retried with decorrelated-jitter backoff, up
+    to ``BEDROCK_MAX_RETRIES`` times, so the user sees a short delay rather
+    than an error.  Every call first passes through ``rate_limiter``.
+
+    Each attempt is traced as a ``bedrock.converse_stream`` span with
+    ``bedrock.handshake`` (until the first stream event) and
+    ``bedrock.stream`` children, carrying time to first token, stop reason
+    and token counts.
+
+    The client and model are fixed when the stream starts, so a
+    configuration reload only affects answers started after it.
+
+    Yields:
+        ``StreamEvent("text", token)`` for each content delta token.
+        ``StreamEvent("done")`` when the stream ends normally.
+        ``StreamEvent("error", message)`` on any Bedrock error.
+    """
+    if BEDROCK_PROMPT_CACHING:
+        messages = add_cache_points(messages)
+
+    client, model_id = bedrock_client, bedrock_model_id
+    if client is None:
+        client = await asyncio.get_running_loop().run_in_executor(None, get_bedrock_client)
+    attempt = 0
+    backoff = BEDROCK_RETRY_BASE_DELAY
+    while True:
+        await rate_limiter.acquire()
+        tokens_sent = False
+        started = time.monotonic()
+        first_token_at = 0.0
+        output_tokens = 0
+        span = tracer.start_span("bedrock.converse_stream", kind=SPAN_KIND_CLIENT)
+        span.set_attribute("gen_ai.system", "aws.bedrock")
+        span.set_attribute("gen_ai.request.model", model_id)
+        span.set_attribute("bedrock.attempt", attempt)
+        phase = tracer.start_span("bedrock.handshake", parent=span)
+        handshaking = True
+        try:
+            async for event in _converse_stream_events(
+                client,
+                modelId=model_id,
+                messages=messages,
+                inferenceConfig=INFERENCE_CONFIG,
+            ):
+                if handshaking:
+                    handshaking = False
+                    phase.end()
+                    phase = tracer.start_span("bedrock.stream", parent=span)
+
+                if event is None:
+                    _bedrock_errors_total.inc(code="NoStream")
+                    span.set_error("NoStream")
+                    yield StreamEvent("error", "Bedrock returned no stream.")
+                    return
+
+                # contentBlockDelta carries incremental text tokens
+                if "contentBlockDelta" in event:
+                    delta = event["contentBlockDelta"].get("delta", {})
+                    text = delta.get("text", "")
+                    if text:
+                        if not tokens_sent:
+                            first_token_at = time.monotonic()
+                            _ttft_seconds.observe(first_token_at - started)
+                            span.set_attribute(
+                                "bedrock.time_to_first_token_ms",
+                                round((first_token_at - started) * 1000, 1),
+                            )
+                        tokens_sent = True
+                        yield StreamEvent("text", text)
+                elif "messageStop" in event:
+                    stop_reason = event["messageStop"].get("stopReason", "unknown")
+                    _stop_reasons_total.inc(reason=stop_reason)
+                    span.set_attribute("gen_ai.response.finish_reason", stop_reason)
+                elif "metadata" in event:
+                    usage = event["metadata"].get("usage", {})
+                    output_tokens = usage.get("outputTokens", 0)
+                    span.set_attribute("gen_ai.usage.input_tokens", usage.get("inputTokens", 0))
+                    span.set_attribute("gen_ai.usage.output_tokens", output_tokens)
+                    latency_ms = event["metadata"].get("metrics", {}).get("latencyMs")
+                    if latency_ms is not None:
+                        _bedrock_latency_seconds.observe(latency_ms / 1000)
+                    _record_usage(usage)
+                    if on_usage is not None:
+                        on_usage(usage)
+
+            rate_limiter.on_success()
+            finished = time.monotonic()
+            _stream_duration_seconds.observe(finished - started)
+            if output_tokens and tokens_sent and finished > first_token_at:
+                _output_tokens_per_second.observe(output_tokens / (finished - first_token_at))
+            break
+
+        except ClientError as exc:
+            error_code = _error_code(exc)
+            span.set_error(error_code)
+            phase.end()
+            span.end()
+            if error_code == "ThrottlingException":
+                _throttles_total.inc()
+                rate_limiter.on_throttle()
+
+            if (
+                not tokens_sent
+                and error_code in _RETRYABLE_ERROR_CODES
+                and attempt < BEDROCK_MAX_RETRIES
+            ):
+                attempt += 1
+                backoff = _next_backoff(backoff)
+                _retries_total.inc(code=error_code)
+                _retry_wait_seconds_total.inc(backoff)
+                logger.info(
+                    "Bedrock returned %s; retrying in %.2fs (attempt %d/%d).",
+                    error_code,
+                    backoff,
+                    attempt,
+                    BEDROCK_MAX_RETRIES,
+                )
+                await asyncio.sleep(backoff)
+                continue
+
+            _bedrock_errors_total.inc(code=error_code)
+            if error_code == "ThrottlingException":
+                yield StreamEvent("error", "Request throttled by AWS Bedrock. Please try again.")
+            elif error_code in ("UnauthorizedException", "AccessDeniedException"):
+                yield StreamEvent(
+                    "error",
+                    "Invalid or unauthorized API key. Check AWS_BEARER_TOKEN_BEDROCK.",
+                )
+            else:
+                reason = exc.response["Error"].get("Message", str(exc))
+                yield StreamEvent("error", f"Bedrock service error: {reason}")
+            return
+
+        except BaseException as exc:
+            # Unexpected errors, and the client going away (GeneratorExit)
+            span.set_error(f"{type(exc).__name__}: {exc}")
+            raise
+
+        finally:
+            phase.end()
+            span.end()
+
+    # Signal stream completion
+    yield StreamEvent("done")
+
+
+_sse_text_deltas_total = metrics.counter(
+    "sse_text_deltas_total", "Text deltas received from Bedrock for /chat streams."
+)
+_sse_text_frames_total = metrics.counter(
+    "sse_text_frames_total", "Text frames sent to /chat clients after coalescing."
+)
+
+
+async def coalesce_events(
+    source: AsyncGenerator[StreamEvent, None],
+    max_bytes: int,
+    window_seconds: float,
+) -> AsyncGenerator[StreamEvent, None]:
+    """Merge consecutive text events from ``source`` into fewer, larger ones.
+
+    Buffered text is flushed once it reaches ``max_bytes``, once
+    ``window_seconds`` have passed since its first delta, and before any
+    other event, so ordering is preserved and no text is held back at the
+    end of the stream.  The next upstream read stays pending across flushes
+    instead of being cancelled.
+    """
+    parts: List[str] = []
+    size = 0
+    deadline = 0.0
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(source.__anext__())
+            if parts:
+                timeout = deadline - time.monotonic()
+                if timeout > 0:
+                    await asyncio.wait({pending}, timeout=timeout)
+                if not pending.done():
+                    _sse_text_frames_total.inc()
+                    yield StreamEvent("text", "".join(parts))
+                    parts, size = [], 0
+                    continue
+            try:
+                event = await pending
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+
+            if event.kind == "text":
+                _sse_text_deltas_total.inc()
+                if not parts:
+                    deadline = time.monotonic() + window_seconds
+                parts.append(event.data)
+                size += len(event.data.encode("utf-8"))
+                if size >= max_bytes:
+                    _sse_text_frames_total.inc()
+                    yield StreamEvent("text", "".join(parts))
+                    parts, size = [], 0
+                continue
+
+            if parts:
+                _sse_text_frames_total.inc()
+                yield StreamEvent("text", "".join(parts))
+                parts, size = [], 0
+            yield event
+
+        if parts:
+            _sse_text_frames_total.inc()
+            yield StreamEvent("text", "".join(parts))
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        await source.aclose()
+
+
+async def stream_response(messages: List[Dict]) -> AsyncGenerator[str, None]:
+    """Call Bedrock converse_stream and yield SSE-formatted strings.
+
+    Yields:
+        ``data: <token>\\n\\n`` for each content delta token.
+        ``event: done\\ndata: \\n\\n`` when the stream ends normally.
+        ``event: error\\ndata: <message>\\n\\n`` on any Bedrock error.
+    """
+    async for event in bedrock_events(messages):
+        yield format_sse(event)
+
+
+# ---------------------------------------------------------------------------
+# AdmissionController — bounded upstream concurrency with a fair wait queue
+# ---------------------------------------------------------------------------
+
+
+class AdmissionRejected(Exception):
+    """Raised when a stream cannot be admitted (queue full or wait timed out)."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """Handle for one admitted upstream stream; release() is idempotent."""
+
+    def __init__(self, controller: "AdmissionController") -> None:
+        self._controller = controller
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(time.monotonic() - self._acquired_at)
+
+
+_admission_wait_seconds = metrics.histogram(
+    "admission_queue_wait_seconds",
+    "Seconds admitted requests waited for a slot (0 when one was free).",
+)
+
+
+class AdmissionController:
+    """Cap in-flight Bedrock streams and queue the overflow fairly.
+
+    At most ``max_in_flight`` slots are held at once.  Up to ``max_queued``
+    further requests wait, each for at most ``queue_timeout`` seconds.
+    Waiters are grouped by client key and freed slots are handed out
+    round-robin across clients, so one client with a burst of requests
+    cannot starve everyone else.  When the queue is full, ``acquire`` fails
+    immediately with :class:`AdmissionRejected`.
+
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, queue_timeout: float) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Exponentially weighted average of how long a slot is held, used
+        # to estimate a sensible Retry-After.
+        self._avg_hold_seconds = 5.0
+
+    async def acquire(self, client_key: str) -> AdmissionSlot:
+        """Wait for a free slot; raise :class:`AdmissionRejected` if none comes."""
+        if self.in_flight < self.max_in_flight and self.queued == 0:
+            self.in_flight += 1
+            _admission_wait_seconds.observe(0.0)
+            return AdmissionSlot(self)
+
+        if self.queued >= self.max_queued:
+            raise AdmissionRejected("queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client_key, deque()).append(waiter)
+        self.queued += 1
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up — pass it on.
+                self._release(None)
+            else:
+                self._discard_waiter(client_key, waiter)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise AdmissionRejected("queue timeout", self.retry_after()) from None
+            raise
+        _admission_wait_seconds.observe(time.monotonic() - queued_at)
+        return AdmissionSlot(self)
+
+    def retry_after(self) -> int:
+        """Estimate in whole seconds when a rejected client should retry."""
+        backlog = (self.queued + 1) / self.max_in_flight
+        return max(1, min(60, math.ceil(self._avg_hold_seconds * backlog)))
+
+    def _release(self, held_seconds: Optional[float]) -> None:
+        if held_seconds is not None:
+            self._avg_hold_seconds = 0.8 * self._avg_hold_seconds + 0.2 * held_seconds
+
+        # Hand the slot straight to the next waiter, rotating across clients.
+        while self._waiters:
+            client_key, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiters.move_to_end(client_key)
+            else:
+                del self._waiters[client_key]
+            self.queued -= 1
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.in_flight -= 1
+
+    def _discard_waiter(self, client_key: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiters.get(client_key)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        self.queued -= 1
+        if not waiters:
+            del self._waiters[client_key]
+
+
+admission = AdmissionController(
+    max_in_flight=_per_worker(MAX_CONCURRENT_STREAMS),
+    max_queued=_per_worker(MAX_QUEUED_STREAMS),
+    queue_timeout=QUEUE_TIMEOUT_SECONDS,
+)
+
+metrics.gauge("admission_in_flight", "Bedrock streams holding an admission slot.", lambda: admission.in_flight)
+metrics.gauge("admission_queued", "Chat requests waiting for an admission slot.", lambda: admission.queued)
+
+
+def _client_key(request: Request) -> str:
+    """Identify the caller for fairness: the Basic Auth user, else the peer IP."""
+    user = request.scope.get("auth_user")
+    if user:
+        return f"user:{user}"
+    if request.client is not None:
+        return f"ip:{request.client.host}"
+    return "anonymous"
+
+
+# ---------------------------------------------------------------------------
+# BasicAuthMiddleware (Requirements 7.1, 7.3, 7.4)
+# ---------------------------------------------------------------------------
+
+_WWW_AUTH_HEADER = 'Basic realm="Bedrock Chat"'
+
+def _pbkdf2_hash(password: str, iterations: int) -> str:
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${_b64(salt)}${_b64(digest)}"
+
+
+class _PasswordHash(NamedTuple):
+    scheme: str
+    params: Tuple[int, ...]
+    salt: bytes
+    expected: bytes
+
+
+def _parse_password_hash(encoded: str) -> _PasswordHash:
+    """Split a ``scrypt$...`` or ``pbkdf2_sha256$...`` hash without checking it.
+
+    Raises ValueError if *encoded* is not a supported, well-formed hash.
+    """
+    scheme, _, rest = encoded.partition("$")
+    fields = rest.split("$")
+    if scheme == "scrypt" and len(fields) == 5:
+        count = 3
+    elif scheme == "pbkdf2_sha256" and len(fields) == 3:
+        count = 1
+    else:
+        raise ValueError(f"unsupported password hash scheme {scheme!r}")
+    try:
+        params = tuple(int(f) for f in fields[:count])
+        salt, expected = (base64.b64decode(f, validate=True) for f in fields[count:])
+    except (binascii.Error, ValueError) as exc:
+        raise ValueError(f"malformed {scheme} hash") from exc
+    if min(params) < 1 or not expected or (scheme == "scrypt" and (params[0] < 2 or params[0] & (params[0] - 1))):
+        raise ValueError(f"malformed {scheme} hash")
+    return _PasswordHash(scheme, params, salt, expected)
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """Check *password* against a ``scrypt$...`` or ``pbkdf2_sha256$...`` hash.
+
+    Raises ValueError if *encoded* is not a supported hash.
+    """
+    scheme, params, salt, expected = _parse_password_hash(encoded)
+    if scheme == "scrypt":
+        n, r, p = params
+        digest = hashlib.scrypt(
+            password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+            maxmem=256 * 1024 * 1024, dklen=len(expected),
+        )
+    else:
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"), salt, params[0], dklen=len(expected)
+        )
+    return hmac.compare_digest(digest, expected)
+
+
+def load_users_file(path: str) -> Dict[str, str]:
+    """Read ``username:hash`` lines; blank lines and ``#`` comments are skipped.
+
+    Raises ConfigError on an unreadable file or a malformed line.
+    """
+    users: Dict[str, str] = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError as exc:
+        raise ConfigError(f"Cannot read AUTH_USERS_FILE {path}: {exc}") from None
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        username, sep, encoded = line.partition(":")
+        if not sep or not username or not encoded:
+            raise ConfigError(f"AUTH_USERS_FILE line {number} is not username:hash")
+        try:
+            _parse_password_hash(encoded)
+        except ValueError as exc:
+            raise ConfigError(f"AUTH_USERS_FILE line {number}: {exc}") from None
+        users[username] = encoded
+    if not users:
+        raise ConfigError(f"AUTH_USERS_FILE {path} has no users")
+    return users
+
+
+def load_auth_users(settings: RuntimeSettings) -> Dict[str, str]:
+    """Username to password hash for BasicAuthMiddleware; raises ConfigError."""
+    if settings.auth_users_file:
+        return load_users_file(settings.auth_users_file)
+    # AUTH_PASSWORD is already plaintext in the environment, so a slow
+    # hash would add latency without protecting anything
+    return {settings.auth_username: _pbkdf2_hash(settings.auth_password, 1000)}
+
+
+# Password checks get their own threads, so a burst of wrong passwords
+# queues here instead of filling the default executor that the Bedrock
+# client build and configuration reloads use
+_auth_executor = ThreadPoolExecutor(max_workers=AUTH_VERIFY_WORKERS, thread_name_prefix="auth")
+
+
+class BasicAuthMiddleware:
+    """HTTP Basic Authentication middleware.
+
+    Only added to the app when AUTH_ENABLED=true.  Parses the
+    ``Authorization: Basic <b64>`` header and returns HTTP 401 with a
+    ``WWW-Authenticate`` challenge if the header is absent, malformed, or
+    the decoded credentials do not match (case-sensitive) one of *users*, a
+    mapping of username to password hash.
+
+    This is a plain ASGI middleware: authorised requests call the wrapped
+    app with the original ``receive``/``send``, so SSE bodies stream through
+    untouched.  Password hashes are deliberately slow, so they are checked on
+    one of the AUTH_VERIFY_WORKERS threads, and header values that passed are
+    remembered for *cache_ttl* seconds in an LRU of *cache_size* entries.  The
+    cache is keyed by an HMAC of the header under a per-process key, so it
+    never holds credentials in a form that could be replayed.
+
+    *users* may be updated in place while the app runs (a configuration
+    reload does this).  A remembered header only stays valid while its
+    user's hash is unchanged.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        users: Dict[str, str],
+        cache_size: int = 128,
+        cache_ttl: float = 300.0,
+    ) -> None:
+        self.app = app
+        self._users = users
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        self._cache_key = secrets.token_bytes(32)
+        self._verified: "OrderedDict[bytes, Tuple[str, float, str]]" = OrderedDict()
+        # Hashed when the username is unknown, so that costs as much as a
+        # wrong password even if *users* changes meanwhile
+        self._decoy_hash = next(iter(users.values()))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        auth_header = b""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth_header = value
+                break
+
+        cache_key = hmac.new(self._cache_key, auth_header, hashlib.sha256).digest()
+        username = self._cached(cache_key)
+        if username is None:
+            loop = asyncio.get_running_loop()
+            verified = await loop.run_in_executor(_auth_executor, self._verify, auth_header)
+            if verified is not None:
+                username = verified[0]
+                self._remember(cache_key, *verified)
+        if username is None:
+            await self._unauthorized()(scope, receive, send)
+            return
+
+        # Expose the authenticated identity to routes (admission fairness)
+        scope["auth_user"] = username
+        await self.app(scope, receive, send)
+
+    def _cached(self, cache_key: bytes) -> Optional[str]:
+        entry = self._verified.get(cache_key)
+        if entry is None:
+            return None
+        username, expires_at, encoded = entry
+        if expires_at <= time.monotonic() or self._users.get(username) != encoded:
+            del self._verified[cache_key]
+            return None
+        self._verified.move_to_end(cache_key)
+        return username
+
+    def _remember(self, cache_key: bytes, username: str, encoded: str) -> None:
+        self._verified[cache_key] = (username, time.monotonic() + self._cache_ttl, encoded)
+        self._verified.move_to_end(cache_key)
+        while len(self._verified) > self._cache_size:
+            self._verified.popitem(last=False)
+
+    def _verify(self, auth_header: bytes) -> Optional[Tuple[str, str]]:
+        """Return the username and its hash if *auth_header* carries valid credentials."""
+        # Must be "Basic <token>"
+        if not auth_header.startswith(b"Basic "):
+            return None
+
+        try:
+            decoded = base64.b64decode(auth_header[len(b"Basic "):]).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+
+        # Credentials must contain exactly one colon
+        if ":" not in decoded:
+            return None
+
+        # Split on the first colon only — passwords may contain colons
+        username, password = decoded.split(":", 1)
+
+        encoded = self._users.get(username)
+        if encoded is None:
+            # Check against some user's hash anyway so unknown usernames take
+            # as long as wrong passwords
+            verify_password(password, self._decoy_hash)
+            return None
+        return (username, encoded) if verify_password(password, encoded) else None
+
+    @staticmethod
+    def _unauthorized() -> Response:
+        return Response(
+            content="Unauthorized",
+            status_code=401,
+            headers={"WWW-Authenticate": _WWW_AUTH_HEADER},
+        )
+
+
+# ---------------------------------------------------------------------------
+# SQLite off the event loop
+# ---------------------------------------------------------------------------
+# Statements against the conversation, response cache, quota, generation and
+# drain tables run on this one thread.  A write may wait seconds for another worker's lock and
+# a commit waits on the disk; neither may stall the event loop.  One thread
+# also keeps each process's writes in the order they were issued.
+
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+
+async def run_db(fn: Callable, *args):
+    """Run ``fn(*args)`` on the SQLite thread and return its result."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _db_executor, functools.partial(fn, *args)
+    )
+
+
+def _log_db_failure(future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        logger.error("SQLite write failed: %s", exc, exc_info=exc)
+
+
+def submit_db(fn: Callable, *args) -> None:
+    """Queue ``fn(*args)`` on the SQLite thread without waiting; failures are logged."""
+    _db_executor.submit(fn, *args).add_done_callback(_log_db_failure)
+
+
+def wait_for_db() -> None:
+    """Block until every SQLite statement queued so far has run."""
+    _db_executor.submit(lambda: None).result()
+
+
+def connect_shared_db(path: str) -> sqlite3.Connection:
+    """Open a SQLite file that several worker processes read and write at once.
+
+    WAL lets readers run alongside the single writer; writers wait up to five
+    seconds for each other.  The connection is in autocommit mode, so callers
+    group statements with ``BEGIN IMMEDIATE`` / ``COMMIT``.
+    """
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# ---------------------------------------------------------------------------
+# Configuration reload and drain
+# ---------------------------------------------------------------------------
+# SIGHUP or POST /admin/reload re-reads the environment and .env and swaps in
+# a new Bedrock client, model, region and Basic Auth users without a restart.
+# Streams already running keep the client they started with.  POST
+# /admin/drain refuses new chats so the server can be restarted once its
+# open streams have finished.
+
+_config_reloads_total = metrics.counter("config_reloads_total", "Configuration reloads by result.")
+
+# Fields whose change needs a new Bedrock client
+_CLIENT_FIELDS = ("aws_access_key", "aws_secret_key", "aws_session_token", "aws_bearer_token", "aws_region")
+
+
+class _PreparedReload(NamedTuple):
+    settings: RuntimeSettings
+    environ: Dict[str, str]
+    client: object  # None keeps the current client
+    users: Optional[Dict[str, str]]  # None keeps the current users
+    changed: List[str]
+    restart_required: List[str]
+
+
+def _reloaded_environ() -> Dict[str, str]:
+    """The environment a fresh start would see: process variables, then .env."""
+    env = {name: value for name, value in os.environ.items() if name in _PROCESS_ENV_NAMES}
+    for name, value in dotenv_values().items():
+        if name not in env and value is not None:
+            env[name] = value
+    return env
+
+
+def _prepare_reload(current: RuntimeSettings) -> _PreparedReload:
+    """Validate the new settings and build what they need; raises ConfigError.
+
+    Runs in a worker thread: reading AUTH_USERS_FILE checks every hash.
+    """
+    env = _reloaded_environ()
+    new = read_runtime_settings(env, auth_enabled)
+    fields = [f for f in RuntimeSettings._fields if getattr(new, f) != getattr(current, f)]
+    changed = [_RUNTIME_SETTING_NAMES[f] for f in fields]
+
+    users = None
+    if auth_enabled and (new.auth_users_file or {"auth_username", "auth_password"} & set(fields)):
+        users = load_auth_users(new)
+        if users == auth_users:
+            users = None
+        elif new.auth_users_file and "AUTH_USERS_FILE" not in changed:
+            # Same file, new contents
+            changed.append("AUTH_USERS_FILE")
+
+    client = None
+    if set(_CLIENT_FIELDS) & set(fields):
+        try:
+            client = build_bedrock_client(new)
+        except Exception as exc:  # noqa: BLE001 — botocore raises several types
+            raise ConfigError(f"Cannot create the Bedrock client: {exc}") from None
+
+    # Other settings are read once at import time
+    reloadable = set(_RUNTIME_SETTING_NAMES.values())
+    from_dotenv = (set(env) | set(os.environ)) - _PROCESS_ENV_NAMES - reloadable
+    restart_required = sorted(n for n in from_dotenv if env.get(n) != os.environ.get(n))
+    return _PreparedReload(new, env, client, users, changed, restart_required)
+
+
+def _install_settings(
+    settings: RuntimeSettings,
+    client: Optional[BedrockBackend],
+    users: Optional[Dict[str, str]],
+) -> None:
+    """Make *settings* current; a *client* or *users* of None keeps the current one."""
+    global runtime_settings, aws_region, bedrock_model_id, bedrock_client
+    with _bedrock_client_lock:
+        if client is not None:
+            bedrock_client = client
+        runtime_settings = settings
+    aws_region = runtime_settings.aws_region
+    bedrock_model_id = runtime_settings.bedrock_model_id
+    if users is not None:
+        # In place: BasicAuthMiddleware holds this dict
+        auth_users.update(users)
+        for username in set(auth_users) - set(users):
+            del auth_users[username]
+
+
+def _apply_reload(prepared: _PreparedReload) -> None:
+    """Swap in prepared settings; no awaits, so no request sees a mix."""
+    for name in _RUNTIME_SETTING_NAMES.values():
+        if name in prepared.environ:
+            os.environ[name] = prepared.environ[name]
+        else:
+            os.environ.pop(name, None)
+    _install_settings(prepared.settings, prepared.client, prepared.users)
+
+
+_reload_lock = asyncio.Lock()
+
+
+async def reload_config() -> Dict[str, List[str]]:
+    """Apply changes to the RuntimeSettings from the environment and .env.
+
+    Returns the variables that changed, and those that changed in .env but
+    only take effect after a restart.  Raises ConfigError, keeping the
+    current configuration, if the new one is invalid.
+    """
+    async with _reload_lock:
+        loop = asyncio.get_running_loop()
+        try:
+            prepared = await loop.run_in_executor(None, _prepare_reload, runtime_settings)
+        except ConfigError:
+            _config_reloads_total.inc(result="error")
+            raise
+        _apply_reload(prepared)
+    _config_reloads_total.inc(result="ok")
+    logger.info("Configuration reloaded; changed: %s", ", ".join(prepared.changed) or "nothing")
+    if prepared.restart_required:
+        logger.warning("Restart to apply: %s", ", ".join(prepared.restart_required))
+    return {"changed": prepared.changed, "restart_required": prepared.restart_required}
+
+
+async def _reload_after_sighup() -> None:
+    try:
+        await reload_config()
+    except ConfigError as exc:
+        logger.error("Configuration reload failed; keeping the current settings: %s", exc)
+
+
+# Set by `python app.py` with WORKERS > 1; workers forward reloads to it
+_SUPERVISOR_PID_ENV = "BEDROCK_CHAT_SUPERVISOR_PID"
+
+_DRAIN_RETRY_AFTER_SECONDS = 5
+# How often each worker picks up the shared drain flag and reports its load
+_DRAIN_SYNC_SECONDS = 1.0
+
+
+class DrainState:
+    """Whether POST /chat answers 503 while running streams carry on.
+
+    ``draining`` is read by every chat request, so it is a plain attribute;
+    set() and status() are awaited by the /admin/drain routes.
+    """
+
+    def __init__(self) -> None:
+        self.draining = False
+
+    async def set(self, draining: bool) -> None:
+        self.draining = draining
+
+    async def status(self) -> Dict[str, object]:
+        return {"draining": self.draining, "in_flight": admission.in_flight, "queued": admission.queued}
+
+    async def watch(self) -> None:
+        """Keep ``draining`` current; nothing to follow in a single process."""
+
+
+class SharedDrainState(DrainState):
+    """DrainState kept in SQLite, so every worker process drains together.
+
+    Each worker's watch() task copies the shared flag into ``draining`` and
+    records the worker's open and queued streams every _DRAIN_SYNC_SECONDS;
+    status() adds up the workers that reported recently.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self._worker = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._lock = threading.Lock()
+        self._conn = connect_shared_db(path)
+        with self._lock:
+            for statement in (
+                "CREATE TABLE IF NOT EXISTS drain_flag ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1), draining INTEGER NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS drain_workers ("
+                " worker TEXT PRIMARY KEY,"
+                " in_flight INTEGER NOT NULL,"
+                " queued INTEGER NOT NULL,"
+                " updated REAL NOT NULL)",
+            ):
+                self._conn.execute(statement)
+            row = self._conn.execute("SELECT draining FROM drain_flag").fetchone()
+        self.draining = bool(row and row[0])
+
+    def clear(self) -> None:
+        """Accept chats and forget every worker; called before any worker starts."""
+        with self._lock:
+            self._conn.execute("DELETE FROM drain_flag")
+            self._conn.execute("DELETE FROM drain_workers")
+
+    async def set(self, draining: bool) -> None:
+        await run_db(self._set, draining)
+        self.draining = draining
+
+    async def status(self) -> Dict[str, object]:
+        draining, in_flight, queued = await run_db(self._status, admission.in_flight, admission.queued)
+        self.draining = draining
+        return {"draining": draining, "in_flight": in_flight, "queued": queued}
+
+    async def watch(self) -> None:
+        try:
+            while True:
+                await self.refresh()
+                await asyncio.sleep(_DRAIN_SYNC_SECONDS)
+        finally:
+            submit_db(self._forget)
+
+    async def refresh(self) -> None:
+        """Report this worker's load and pick up the shared flag."""
+        try:
+            self.draining = await run_db(self._report, admission.in_flight, admission.queued)
+        except sqlite3.Error as exc:
+            logger.error("Could not read the shared drain state: %s", exc)
+
+    def _set(self, draining: bool) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drain_flag (id, draining) VALUES (1, ?)", (int(draining),)
+            )
+
+    def _report(self, in_flight: int, queued: int) -> bool:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drain_workers (worker, in_flight, queued, updated)"
+                " VALUES (?, ?, ?, ?)",
+                (self._worker, in_flight, queued, time.time()),
+            )
+            row = self._conn.execute("SELECT draining FROM drain_flag").fetchone()
+        return bool(row and row[0])
+
+    def _status(self, in_flight: int, queued: int) -> Tuple[bool, int, int]:
+        draining = self._report(in_flight, queued)
+        with self._lock:
+            total_in_flight, total_queued = self._conn.execute(
+                "SELECT COALESCE(SUM(in_flight), 0), COALESCE(SUM(queued), 0)"
+                " FROM drain_workers WHERE updated > ?",
+                (time.time() - 3 * _DRAIN_SYNC_SECONDS,),
+            ).fetchone()
+        return draining, total_in_flight, total_queued
+
+    def _forget(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM drain_workers WHERE worker = ?", (self._worker,))
+
+
+drain: DrainState = SharedDrainState(SHARED_STATE_DB) if WORKERS > 1 else DrainState()
+
+metrics.gauge("chat_draining", "1 while new chat requests are refused.", lambda: float(drain.draining))
+
+
+def _warm_up_bedrock_client() -> None:
+    try:
+        get_bedrock_client()
+    except Exception:  # noqa: BLE001 — the first chat retries and reports it
+        logger.error("Bedrock client warm-up failed:\n%s", traceback.format_exc())
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    """Warm up the Bedrock client, follow the drain state and reload the
+    configuration on SIGHUP."""
+    loop = asyncio.get_running_loop()
+    reloads: set = set()
+    drain_watcher = loop.create_task(drain.watch())
+    if BEDROCK_CLIENT_INIT == "startup" and bedrock_client is None:
+        # Not awaited: the server accepts requests meanwhile, and a chat
+        # that arrives first waits for the same build
+        loop.run_in_executor(None, _warm_up_bedrock_client)
+
+    def _on_sighup() -> None:
+        task = loop.create_task(_reload_after_sighup())
+        reloads.add(task)
+        task.add_done_callback(reloads.discard)
+
+    try:
+        loop.add_signal_handler(signal.SIGHUP, _on_sighup)
+        handled = True
+    except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+        # No SIGHUP on Windows; no signal handlers off the main thread
+        handled = False
+    try:
+        yield
+    finally:
+        drain_watcher.cancel()
+        if handled:
+            loop.remove_signal_handler(signal.SIGHUP)
+
+
+# ---------------------------------------------------------------------------
+# Basic Auth users and the route table
+# ---------------------------------------------------------------------------
+# Routes are collected on ``router`` and mounted by create_app() at the end
+# of this file.  A reload updates auth_users in place, so the middleware of
+# every app sees the new users.
+if auth_enabled:
+    try:
+        auth_users = load_auth_users(runtime_settings)
+    except ConfigError as exc:
+        logger.error("ERROR: %s", exc)
+        sys.exit(1)
+    logger.info("Basic auth enabled for %d user(s)", len(auth_users))
+
+router = APIRouter()
+
+# ---------------------------------------------------------------------------
+# Pydantic models (Requirements 4.1, 4.2, 4.4)
+# ---------------------------------------------------------------------------
+
+
+class Message(BaseModel):
+    """A single conversation turn."""
+
+    role: Literal["user", "assistant"]
+    content: str
+
+    @field_validator("content")
+    @classmethod
+    def content_must_not_be_whitespace_only(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("content must not be whitespace-only")
+        return v
+
+
+class ChatRequest(BaseModel):
+    """Request body for POST /chat.
+
+    Without ``conversation_id`` the client sends the full history every time.
+    With it, ``history_length`` says how many earlier messages the server
+    already holds for that conversation and ``messages`` carries only the
+    new ones.
+    """
+
+    messages: List[Message]
+    conversation_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    history_length: int = Field(default=0, ge=0)
+
+    @model_validator(mode="after")
+    def validate_messages(self) -> "ChatRequest":
+        if not self.messages:
+            raise ValueError("messages must be non-empty")
+        if self.messages[-1].role != "user":
+            raise ValueError("last message must have role 'user'")
+        return self
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def trace_validation(cls, data, handler):
+        """Time all of the above as a span when a traced request is being handled."""
+        if _current_span.get() is None:
+            return handler(data)
+        with tracer.start_span("chat.validate"):
+            return handler(data)
+
+
+# ---------------------------------------------------------------------------
+# Helper: prune conversation history (Requirement 5.5)
+# ---------------------------------------------------------------------------
+MAX_TURNS = 100
+
+# Fixed per-message overhead (role marker, block framing) in estimated tokens
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Cheap local token estimate: about four UTF-8 bytes per token.
+
+    Byte length tracks real tokenizers reasonably for both Latin text
+    (~4 chars/token) and CJK (~1 char/token at 3 bytes each).  ASCII text,
+    which str.isascii() recognises without a scan, is not encoded at all.
+    """
+    size = len(text) if text.isascii() else len(text.encode("utf-8"))
+    return (size + 3) // 4
+
+
+def estimate_message_tokens(message: Dict) -> int:
+    """Estimated tokens for one message in either plain or Bedrock form."""
+    content = message["content"]
+    if isinstance(content, str):
+        tokens = estimate_text_tokens(content)
+    else:
+        tokens = sum(estimate_text_tokens(block.get("text", "")) for block in content)
+    return tokens + _MESSAGE_OVERHEAD_TOKENS
+
+
+def prune_history(
+    messages: List[Dict], token_budget: Optional[int] = None
+) -> Tuple[List[Dict], bool]:
+    """Return (pruned_messages, was_pruned).
+
+    By default a "turn" is one user/assistant pair (2 messages) and
+    100 turns = 200 messages: if the list exceeds 200 messages, the oldest
+    are removed until ≤ 200.
+
+    With a positive ``token_budget`` (defaults to HISTORY_TOKEN_BUDGET) the
+    newest messages whose estimated tokens fit the budget are kept instead,
+    regardless of count.  The newest message is always kept.
+
+    Either way the result never starts with an assistant message.
+    """
+    if token_budget is None:
+        token_budget = HISTORY_TOKEN_BUDGET
+
+    if token_budget > 0:
+        used = 0
+        start = len(messages)
+        while start > 0:
+            cost = estimate_message_tokens(messages[start - 1])
+            if used + cost > token_budget and start < len(messages):
+                break
+            used += cost
+            start -= 1
+        if start == 0:
+            return messages, False
+        pruned = messages[start:]
+    else:
+        max_messages = MAX_TURNS * 2
+        if len(messages) <= max_messages:
+            return messages, False
+
+        # Keep only the most recent max_messages entries.
+        pruned = messages[-max_messages:]
+
+    # If the first message after pruning is an assistant turn, drop it so the
+    # list always starts with a user message.
+    if pruned and pruned[0]["role"] == "assistant":
+        pruned = pruned[1:]
+    return pruned, True
+
+
+# ---------------------------------------------------------------------------
+# Server-side conversation store
+# ---------------------------------------------------------------------------
+# Lets the frontend send only the new turn instead of its whole history.  A
+# conversation is only written after a stream completes successfully, so a
+# failed turn leaves the stored history untouched (mirrors Requirement 5.6).
+# Only the tail that prune_history keeps is stored, which is all that would
+# ever be forwarded to Bedrock anyway.
+
+
+class StoredConversation(NamedTuple):
+    """``total`` counts every message ever appended; ``messages`` is the kept tail."""
+
+    total: int
+    messages: List[Dict]
+
+
+class ConversationStore(ABC):
+    """Interface for conversation backends.
+
+    Conversations are keyed by the owner's identity (see _client_key) and the
+    client-chosen conversation id, so one caller cannot read or extend
+    another's history by guessing its id.
+    """
+
+    @abstractmethod
+    def get(self, owner: str, conversation_id: str) -> Optional[StoredConversation]:
+        """Return the stored conversation, or None if it is unknown."""
+
+    @abstractmethod
+    def put(self, owner: str, conversation_id: str, conversation: StoredConversation) -> None:
+        """Save *conversation*, evicting the least recently used beyond the limit."""
+
+    @abstractmethod
+    def delete(self, owner: str, conversation_id: str) -> None:
+        """Forget the conversation; unknown ids are ignored."""
+
+    async def get_async(self, owner: str, conversation_id: str) -> Optional[StoredConversation]:
+        """get() for the event loop."""
+        return self.get(owner, conversation_id)
+
+    async def put_async(self, owner: str, conversation_id: str, conversation: StoredConversation) -> None:
+        """put() for the event loop."""
+        self.put(owner, conversation_id, conversation)
+
+
+class InMemoryConversationStore(ConversationStore):
+    """LRU dictionary holding at most ``max_conversations`` entries."""
+
+    def __init__(self, max_conversations: int) -> None:
+        self.max_conversations = max_conversations
+        self._data: "OrderedDict[Tuple[str, str], StoredConversation]" = OrderedDict()
+
+    def get(self, owner: str, conversation_id: str) -> Optional[StoredConversation]:
+        conversation = self._data.get((owner, conversation_id))
+        if conversation is not None:
+            self._data.move_to_end((owner, conversation_id))
+        return conversation
+
+    def put(self, owner: str, conversation_id: str, conversation: StoredConversation) -> None:
+        self._data[(owner, conversation_id)] = conversation
+        self._data.move_to_end((owner, conversation_id))
+        while len(self._data) > self.max_conversations:
+            self._data.popitem(last=False)
+
+    def delete(self, owner: str, conversation_id: str) -> None:
+        self._data.pop((owner, conversation_id), None)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """On-disk store; keeps the ``max_conversations`` most recently updated.
+
+    Triggers keep the row count in ``conversation_count``, so a put only
+    prunes when the table is over the limit.  The event loop uses
+    get_async() and put_async(), which run on the SQLite thread.
+    """
+
+    def __init__(self, path: str, max_conversations: int) -> None:
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")]
+            if columns and "owner" not in columns:
+                # Rows from before conversations had owners; their clients
+                # get HTTP 409 and resend the full history once
+                logger.info("Dropping conversations stored without an owner in %s.", path)
+                self._conn.execute("DROP TABLE conversations")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " owner TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " total INTEGER NOT NULL,"
+                " messages TEXT NOT NULL,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (owner, id))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updated)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_count ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS conversations_added AFTER INSERT ON conversations"
+                " BEGIN UPDATE conversation_count SET n = n + 1; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS conversations_removed AFTER DELETE ON conversations"
+                " BEGIN UPDATE conversation_count SET n = n - 1; END"
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversation_count VALUES (0, (SELECT COUNT(*) FROM conversations))"
+            )
+
+    def get(self, owner: str, conversation_id: str) -> Optional[StoredConversation]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total, messages FROM conversations WHERE owner = ? AND id = ?",
+                (owner, conversation_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredConversation(row[0], json.loads(row[1]))
+
+    def put(self, owner: str, conversation_id: str, conversation: StoredConversation) -> None:
+        payload = json.dumps(conversation.messages, separators=(",", ":"))
+        with self._lock, self._conn:
+            # An upsert, not INSERT OR REPLACE: a replace deletes the old row
+            # without firing the conversations_removed trigger
+            self._conn.execute(
+                "INSERT INTO conversations (owner, id, total, messages, updated)"
+                " VALUES (?, ?, ?, ?, ?) ON CONFLICT (owner, id) DO UPDATE SET"
+                " total = excluded.total, messages = excluded.messages, updated = excluded.updated",
+                (owner, conversation_id, conversation.total, payload, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT n FROM conversation_count").fetchone()
+            if count > self.max_conversations:
+                self._conn.execute(
+                    "DELETE FROM conversations WHERE rowid IN"
+                    " (SELECT rowid FROM conversations ORDER BY updated LIMIT ?)",
+                    (count - self.max_conversations,),
+                )
+
+    def delete(self, owner: str, conversation_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM conversations WHERE owner = ? AND id = ?", (owner, conversation_id)
+            )
+
+    async def get_async(self, owner: str, conversation_id: str) -> Optional[StoredConversation]:
+        """get() with the query run on the SQLite thread."""
+        return await run_db(self.get, owner, conversation_id)
+
+    async def put_async(self, owner: str, conversation_id: str, conversation: StoredConversation) -> None:
+        """put() with the write run on the SQLite thread."""
+        await run_db(self.put, owner, conversation_id, conversation)
+
+
+def _build_conversation_store() -> Optional[ConversationStore]:
+    if CONVERSATION_STORE == "memory" and WORKERS > 1:
+        # The next turn may reach a worker that never saw this one
+        logger.info("WORKERS=%d: keeping conversations in %s.", WORKERS, CONVERSATION_DB_PATH)
+        return SQLiteConversationStore(CONVERSATION_DB_PATH, CONVERSATION_STORE_MAX)
+    if CONVERSATION_STORE == "memory":
+        return InMemoryConversationStore(CONVERSATION_STORE_MAX)
+    if CONVERSATION_STORE == "sqlite":
+        return SQLiteConversationStore(CONVERSATION_DB_PATH, CONVERSATION_STORE_MAX)
+    return None
+
+
+conversation_store: Optional[ConversationStore] = _build_conversation_store()
+
+
+# ---------------------------------------------------------------------------
+# Shared, resumable generations
+# ---------------------------------------------------------------------------
+# Every /chat answer is produced by a SharedGeneration: the upstream stream
+# runs as its own task and its events are numbered and kept in a bounded
+# ring buffer.  The SSE response is just one subscriber, so a client whose
+# connection drops can resume with Last-Event-ID, and other tabs can attach
+# to an answer that is still being generated.
+
+
+class SharedGeneration:
+    """One upstream event stream fanned out to any number of subscribers.
+
+    Published events get ids 1, 2, 3, ... and the last ``buffer_size`` are
+    kept, so subscribers can join late or resume from any event still
+    buffered.  Once nobody has been reading for ``orphan_timeout`` seconds
+    the upstream is cancelled.  Done callbacks run when the producer ends
+    for any reason.
+    """
+
+    def __init__(
+        self,
+        generation_id: str,
+        source: AsyncGenerator[StreamEvent, None],
+        buffer_size: int,
+        orphan_timeout: float,
+    ) -> None:
+        self.generation_id = generation_id
+        self.owners: set = set()
+        self.finished = False
+        self.finished_at = 0.0
+        self.last_id = 0
+        # Wall-clock time another worker last read this generation's events
+        self.remote_read_at = 0.0
+        self._buffer: Deque[StreamEvent] = deque(maxlen=buffer_size)
+        self._subscribers = 0
+        self._orphan_timeout = orphan_timeout
+        self._orphan_timer: Optional[asyncio.TimerHandle] = None
+        self._callbacks: List[Callable[["SharedGeneration"], None]] = []
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run(source))
+        self._watch_for_orphan()
+
+    @property
+    def first_id(self) -> int:
+        """Id of the oldest event still in the buffer."""
+        return self.last_id - len(self._buffer) + 1
+
+    @property
+    def complete(self) -> bool:
+        """True once the stream ended with "done" and no event was dropped."""
+        return (
+            self.finished
+            and self.first_id == 1
+            and bool(self._buffer)
+            and self._buffer[-1].kind == "done"
+        )
+
+    def events(self) -> Tuple[StreamEvent, ...]:
+        return tuple(self._buffer)
+
+    def add_done_callback(self, callback: Callable[["SharedGeneration"], None]) -> None:
+        if self.finished:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _publish(self, event: StreamEvent) -> None:
+        self.last_id += 1
+        self._buffer.append(event._replace(id=self.last_id))
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, source: AsyncGenerator[StreamEvent, None]) -> None:
+        try:
+            async for event in source:
+                self._publish(event)
+        except asyncio.CancelledError:
+            self._publish(StreamEvent("error", "Response generation was cancelled."))
+            raise
+        except Exception:
+            logger.error("Unexpected exception in generation:\n%s", traceback.format_exc())
+            self._publish(StreamEvent("error", "Internal server error"))
+        finally:
+            self.finished = True
+            self.finished_at = time.monotonic()
+            if self._orphan_timer is not None:
+                self._orphan_timer.cancel()
+            self._changed.set()
+            for callback in self._callbacks:
+                callback(self)
+
+    def subscribe(self, after_id: int = 0) -> AsyncGenerator[StreamEvent, None]:
+        """Return a generator over every event with an id above ``after_id``."""
+        return self._follow(after_id)
+
+    async def wait_past(self, event_id: int) -> None:
+        """Return once an event after ``event_id`` is published or the stream ends."""
+        while self.last_id <= event_id and not self.finished:
+            await self._changed.wait()
+
+    async def _follow(self, after_id: int) -> AsyncGenerator[StreamEvent, None]:
+        self._subscribers += 1
+        if self._orphan_timer is not None:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+        next_id = after_id + 1
+        try:
+            while True:
+                changed = self._changed
+                while next_id <= self.last_id:
+                    if next_id < self.first_id:
+                        yield StreamEvent(
+                            "error", "Part of the response is no longer available. Please try again."
+                        )
+                        return
+                    yield self._buffer[next_id - self.first_id]
+                    next_id += 1
+                if self.finished:
+                    return
+                await changed.wait()
+        finally:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._watch_for_orphan()
+
+    def _watch_for_orphan(self) -> None:
+        loop = self._task.get_loop()
+        if self.finished or loop.is_closed():
+            return
+        self._orphan_timer = loop.call_later(self._orphan_timeout, self._cancel_if_orphaned)
+
+    def _cancel_if_orphaned(self) -> None:
+        self._orphan_timer = None
+        if self._subscribers or self.finished:
+            return
+        idle = time.time() - self.remote_read_at
+        if idle < self._orphan_timeout:
+            # Still being read through another worker
+            self._orphan_timer = self._task.get_loop().call_later(
+                self._orphan_timeout - idle, self._cancel_if_orphaned
+            )
+            return
+        logger.info(
+            "Cancelling generation %s: no subscribers for %.0fs.",
+            self.generation_id,
+            self._orphan_timeout,
+        )
+        self._task.cancel()
+
+
+class GenerationRegistry:
+    """Running and recently finished generations, by id.
+
+    Finished generations stay resumable for ``retention_seconds``.
+    """
+
+    def __init__(self, buffer_size: int, orphan_timeout: float, retention_seconds: float) -> None:
+        self.buffer_size = buffer_size
+        self.orphan_timeout = orphan_timeout
+        self.retention_seconds = retention_seconds
+        self._generations: Dict[str, SharedGeneration] = {}
+
+    def __len__(self) -> int:
+        return len(self._generations)
+
+    def start(self, source: AsyncGenerator[StreamEvent, None], owner: str) -> SharedGeneration:
+        self._sweep()
+        generation = SharedGeneration(
+            secrets.token_urlsafe(16), source, self.buffer_size, self.orphan_timeout
+        )
+        generation.owners.add(owner)
+        self._generations[generation.generation_id] = generation
+        return generation
+
+    def get(self, generation_id: str) -> Optional[SharedGeneration]:
+        self._sweep()
+        return self._generations.get(generation_id)
+
+    async def get_async(
+        self, generation_id: str
+    ) -> Optional[Union[SharedGeneration, "StoredGeneration"]]:
+        """get(), or for a shared registry, a generation of another worker."""
+        return self.get(generation_id)
+
+    def _sweep(self) -> None:
+        cutoff = time.monotonic() - self.retention_seconds
+        expired = [
+            generation_id
+            for generation_id, generation in self._generations.items()
+            if generation.finished and generation.finished_at <= cutoff
+        ]
+        for generation_id in expired:
+            del self._generations[generation_id]
+
+
+# How often readers in other workers poll, and how long a running generation
+# may go without a write before they give up on the worker producing it.
+_GENERATION_POLL_SECONDS = 0.1
+_GENERATION_STALE_SECONDS = 10.0
+
+
+class StoredGeneration:
+    """A generation running in another worker, followed through SQLite.
+
+    subscribe() polls the shared table for new events, and each poll tells
+    the producing worker that somebody is still reading.
+    """
+
+    def __init__(self, registry: "SQLiteGenerationRegistry", generation_id: str, owners: set) -> None:
+        self.generation_id = generation_id
+        self.owners = owners
+        self._registry = registry
+
+    def subscribe(self, after_id: int = 0) -> AsyncGenerator[StreamEvent, None]:
+        """Return a generator over every event with an id above ``after_id``."""
+        return self._follow(after_id)
+
+    async def _follow(self, after_id: int) -> AsyncGenerator[StreamEvent, None]:
+        next_id = after_id + 1
+        marked = 0.0
+        while True:
+            now = time.time()
+            mark = now - marked >= self._registry.heartbeat
+            state = await run_db(self._registry._read, self.generation_id, next_id - 1, mark)
+            if mark:
+                marked = now
+            if state is None:
+                yield StreamEvent("error", "Part of the response is no longer available. Please try again.")
+                return
+            events, finished, updated = state
+            for event in events:
+                if event.id != next_id:
+                    yield StreamEvent(
+                        "error", "Part of the response is no longer available. Please try again."
+                    )
+                    return
+                yield event
+                next_id += 1
+            if finished:
+                return
+            if now - updated > _GENERATION_STALE_SECONDS:
+                # The producing worker has stopped
+                yield StreamEvent("error", "Response generation was interrupted. Please try again.")
+                return
+            await asyncio.sleep(_GENERATION_POLL_SECONDS)
+
+
+class SQLiteGenerationRegistry(GenerationRegistry):
+    """GenerationRegistry whose events are also written to a SQLite file
+    shared by all worker processes, so a reconnect that reaches another
+    worker can still resume.
+
+    Generations keep running in the worker that started them.  A task there
+    copies new events to the table every poll interval, and get_async() in
+    any other worker returns a StoredGeneration that follows those rows.
+    """
+
+    def __init__(
+        self, path: str, buffer_size: int, orphan_timeout: float, retention_seconds: float
+    ) -> None:
+        super().__init__(buffer_size, orphan_timeout, retention_seconds)
+        # Readers check in, and writers sync, at least this often
+        self.heartbeat = min(1.0, orphan_timeout / 3)
+        self._mirrors: set = set()
+        self._lock = threading.Lock()
+        self._conn = connect_shared_db(path)
+        with self._lock:
+            for statement in (
+                "CREATE TABLE IF NOT EXISTS generations ("
+                " id TEXT PRIMARY KEY,"
+                " owners TEXT NOT NULL,"
+                " finished REAL,"
+                " updated REAL NOT NULL,"
+                " read_at REAL NOT NULL DEFAULT 0)",
+                "CREATE TABLE IF NOT EXISTS generation_events ("
+                " generation TEXT NOT NULL,"
+                " id INTEGER NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " PRIMARY KEY (generation, id))",
+            ):
+                self._conn.execute(statement)
+
+    def clear(self) -> None:
+        """Forget every stored generation; called before any worker starts."""
+        with self._lock:
+            self._conn.execute("DELETE FROM generation_events")
+            self._conn.execute("DELETE FROM generations")
+
+    def start(self, source: AsyncGenerator[StreamEvent, None], owner: str) -> SharedGeneration:
+        generation = super().start(source, owner)
+        task = asyncio.create_task(self._mirror(generation))
+        self._mirrors.add(task)
+        task.add_done_callback(self._mirrors.discard)
+        return generation
+
+    async def get_async(
+        self, generation_id: str
+    ) -> Optional[Union[SharedGeneration, "StoredGeneration"]]:
+        generation = self.get(generation_id)
+        if generation is not None:
+            return generation
+        owners = await run_db(self._owners, generation_id)
+        if owners is None:
+            return None
+        return StoredGeneration(self, generation_id, owners)
+
+    async def _mirror(self, generation: SharedGeneration) -> None:
+        written = 0
+        try:
+            while True:
+                finished = generation.finished
+                events = [event for event in generation.events() if event.id > written]
+                read_at = await run_db(
+                    self._write, generation.generation_id, sorted(generation.owners), events, finished
+                )
+                generation.remote_read_at = max(generation.remote_read_at, read_at)
+                if events:
+                    written = events[-1].id
+                if finished:
+                    return
+                # Batch events for one poll interval, but still check in
+                # while the upstream is quiet
+                await asyncio.sleep(_GENERATION_POLL_SECONDS)
+                try:
+                    await asyncio.wait_for(generation.wait_past(written), self.heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+        except Exception:
+            logger.error(
+                "Could not share generation %s:\n%s", generation.generation_id, traceback.format_exc()
+            )
+
+    def _write(
+        self, generation_id: str, owners: List[str], events: List[StreamEvent], finished: bool
+    ) -> float:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO generations (id, owners, finished, updated) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(id) DO UPDATE SET owners = excluded.owners,"
+                    " finished = excluded.finished, updated = excluded.updated",
+                    (generation_id, json.dumps(owners), now if finished else None, now),
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO generation_events (generation, id, kind, data)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(generation_id, event.id, event.kind, event.data) for event in events],
+                )
+                (read_at,) = self._conn.execute(
+                    "SELECT read_at FROM generations WHERE id = ?", (generation_id,)
+                ).fetchone()
+                if finished:
+                    # Finished generations expire; so do those of stopped workers
+                    cutoff = now - self.retention_seconds
+                    self._conn.execute(
+                        "DELETE FROM generation_events WHERE generation IN ("
+                        " SELECT id FROM generations WHERE finished <= ? OR updated <= ?)",
+                        (cutoff, cutoff - _GENERATION_STALE_SECONDS),
+                    )
+                    self._conn.execute(
+                        "DELETE FROM generations WHERE finished <= ? OR updated <= ?",
+                        (cutoff, cutoff - _GENERATION_STALE_SECONDS),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return read_at
+
+    def _owners(self, generation_id: str) -> Optional[set]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owners FROM generations WHERE id = ? AND COALESCE(finished, updated) > ?",
+                (generation_id, time.time() - self.retention_seconds),
+            ).fetchone()
+        return None if row is None else set(json.loads(row[0]))
+
+    def _read(
+        self, generation_id: str, after_id: int, mark: bool
+    ) -> Optional[Tuple[List[StreamEvent], bool, float]]:
+        """Events after ``after_id``, whether the generation finished, and
+        when its worker last wrote; ``mark`` records that somebody is reading."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT finished, updated FROM generations WHERE id = ?", (generation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if mark:
+                self._conn.execute(
+                    "UPDATE generations SET read_at = ? WHERE id = ?", (time.time(), generation_id)
+                )
+            # Read after the row: once finished is set, every event is there
+            events = [
+                StreamEvent(kind, data, event_id)
+                for event_id, kind, data in self._conn.execute(
+                    "SELECT id, kind, data FROM generation_events"
+                    " WHERE generation = ? AND id > ? ORDER BY id",
+                    (generation_id, after_id),
+                )
+            ]
+        finished, updated = row
+        return events, finished is not None, updated
+
+
+if WORKERS > 1:
+    generations: GenerationRegistry = SQLiteGenerationRegistry(
+        SHARED_STATE_DB,
+        GENERATION_BUFFER_EVENTS,
+        GENERATION_ORPHAN_TIMEOUT,
+        GENERATION_RETENTION_SECONDS,
+    )
+else:
+    generations = GenerationRegistry(
+        GENERATION_BUFFER_EVENTS, GENERATION_ORPHAN_TIMEOUT, GENERATION_RETENTION_SECONDS
+    )
+
+metrics.gauge(
+    "chat_generations", "Running and recently finished generations held for resume.", lambda: len(generations)
+)
+
+
+# ---------------------------------------------------------------------------
+# Response cache with single-flight deduplication
+# ---------------------------------------------------------------------------
+# Identical requests (same model, messages and inference config) share one
+# generation while it runs, and a completed answer is replayed from memory
+# until it expires.  Only streams that end with "done" are cached.
+
+_response_cache_requests_total = metrics.counter(
+    "response_cache_requests_total",
+    "Chat requests by response cache outcome (hit, coalesced, miss).",
+)
+
+
+def response_cache_key(messages: List[Dict]) -> str:
+    """SHA-256 over everything that determines the model's answer."""
+    payload = json.dumps(
+        {"modelId": bedrock_model_id, "messages": messages, "inferenceConfig": INFERENCE_CONFIG},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _CachedResponse(NamedTuple):
+    expires_at: float
+    events: Tuple[StreamEvent, ...]
+    size: int
+
+
+async def _replay(events: Tuple[StreamEvent, ...]) -> AsyncGenerator[StreamEvent, None]:
+    for event in events:
+        yield event
+
+
+class ResponseCache:
+    """TTL + LRU cache of completed responses, bounded in entries and bytes,
+    plus the table of in-flight generations used for single-flight."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[str, _CachedResponse]" = OrderedDict()
+        self._in_flight: Dict[str, SharedGeneration] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[StreamEvent, ...]]:
+        """Return the events of an unexpired cached response."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        _response_cache_requests_total.inc(result="hit")
+        return entry.events
+
+    async def get_async(self, key: str) -> Optional[Tuple[StreamEvent, ...]]:
+        """get() for the event loop."""
+        return self.get(key)
+
+    def in_flight(self, key: str) -> Optional[SharedGeneration]:
+        """Return the running generation for ``key``, if any."""
+        generation = self._in_flight.get(key)
+        if generation is not None:
+            _response_cache_requests_total.inc(result="coalesced")
+        return generation
+
+    def track(self, key: str, generation: SharedGeneration) -> None:
+        """Share ``generation`` with identical requests and cache its result."""
+        _response_cache_requests_total.inc(result="miss")
+        self._in_flight[key] = generation
+
+        def _on_finish(finished: SharedGeneration) -> None:
+            if self._in_flight.get(key) is finished:
+                del self._in_flight[key]
+            if finished.complete:
+                self._keep(key, finished.events())
+
+        generation.add_done_callback(_on_finish)
+
+    def _keep(self, key: str, events: Tuple[StreamEvent, ...]) -> None:
+        self._store(key, events)
+
+    def _store(self, key: str, events: Tuple[StreamEvent, ...]) -> None:
+        size = sum(len(e.kind) + len(e.data.encode("utf-8")) for e in events)
+        if size > self.max_bytes:
+            return
+        self._evict(key)
+        self._entries[key] = _CachedResponse(time.monotonic() + self.ttl_seconds, events, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.size
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+
+class SQLiteResponseCache(ResponseCache):
+    """ResponseCache whose completed responses live in a SQLite file shared
+    by all worker processes.  Single-flight stays per process: a running
+    generation cannot be handed to another process.  Requests look responses
+    up with get_async(), and finished responses are written, on the SQLite
+    thread.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int, max_bytes: int) -> None:
+        super().__init__(ttl_seconds, max_entries, max_bytes)
+        self._lock = threading.Lock()
+        self._conn = connect_shared_db(path)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY,"
+                " expires REAL NOT NULL,"
+                " events TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " used REAL NOT NULL)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+    @property
+    def bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+
+    @bytes.setter
+    def bytes(self, value: int) -> None:
+        pass  # derived from the table
+
+    def get(self, key: str) -> Optional[Tuple[StreamEvent, ...]]:
+        """Return the events of an unexpired cached response."""
+        return self._counted(self._load(key))
+
+    async def get_async(self, key: str) -> Optional[Tuple[StreamEvent, ...]]:
+        """get() with the query run on the SQLite thread."""
+        return self._counted(await run_db(self._load, key))
+
+    @staticmethod
+    def _counted(events: Optional[Tuple[StreamEvent, ...]]) -> Optional[Tuple[StreamEvent, ...]]:
+        if events is not None:
+            _response_cache_requests_total.inc(result="hit")
+        return events
+
+    def _load(self, key: str) -> Optional[Tuple[StreamEvent, ...]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT events FROM response_cache WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE response_cache SET used = ? WHERE key = ?", (now, key))
+        return tuple(StreamEvent(*event) for event in json.loads(row[0]))
+
+    def _keep(self, key: str, events: Tuple[StreamEvent, ...]) -> None:
+        submit_db(self._store, key, events)
+
+    def _store(self, key: str, events: Tuple[StreamEvent, ...]) -> None:
+        size = sum(len(e.kind) + len(e.data.encode("utf-8")) for e in events)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        payload = json.dumps([list(e) for e in events], separators=(",", ":"))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, expires, events, size, used)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, now + self.ttl_seconds, payload, size, now),
+                )
+                self._conn.execute("DELETE FROM response_cache WHERE expires <= ?", (now,))
+                # Drop the least recently used beyond the entry and byte limits
+                self._conn.execute(
+                    "DELETE FROM response_cache WHERE key IN ("
+                    " SELECT key FROM (SELECT key,"
+                    "  ROW_NUMBER() OVER (ORDER BY used DESC) AS n,"
+                    "  SUM(size) OVER (ORDER BY used DESC ROWS UNBOUNDED PRECEDING) AS total"
+                    "  FROM response_cache)"
+                    " WHERE n > ? OR total > ?)",
+                    (self.max_entries, self.max_bytes),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+def _build_response_cache() -> Optional[ResponseCache]:
+    if not RESPONSE_CACHE:
+        return None
+    if WORKERS > 1:
+        return SQLiteResponseCache(
+            SHARED_STATE_DB,
+            RESPONSE_CACHE_TTL_SECONDS,
+            RESPONSE_CACHE_MAX_ENTRIES,
+            RESPONSE_CACHE_MAX_BYTES,
+        )
+    return ResponseCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+
+
+response_cache: Optional[ResponseCache] = _build_response_cache()
+
+if response_cache is not None:
+    metrics.gauge(
+        "response_cache_entries", "Completed responses held in the cache.", lambda: len(response_cache)
+    )
+    metrics.gauge(
+        "response_cache_bytes", "Approximate size of cached responses.", lambda: response_cache.bytes
+    )
+
+
+# ---------------------------------------------------------------------------
+# Per-identity quotas
+# ---------------------------------------------------------------------------
+# Limits how much upstream capacity one caller can use: streams at once,
+# requests in any 60-second window and output tokens per UTC day.  Only
+# requests that need a Bedrock call count; cache hits and coalesced requests
+# are free.  Output tokens are known only once a stream ends, so the daily
+# limit stops the next request rather than cutting the current one short.
+
+
+class QuotaExceeded(Exception):
+    """Raised when an identity is over one of its quotas."""
+
+    def __init__(self, limit: str, retry_after: int) -> None:
+        super().__init__(limit)
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class QuotaLease:
+    """One upstream stream counted against an identity; release() is idempotent."""
+
+    def __init__(self, on_release: Callable[[], None]) -> None:
+        self._on_release = on_release
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._on_release()
+
+
+class _IdentityUsage:
+    __slots__ = ("active_streams", "recent_requests", "day", "requests", "input_tokens", "output_tokens")
+
+    def __init__(self, day: str) -> None:
+        self.active_streams = 0
+        self.recent_requests: Deque[float] = deque()
+        self.day = day
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+
+def _utc_day(now: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+
+class QuotaTracker:
+    """In-memory usage per identity, optionally persisted to SQLite.
+
+    Only used from the event loop thread, so no locking is needed.  With a
+    *db_path*, each identity's daily counters are written through to the
+    ``quota_usage`` table on the SQLite thread, and today's rows are loaded
+    at startup.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_streams: int,
+        requests_per_minute: int,
+        output_tokens_per_day: int,
+        db_path: str = "",
+    ) -> None:
+        self.max_concurrent_streams = max_concurrent_streams
+        self.requests_per_minute = requests_per_minute
+        self.output_tokens_per_day = output_tokens_per_day
+        self._usage: Dict[str, _IdentityUsage] = {}
+        self._day = _utc_day(time.time())
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS quota_usage ("
+                    " identity TEXT NOT NULL,"
+                    " day TEXT NOT NULL,"
+                    " requests INTEGER NOT NULL,"
+                    " input_tokens INTEGER NOT NULL,"
+                    " output_tokens INTEGER NOT NULL,"
+                    " PRIMARY KEY (identity, day))"
+                )
+            rows = self._conn.execute(
+                "SELECT identity, requests, input_tokens, output_tokens"
+                " FROM quota_usage WHERE day = ?",
+                (self._day,),
+            ).fetchall()
+            for identity, requests, input_tokens, output_tokens in rows:
+                usage = self._usage[identity] = _IdentityUsage(self._day)
+                usage.requests = requests
+                usage.input_tokens = input_tokens
+                usage.output_tokens = output_tokens
+
+    def _roll_day(self, now: float) -> str:
+        day = _utc_day(now)
+        if day != self._day:
+            # New day: forget identities with nothing in flight
+            self._day = day
+            self._usage = {k: u for k, u in self._usage.items() if u.active_streams}
+        return day
+
+    def _get(self, identity: str, now: float) -> _IdentityUsage:
+        day = self._roll_day(now)
+        usage = self._usage.get(identity)
+        if usage is None:
+            usage = self._usage[identity] = _IdentityUsage(day)
+        elif usage.day != day:
+            usage.day = day
+            usage.requests = usage.input_tokens = usage.output_tokens = 0
+        while usage.recent_requests and usage.recent_requests[0] <= now - 60.0:
+            usage.recent_requests.popleft()
+        return usage
+
+    def acquire(self, identity: str) -> QuotaLease:
+        """Count one upstream request for *identity* or raise QuotaExceeded."""
+        now = time.time()
+        usage = self._get(identity, now)
+        if self.max_concurrent_streams and usage.active_streams >= self.max_concurrent_streams:
+            raise QuotaExceeded("concurrent_streams", 1)
+        if self.requests_per_minute and len(usage.recent_requests) >= self.requests_per_minute:
+            retry_after = usage.recent_requests[0] + 60.0 - now
+            raise QuotaExceeded("requests_per_minute", max(1, math.ceil(retry_after)))
+        if self.output_tokens_per_day and usage.output_tokens >= self.output_tokens_per_day:
+            raise QuotaExceeded("output_tokens_per_day", max(1, 86400 - int(now % 86400)))
+        usage.active_streams += 1
+        usage.recent_requests.append(now)
+        usage.requests += 1
+        self._persist(identity, usage)
+        return QuotaLease(functools.partial(self._end_stream, usage))
+
+    async def acquire_async(self, identity: str) -> QuotaLease:
+        """acquire() for the event loop."""
+        return self.acquire(identity)
+
+    @staticmethod
+    def _end_stream(usage: _IdentityUsage) -> None:
+        usage.active_streams -= 1
+
+    def record_tokens(self, identity: str, bedrock_usage: Dict) -> None:
+        """Add the token counts from a converse_stream ``metadata`` event."""
+        usage = self._get(identity, time.time())
+        usage.input_tokens += bedrock_usage.get("inputTokens", 0)
+        usage.output_tokens += bedrock_usage.get("outputTokens", 0)
+        self._persist(identity, usage)
+
+    def _persist(self, identity: str, usage: _IdentityUsage) -> None:
+        if self._conn is None:
+            return
+        # Written on the SQLite thread; the counters are copied now, and that
+        # thread writes them in order, so the newest values always land last
+        submit_db(
+            self._write_usage,
+            (identity, usage.day, usage.requests, usage.input_tokens, usage.output_tokens),
+        )
+
+    def _write_usage(self, row: Tuple[str, str, int, int, int]) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quota_usage"
+                " (identity, day, requests, input_tokens, output_tokens)"
+                " VALUES (?, ?, ?, ?, ?)",
+                row,
+            )
 
-    def __init__(self, app: ASGIApp, username: str, password: str) -> None:
-        super().__init__(app)
-        self._username = username
-        self._password = password
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Current usage per identity, for the admin endpoint."""
+        now = time.time()
+        self._roll_day(now)
+        snapshot: Dict[str, Dict[str, object]] = {}
+        for identity in list(self._usage):
+            usage = self._get(identity, now)
+            snapshot[identity] = {
+                "active_streams": usage.active_streams,
+                "requests_last_minute": len(usage.recent_requests),
+                "day": usage.day,
+                "requests_today": usage.requests,
+                "input_tokens_today": usage.input_tokens,
+                "output_tokens_today": usage.output_tokens,
+            }
+        return snapshot
 
-    async def dispatch(self, request: Request, call_next):  # type: ignore[override]
-        auth_header = request.headers.get("Authorization", "")
+    async def snapshot_async(self) -> Dict[str, Dict[str, object]]:
+        """snapshot() for the event loop."""
+        return self.snapshot()
 
-        # Must be "Basic <token>"
-        if not auth_header.startswith("Basic "):
-            return self._unauthorized()
 
-        encoded = auth_header[len("Basic "):]
-        try:
-            decoded = base64.b64decode(encoded).decode("utf-8")
-        except (binascii.Error, UnicodeDecodeError):
-            return self._unauthorized()
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
 
-        # Credentials must contain exactly one colon
-        if ":" not in decoded:
-            return self._unauthorized()
 
-        # Split on the first colon only — passwords may contain colons
-        username, password = decoded.split(":", 1)
+class SharedQuotaTracker(QuotaTracker):
+    """QuotaTracker whose counters live in SQLite, shared by worker processes.
 
-        if username != self._username or password != self._password:
-            return self._unauthorized()
+    Each check-and-count runs in one ``BEGIN IMMEDIATE`` transaction, so two
+    workers cannot both take an identity's last slot.  Open streams are rows
+    tagged with the worker's pid; rows of workers that died are dropped when
+    a worker starts.  The event loop reaches the database only through the
+    SQLite thread: acquire_async() and snapshot_async() wait for it, while
+    releases and token counts are queued there.
+    """
 
-        return await call_next(request)
+    def __init__(
+        self,
+        max_concurrent_streams: int,
+        requests_per_minute: int,
+        output_tokens_per_day: int,
+        db_path: str,
+    ) -> None:
+        self.max_concurrent_streams = max_concurrent_streams
+        self.requests_per_minute = requests_per_minute
+        self.output_tokens_per_day = output_tokens_per_day
+        self._lock = threading.Lock()
+        self._conn = connect_shared_db(db_path)
+        with self._lock:
+            for statement in (
+                "CREATE TABLE IF NOT EXISTS quota_usage ("
+                " identity TEXT NOT NULL,"
+                " day TEXT NOT NULL,"
+                " requests INTEGER NOT NULL,"
+                " input_tokens INTEGER NOT NULL,"
+                " output_tokens INTEGER NOT NULL,"
+                " PRIMARY KEY (identity, day))",
+                "CREATE TABLE IF NOT EXISTS quota_streams ("
+                " lease TEXT PRIMARY KEY, identity TEXT NOT NULL, pid INTEGER NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS quota_requests (identity TEXT NOT NULL, at REAL NOT NULL)",
+                "CREATE INDEX IF NOT EXISTS quota_requests_identity ON quota_requests(identity, at)",
+            ):
+                self._conn.execute(statement)
+            pids = [pid for (pid,) in self._conn.execute("SELECT DISTINCT pid FROM quota_streams")]
+            for pid in pids:
+                if not _pid_alive(pid):
+                    self._conn.execute("DELETE FROM quota_streams WHERE pid = ?", (pid,))
 
-    @staticmethod
-    def _unauthorized() -> Response:
-        return Response(
-            content="Unauthorized",
-            status_code=401,
-            headers={"WWW-Authenticate": _WWW_AUTH_HEADER},
-        )
+    def clear_streams(self) -> None:
+        """Forget every open stream; called before any worker starts."""
+        with self._lock:
+            self._conn.execute("DELETE FROM quota_streams")
 
+    def acquire(self, identity: str) -> QuotaLease:
+        """Count one upstream request for *identity* or raise QuotaExceeded."""
+        now = time.time()
+        day = _utc_day(now)
+        lease = secrets.token_hex(8)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM quota_requests WHERE at <= ?", (now - 60.0,))
+                (active,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM quota_streams WHERE identity = ?", (identity,)
+                ).fetchone()
+                if self.max_concurrent_streams and active >= self.max_concurrent_streams:
+                    raise QuotaExceeded("concurrent_streams", 1)
+                recent, oldest = self._conn.execute(
+                    "SELECT COUNT(*), MIN(at) FROM quota_requests WHERE identity = ?", (identity,)
+                ).fetchone()
+                if self.requests_per_minute and recent >= self.requests_per_minute:
+                    raise QuotaExceeded("requests_per_minute", max(1, math.ceil(oldest + 60.0 - now)))
+                row = self._conn.execute(
+                    "SELECT output_tokens FROM quota_usage WHERE identity = ? AND day = ?",
+                    (identity, day),
+                ).fetchone()
+                if self.output_tokens_per_day and row and row[0] >= self.output_tokens_per_day:
+                    raise QuotaExceeded("output_tokens_per_day", max(1, 86400 - int(now % 86400)))
+                self._conn.execute(
+                    "INSERT INTO quota_streams (lease, identity, pid) VALUES (?, ?, ?)",
+                    (lease, identity, os.getpid()),
+                )
+                self._conn.execute(
+                    "INSERT INTO quota_requests (identity, at) VALUES (?, ?)", (identity, now)
+                )
+                self._conn.execute(
+                    "INSERT INTO quota_usage VALUES (?, ?, 1, 0, 0) ON CONFLICT (identity, day)"
+                    " DO UPDATE SET requests = requests + 1",
+                    (identity, day),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return QuotaLease(functools.partial(submit_db, self._end_shared_stream, lease))
 
-# ---------------------------------------------------------------------------
-# FastAPI application instance
-# ---------------------------------------------------------------------------
-app = FastAPI()
+    async def acquire_async(self, identity: str) -> QuotaLease:
+        """acquire() with the transaction run on the SQLite thread."""
+        return await run_db(self.acquire, identity)
 
-# Conditionally register BasicAuthMiddleware (Requirement 7.1)
-if auth_enabled:
-    app.add_middleware(BasicAuthMiddleware, username=auth_username, password=auth_password)
+    def _end_shared_stream(self, lease: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM quota_streams WHERE lease = ?", (lease,))
 
-# ---------------------------------------------------------------------------
-# Pydantic models (Requirements 4.1, 4.2, 4.4)
-# ---------------------------------------------------------------------------
+    def record_tokens(self, identity: str, bedrock_usage: Dict) -> None:
+        """Queue the token counts from a converse_stream ``metadata`` event."""
+        submit_db(
+            self._add_tokens,
+            identity,
+            _utc_day(time.time()),
+            bedrock_usage.get("inputTokens", 0),
+            bedrock_usage.get("outputTokens", 0),
+        )
 
+    def _add_tokens(self, identity: str, day: str, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO quota_usage VALUES (?, ?, 0, ?, ?) ON CONFLICT (identity, day)"
+                " DO UPDATE SET input_tokens = input_tokens + excluded.input_tokens,"
+                " output_tokens = output_tokens + excluded.output_tokens",
+                (identity, day, input_tokens, output_tokens),
+            )
 
-class Message(BaseModel):
-    """A single conversation turn."""
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Current usage per identity across all workers, for the admin endpoint."""
+        now = time.time()
+        day = _utc_day(now)
+        snapshot: Dict[str, Dict[str, object]] = {}
 
-    role: Literal["user", "assistant"]
-    content: str
+        def _entry(identity: str) -> Dict[str, object]:
+            return snapshot.setdefault(identity, {
+                "active_streams": 0,
+                "requests_last_minute": 0,
+                "day": day,
+                "requests_today": 0,
+                "input_tokens_today": 0,
+                "output_tokens_today": 0,
+            })
 
-    @field_validator("content")
-    @classmethod
-    def content_must_not_be_whitespace_only(cls, v: str) -> str:
-        if not v.strip():
-            raise ValueError("content must not be whitespace-only")
-        return v
+        with self._lock:
+            for identity, requests, input_tokens, output_tokens in self._conn.execute(
+                "SELECT identity, requests, input_tokens, output_tokens"
+                " FROM quota_usage WHERE day = ?",
+                (day,),
+            ):
+                entry = _entry(identity)
+                entry["requests_today"] = requests
+                entry["input_tokens_today"] = input_tokens
+                entry["output_tokens_today"] = output_tokens
+            for identity, count in self._conn.execute(
+                "SELECT identity, COUNT(*) FROM quota_streams GROUP BY identity"
+            ):
+                _entry(identity)["active_streams"] = count
+            for identity, count in self._conn.execute(
+                "SELECT identity, COUNT(*) FROM quota_requests WHERE at > ? GROUP BY identity",
+                (now - 60.0,),
+            ):
+                _entry(identity)["requests_last_minute"] = count
+        return snapshot
 
+    async def snapshot_async(self) -> Dict[str, Dict[str, object]]:
+        """snapshot() with the queries run on the SQLite thread."""
+        return await run_db(self.snapshot)
 
-class ChatRequest(BaseModel):
-    """Request body for POST /chat."""
 
-    messages: List[Message]
+if WORKERS > 1:
+    quotas: QuotaTracker = SharedQuotaTracker(
+        QUOTA_MAX_CONCURRENT_STREAMS,
+        QUOTA_REQUESTS_PER_MINUTE,
+        QUOTA_OUTPUT_TOKENS_PER_DAY,
+        QUOTA_DB_PATH or SHARED_STATE_DB,
+    )
+else:
+    quotas = QuotaTracker(
+        QUOTA_MAX_CONCURRENT_STREAMS,
+        QUOTA_REQUESTS_PER_MINUTE,
+        QUOTA_OUTPUT_TOKENS_PER_DAY,
+        QUOTA_DB_PATH,
+    )
 
-    @model_validator(mode="after")
-    def validate_messages(self) -> "ChatRequest":
-        if not self.messages:
-            raise ValueError("messages must be non-empty")
-        if self.messages[-1].role != "user":
-            raise ValueError("last message must have role 'user'")
-        return self
+_quota_rejections_total = metrics.counter(
+    "quota_rejections_total", "Chat requests rejected by a per-identity quota."
+)
 
 
 # ---------------------------------------------------------------------------
-# Helper: prune conversation history to at most 100 turns (Requirement 5.5)
+# POST /chat route (Requirements 4.1, 4.2, 4.4, 4.5, 5.2, 5.5, 8.5, 8.6, 8.7)
 # ---------------------------------------------------------------------------
-MAX_TURNS = 100
 
 
-def prune_history(messages: List[Dict]) -> Tuple[List[Dict], bool]:
-    """Return (pruned_messages, was_pruned).
-
-    A "turn" is one user/assistant pair (2 messages). 100 turns = 200 messages.
-    If the list exceeds 200 messages, remove the oldest pairs until ≤ 200.
-    """
-    max_messages = MAX_TURNS * 2
-    if len(messages) <= max_messages:
-        return messages, False
+async def _store_turn(
+    owner: str, conversation_id: str, total: int, history: List[Dict], reply_parts: List[str]
+) -> None:
+    """Append the assistant reply and save the conversation's recent tail."""
+    messages = history + [{"role": "assistant", "content": [{"text": "".join(reply_parts)}]}]
+    kept, _ = prune_history(messages)
+    await conversation_store.put_async(owner, conversation_id, StoredConversation(total + 1, kept))
 
-    # Keep only the most recent max_messages entries.
-    # Ensure we start on a user message (even index from the original start).
-    pruned = messages[-max_messages:]
-    # If the first message after pruning is an assistant turn, drop it so the
-    # list always starts with a user message.
-    if pruned and pruned[0]["role"] == "assistant":
-        pruned = pruned[1:]
-    return pruned, True
 
+_chat_requests_total = metrics.counter("chat_requests_total", "POST /chat responses by HTTP status.")
 
-# ---------------------------------------------------------------------------
-# POST /chat route (Requirements 4.1, 4.2, 4.4, 4.5, 5.2, 5.5, 8.5, 8.6, 8.7)
-# ---------------------------------------------------------------------------
 
+@router.post("/chat")
+async def chat(request: ChatRequest, http_request: Request) -> Response:
+    """Accept a chat request and return a streaming SSE response.
 
-@app.post("/chat")
-async def chat(request: ChatRequest) -> StreamingResponse:
-    """Accept a chat request and return a streaming SSE response."""
+    Responds with HTTP 429 and a ``Retry-After`` header when the caller is
+    over a per-identity quota (also naming it in ``X-Quota-Limit``) or the
+    upstream concurrency limit is reached and the wait queue is full or times out,
+    and with HTTP 409 when a delta request names a conversation the server
+    does not hold, names none, or reaches a server without a conversation
+    store (the client then resends its full history).  While the
+    server is draining, every new request gets HTTP 503.
+    """
     try:
-        # Requirement 8.5 — log incoming user message at INFO
-        last_user_msg = request.messages[-1].content
-        logger.info("Incoming user message: %s", last_user_msg)
+        if drain.draining:
+            raise HTTPException(
+                status_code=503,
+                detail="Server is restarting. Please try again shortly.",
+                headers={"Retry-After": str(_DRAIN_RETRY_AFTER_SECONDS)},
+            )
+
+        # Requirement 8.5 — log incoming user message at INFO (sampled and
+        # shortened or hashed per LOG_SAMPLE_RATE / LOG_MESSAGE_BODIES)
+        log_request = log_sampled()
+        if log_request:
+            last_user_msg = request.messages[-1].content
+            logger.info("Incoming user message: %s", loggable_body(last_user_msg))
 
         # Convert Pydantic models to Bedrock's expected format:
         # {"role": "user"|"assistant", "content": [{"text": "..."}]}
-        messages_dicts = [
+        new_messages = [
             {"role": m.role, "content": [{"text": m.content}]}
             for m in request.messages
         ]
 
-        # Requirement 5.5 — apply 100-turn pruning
-        messages_dicts, was_pruned = prune_history(messages_dicts)
-        if was_pruned:
+        # Prepend the server-held history when the client sent only a delta;
+        # conversations belong to the caller that started them.  A delta the
+        # server cannot complete (no store, no id) is refused like an unknown
+        # conversation rather than answered without its context.
+        client_key = _client_key(http_request)
+        conversation_id = request.conversation_id if conversation_store else None
+        total_messages = len(new_messages)
+        full_history = new_messages
+        if request.history_length > 0:
+            stored = None
+            if conversation_id:
+                stored = await conversation_store.get_async(client_key, conversation_id)
+            if stored is None or stored.total != request.history_length:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Conversation history not found on server; resend the full history.",
+                )
+            full_history = stored.messages + new_messages
+            total_messages = stored.total + len(new_messages)
+
+        # Requirement 5.5 — apply the 100-turn cap or the token budget
+        with tracer.start_span("chat.prune_history") as span:
+            messages_dicts, was_pruned = prune_history(full_history)
+            span.set_attribute("chat.messages_in", len(full_history))
+            span.set_attribute("chat.messages_out", len(messages_dicts))
+        # The stored tail may already be shorter than the conversation
+        was_pruned = was_pruned or len(messages_dicts) < total_messages
+        if was_pruned and log_request:
             logger.info(
-                "Conversation history pruned to %d messages (100-turn cap applied).",
+                "Conversation history pruned to %d messages (%s applied).",
                 len(messages_dicts),
+                f"{HISTORY_TOKEN_BUDGET}-token budget" if HISTORY_TOKEN_BUDGET else "100-turn cap",
             )
 
         # Requirement 8.5 — log Bedrock API invocation at INFO
-        logger.info(
-            "Invoking Bedrock model %s with %d messages.",
-            bedrock_model_id,
-            len(messages_dicts),
-        )
+        if log_request:
+            logger.info(
+                "Invoking Bedrock model %s with %d messages.",
+                bedrock_model_id,
+                len(messages_dicts),
+                extra={"model": bedrock_model_id, "message_count": len(messages_dicts)},
+            )
+
+        # A cached or in-flight identical response needs no upstream slot
+        cache_key = response_cache_key(messages_dicts) if response_cache is not None else None
+        cached: Optional[Tuple[StreamEvent, ...]] = None
+        generation: Optional[SharedGeneration] = None
+        source_started = False
+        if cache_key is not None:
+            cached = await response_cache.get_async(cache_key)
+            if cached is None:
+                generation = response_cache.in_flight(cache_key)
+
+        if cached is None and generation is None:
+            # Per-identity quotas are checked before taking an upstream slot
+            try:
+                lease = await quotas.acquire_async(client_key)
+            except QuotaExceeded as exc:
+                _quota_rejections_total.inc(limit=exc.limit)
+                logger.warning("Rejecting chat request from %s: %s quota exceeded.", client_key, exc.limit)
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Usage limit reached ({exc.limit.replace('_', ' ')}).",
+                    headers={"Retry-After": str(exc.retry_after), "X-Quota-Limit": exc.limit},
+                )
+
+            # Wait for an upstream slot; the queue is bounded in size and time.
+            try:
+                with tracer.start_span("chat.admission_wait"):
+                    slot = await admission.acquire(client_key)
+            except AdmissionRejected as exc:
+                lease.release()
+                logger.warning(
+                    "Rejecting chat request (%s); %d in flight, %d queued.",
+                    exc.reason,
+                    admission.in_flight,
+                    admission.queued,
+                )
+                raise HTTPException(
+                    status_code=429,
+                    detail="Server is busy. Please try again shortly.",
+                    headers={"Retry-After": str(exc.retry_after)},
+                )
+
+            if cache_key is not None:
+                # An identical request may have started while we queued
+                generation = response_cache.in_flight(cache_key)
+            if generation is not None:
+                slot.release()
+                lease.release()
+            else:
+                # The generation holds the slot until the upstream stream ends,
+                # even if every client disconnects in the meantime.
+                source = bedrock_events(
+                    messages_dicts, functools.partial(quotas.record_tokens, client_key)
+                )
+                if SSE_COALESCE_WINDOW_MS > 0:
+                    source = coalesce_events(
+                        source, SSE_COALESCE_BYTES, SSE_COALESCE_WINDOW_MS / 1000
+                    )
+                generation = generations.start(source, client_key)
+                source_started = True
+                generation.add_done_callback(lambda _: slot.release())
+                generation.add_done_callback(lambda _: lease.release())
+                if cache_key is not None:
+                    response_cache.track(cache_key, generation)
+
+        if tracer.enabled:
+            current_span().set_attribute(
+                "chat.response_source",
+                "cache" if cached is not None else "bedrock" if source_started else "shared",
+            )
+        headers: Dict[str, str] = {}
+        if conversation_store:
+            headers["X-Conversation-Store"] = "1"
+        if generation is not None:
+            generation.owners.add(client_key)
+            headers["X-Generation-Id"] = generation.generation_id
+            events = generation.subscribe()
+        else:
+            events = _replay(cached)
 
         async def generate() -> AsyncGenerator[str, None]:
-            """Wrap stream_response, formatting SSE events."""
+            """Wrap the response events, formatting SSE events."""
             pruning_notice_sent = was_pruned
             if pruning_notice_sent:
                 # Notify the frontend that history was pruned (Requirement 5.7)
-                yield "event: pruned\ndata: Older messages have been removed from context.\n\n"
+                yield format_sse(
+                    StreamEvent("pruned", "Older messages have been removed from context.")
+                )
 
-            async for chunk in stream_response(messages_dicts):
-                yield chunk
+            reply_parts: List[str] = []
+            async for event in events:
+                if event.kind == "text":
+                    reply_parts.append(event.data)
+                elif event.kind == "done" and conversation_id:
+                    # Commit the turn before the client can send the next one
+                    await _store_turn(
+                        client_key, conversation_id, total_messages, full_history, reply_parts
+                    )
+                yield format_sse(event)
 
-        return StreamingResponse(generate(), media_type="text/event-stream")
+        _chat_requests_total.inc(status="200")
+        return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
 
+    except HTTPException as exc:
+        _chat_requests_total.inc(status=str(exc.status_code))
+        raise
     except Exception:
         # Requirement 8.7 — log full stack trace at ERROR, return HTTP 500
         logger.error(
             "Unexpected exception in /chat route:\n%s", traceback.format_exc()
         )
-        from fastapi import HTTPException
-
+        _chat_requests_total.inc(status="500")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+# ---------------------------------------------------------------------------
+# GET /chat/generations/{generation_id} — resume or attach to a generation
+# ---------------------------------------------------------------------------
+
+
+@router.get("/chat/generations/{generation_id}")
+async def resume_generation(generation_id: str, http_request: Request) -> Response:
+    """Stream a generation's events after ``Last-Event-ID`` (all events if absent).
+
+    Serves reconnects after a dropped /chat connection and extra tabs of the
+    same client, on any worker.  Returns HTTP 404 for unknown, expired or
+    foreign generations.
+    """
+    generation = await generations.get_async(generation_id)
+    if generation is None or _client_key(http_request) not in generation.owners:
+        raise HTTPException(status_code=404, detail="Generation not found.")
+
+    last_event_id = http_request.headers.get("last-event-id", "")
+    after_id = int(last_event_id) if last_event_id.isdigit() else 0
+    logger.info("Resuming generation %s after event %d.", generation_id, after_id)
+
+    async def generate() -> AsyncGenerator[str, None]:
+        async for event in generation.subscribe(after_id):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"X-Generation-Id": generation_id},
+    )
+
+
+# ---------------------------------------------------------------------------
+# GET /admin/usage — per-identity quota usage
+# ---------------------------------------------------------------------------
+
+
+def _is_admin(request: Request) -> bool:
+    """ADMIN_USERS members; without Basic Auth, nobody unless ADMIN_ALLOW_LOCALHOST
+    lets requests from this host in."""
+    user = request.scope.get("auth_user")
+    if user is not None:
+        return user in ADMIN_USERS
+    return (
+        ADMIN_ALLOW_LOCALHOST
+        and not auth_enabled
+        and request.client is not None
+        and request.client.host in ("127.0.0.1", "::1")
+    )
+
+
+@router.get("/admin/usage")
+async def admin_usage(http_request: Request) -> Dict[str, object]:
+    """Report quota limits and current usage per identity (HTTP 403 for non-admins)."""
+    if not _is_admin(http_request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {
+        "limits": {
+            "concurrent_streams": quotas.max_concurrent_streams,
+            "requests_per_minute": quotas.requests_per_minute,
+            "output_tokens_per_day": quotas.output_tokens_per_day,
+        },
+        "usage": await quotas.snapshot_async(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# POST /admin/reload and /admin/drain — change configuration, prepare restarts
+# ---------------------------------------------------------------------------
+
+
+@router.post("/admin/reload")
+async def admin_reload(http_request: Request) -> Response:
+    """Reload the configuration (HTTP 400 if invalid, 403 for non-admins).
+
+    Under ``python app.py`` with several workers, the uvicorn supervisor is
+    asked to restart them one at a time instead (HTTP 202).
+    """
+    if not _is_admin(http_request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    supervisor = os.environ.get(_SUPERVISOR_PID_ENV, "")
+    if supervisor.isdigit() and int(supervisor) == os.getppid():
+        os.kill(int(supervisor), signal.SIGHUP)
+        return JSONResponse({"restarting_workers": WORKERS}, status_code=202)
+    try:
+        return JSONResponse(await reload_config())
+    except ConfigError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/admin/drain")
+async def admin_drain_status(http_request: Request) -> Dict[str, object]:
+    """Report whether new chats are refused and how many streams are open,
+    counted over every worker."""
+    if not _is_admin(http_request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return await drain.status()
+
+
+@router.post("/admin/drain")
+async def admin_drain(http_request: Request) -> Dict[str, object]:
+    """Refuse new chats with HTTP 503 on every worker; running streams finish normally."""
+    if not _is_admin(http_request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not drain.draining:
+        logger.info("Draining: refusing new chat requests; %d streams in flight.", admission.in_flight)
+    await drain.set(True)
+    return await drain.status()
+
+
+@router.delete("/admin/drain")
+async def admin_undrain(http_request: Request) -> Dict[str, object]:
+    """Accept new chats again."""
+    if not _is_admin(http_request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if drain.draining:
+        logger.info("Drain cancelled: accepting chat requests again.")
+    await drain.set(False)
+    return await drain.status()
+
+
 # ---------------------------------------------------------------------------
 # Embedded Chat_Interface HTML/CSS/JS (Requirements 3.1–3.11, 4.3, 4.6, 4.7, 5.1, 5.3–5.7)
 # ---------------------------------------------------------------------------
@@ -365,7 +4014,7 @@ CHAT_HTML = """<!DOCTYPE html>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Bedrock Chat</title>
-    <script src="https://cdn.jsdelivr.net/npm/marked@12/marked.min.js"></script>
+    <script src="/static/marked.js"></script>
     <style>
         * { margin: 0; padding: 0; box-sizing: border-box; }
         body {
@@ -429,6 +4078,16 @@ CHAT_HTML = """<!DOCTYPE html>
             padding: 8px 14px;
             border-radius: 8px;
         }
+        .message.assistant .stream-tail {
+            white-space: pre-wrap;
+        }
+        .message.history {
+            box-sizing: border-box;
+        }
+        .message.placeholder {
+            width: 75%;
+            visibility: hidden;
+        }
         .message.assistant pre {
             background: #0d1b2a;
             padding: 10px;
@@ -543,6 +4202,153 @@ CHAT_HTML = """<!DOCTYPE html>
             setHistory(history);
         }
 
+        // --- Server-side conversation store ---
+        // When the server advertises X-Conversation-Store, only the messages
+        // it does not hold yet are sent; Server_History_Length tracks how
+        // many it has.
+        function getConversationId() {
+            let id = sessionStorage.getItem('Conversation_Id');
+            if (!id) {
+                id = (window.crypto && crypto.randomUUID)
+                    ? crypto.randomUUID()
+                    : Date.now().toString(36) + Math.random().toString(36).slice(2);
+                sessionStorage.setItem('Conversation_Id', id);
+            }
+            return id;
+        }
+
+        function getServerHistoryLength() {
+            if (sessionStorage.getItem('Conversation_Store') !== '1') return 0;
+            return parseInt(sessionStorage.getItem('Server_History_Length') || '0', 10);
+        }
+
+        function buildChatBody(history, allowDelta) {
+            const held = allowDelta ? getServerHistoryLength() : 0;
+            if (held > 0 && held < history.length) {
+                return {
+                    conversation_id: getConversationId(),
+                    history_length: held,
+                    messages: history.slice(held)
+                };
+            }
+            return { conversation_id: getConversationId(), history_length: 0, messages: history };
+        }
+
+        function resetConversation() {
+            sessionStorage.removeItem('Conversation_History');
+            sessionStorage.removeItem('Conversation_Id');
+            sessionStorage.removeItem('Server_History_Length');
+        }
+
+        // --- SSE decoding ---
+        // Stateful, event-at-a-time parser: each chunk is scanned once and
+        // only an incomplete trailing line is carried over.  Multi-line
+        // payloads arrive as several data: lines and are joined with newlines.
+        function createSseParser() {
+            let buffer = '';
+            let id = null;
+            let event = 'message';
+            let data = [];
+
+            return function push(chunk) {
+                const events = [];
+                buffer += chunk;
+                let start = 0;
+                let nl;
+                while ((nl = buffer.indexOf('\\n', start)) !== -1) {
+                    let line = buffer.slice(start, nl);
+                    start = nl + 1;
+                    if (line.endsWith('\\r')) line = line.slice(0, -1);
+                    if (line === '') {
+                        if (data.length) events.push({ id, event, data: data.join('\\n') });
+                        id = null;
+                        event = 'message';
+                        data = [];
+                        continue;
+                    }
+                    const colon = line.indexOf(':');
+                    if (colon === 0) continue;  // comment
+                    const field = colon === -1 ? line : line.slice(0, colon);
+                    let value = colon === -1 ? '' : line.slice(colon + 1);
+                    if (value.startsWith(' ')) value = value.slice(1);
+                    if (field === 'data') data.push(value);
+                    else if (field === 'event') event = value;
+                    else if (field === 'id') id = value;
+                }
+                buffer = buffer.slice(start);
+                return events;
+            };
+        }
+
+        // --- Incremental assistant rendering ---
+        // Streamed text is split at blank lines outside code fences.  Each
+        // finished block is parsed with marked once and appended; only the
+        // unfinished tail is shown as plain text, and DOM work happens at
+        // most once per animation frame.  When the answer ends it is parsed
+        // once as a whole, so reference links and lists that span blocks
+        // come out as marked renders them.  A fence only closes on a line of
+        // the opening character (``` or ~~~), at least as long as the opening.
+        function createAssistantRenderer(bubble) {
+            const blocks = document.createElement('div');
+            const tail = document.createElement('div');
+            tail.className = 'stream-tail';
+            bubble.appendChild(blocks);
+            bubble.appendChild(tail);
+
+            let text = '';
+            let committed = 0;  // text before this index is rendered as Markdown
+            let shown = 0;      // text before this index is on screen
+            let scanned = 0;    // start of the first line not yet scanned
+            let boundary = 0;   // end of the last finished block
+            let fence = '';     // opening marker of the open code fence, if any
+            let frame = 0;
+
+            function scan() {
+                let nl;
+                while ((nl = text.indexOf('\\n', scanned)) !== -1) {
+                    const line = text.slice(scanned, nl);
+                    scanned = nl + 1;
+                    const marker = /^ {0,3}(`{3,}|~{3,})/.exec(line);
+                    if (!fence) {
+                        if (marker) fence = marker[1];
+                        else if (line.trim() === '') boundary = scanned;
+                    } else if (marker && marker[1][0] === fence[0]
+                               && marker[1].length >= fence.length && line.trim() === marker[1]) {
+                        fence = '';
+                    }
+                }
+            }
+
+            function flush() {
+                frame = 0;
+                scan();
+                if (boundary > committed) {
+                    blocks.insertAdjacentHTML('beforeend', marked.parse(text.slice(committed, boundary)));
+                    committed = boundary;
+                    tail.textContent = text.slice(committed);
+                } else {
+                    tail.append(text.slice(shown));
+                }
+                shown = text.length;
+                scrollToBottom();
+            }
+
+            return {
+                append(token) {
+                    text += token;
+                    if (!frame) frame = requestAnimationFrame(flush);
+                },
+                finish() {
+                    if (frame) cancelAnimationFrame(frame);
+                    frame = 0;
+                    blocks.innerHTML = marked.parse(text);
+                    committed = shown = text.length;
+                    tail.remove();
+                    scrollToBottom();
+                }
+            };
+        }
+
         // --- UI Helpers ---
         function scrollToBottom() {
             chatContainer.scrollTop = chatContainer.scrollHeight;
@@ -574,19 +4380,92 @@ CHAT_HTML = """<!DOCTYPE html>
             if (enabled) messageInput.focus();
         }
 
+        // --- History view ---
+        // Restored history is virtualized: every message starts as an empty
+        // placeholder sized from an estimate, and an IntersectionObserver
+        // fills in only the bubbles near the viewport. Markdown is parsed the
+        // first time a bubble is shown and cached per message; bubbles that
+        // scroll far away are emptied again, keeping their measured height.
+        function createHistoryView(container, anchor) {
+            const renderedHtml = new Map();   // message index -> parsed Markdown
+            let messages = [];
+            let follow = true;                // keep the newest message in view while scrolled to the bottom
+            const observer = typeof IntersectionObserver === 'function'
+                ? new IntersectionObserver(onIntersect, { root: container, rootMargin: '800px 0px' })
+                : null;
+
+            function estimateHeight(msg) {
+                return 48 + Math.ceil(msg.content.length / 80) * 24;
+            }
+
+            function fill(div) {
+                const index = Number(div.dataset.index);
+                const msg = messages[index];
+                if (msg.role === 'assistant') {
+                    let html = renderedHtml.get(index);
+                    if (html === undefined) {
+                        html = marked.parse(msg.content);
+                        renderedHtml.set(index, html);
+                    }
+                    div.innerHTML = html;
+                } else {
+                    div.textContent = msg.content;
+                }
+                div.classList.remove('placeholder');
+                div.style.height = '';
+            }
+
+            function empty(div) {
+                div.style.height = div.offsetHeight + 'px';
+                div.classList.add('placeholder');
+                div.textContent = '';
+            }
+
+            function onIntersect(entries) {
+                for (const entry of entries) {
+                    const shown = !entry.target.classList.contains('placeholder');
+                    if (entry.isIntersecting && !shown) fill(entry.target);
+                    else if (!entry.isIntersecting && shown) empty(entry.target);
+                }
+                if (follow) container.scrollTop = container.scrollHeight;
+            }
+
+            // Follow while the view sits at the bottom, however it got there
+            // (wheel, touch, keys or scrollbar); scrolling back down resumes it
+            container.addEventListener('scroll', () => {
+                follow = container.scrollTop + container.clientHeight >= container.scrollHeight - 4;
+            }, { passive: true });
+
+            return {
+                render(history) {
+                    if (observer) observer.disconnect();
+                    renderedHtml.clear();
+                    messages = history;
+                    follow = true;
+                    const fragment = document.createDocumentFragment();
+                    history.forEach((msg, index) => {
+                        const div = document.createElement('div');
+                        div.className = 'message history placeholder ' + (msg.role === 'assistant' ? 'assistant' : 'user');
+                        div.dataset.index = String(index);
+                        div.style.height = estimateHeight(msg) + 'px';
+                        fragment.appendChild(div);
+                        if (observer) observer.observe(div);
+                        else fill(div);
+                    });
+                    container.insertBefore(fragment, anchor);
+                    container.scrollTop = container.scrollHeight;
+                }
+            };
+        }
+
+        const historyView = createHistoryView(chatContainer, loadingEl);
+
         // --- Render history on page load ---
         function renderHistory() {
             // Remove all messages except loading
             const msgs = chatContainer.querySelectorAll('.message');
             msgs.forEach(m => m.remove());
-            const history = getHistory();
-            history.forEach(msg => {
-                if (msg.role === 'assistant') {
-                    addMessageBubble('assistant', marked.parse(msg.content), true);
-                } else {
-                    addMessageBubble('user', msg.content, false);
-                }
-            });
+            historyView.render(getHistory());
         }
 
         // --- Submit Message ---
@@ -625,16 +4504,43 @@ CHAT_HTML = """<!DOCTYPE html>
             }, 30000);
 
             let assistantText = '';
-            let assistantBubble = null;
+            let renderer = null;
             let streamDone = false;
 
             try {
-                const response = await fetch('/chat', {
+                const postChat = (allowDelta) => fetch('/chat', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ messages: history }),
+                    body: JSON.stringify(buildChatBody(history, allowDelta)),
                     signal: signal
                 });
+                let response = await postChat(true);
+                if (response.status === 409) {
+                    // Server lost our conversation — resend the full history
+                    response = await postChat(false);
+                }
+                sessionStorage.setItem('Conversation_Store',
+                    response.headers.get('X-Conversation-Store') === '1' ? '1' : '0');
+
+                if (response.status === 429 || response.status === 503) {
+                    // Upstream capacity is full or the server is restarting —
+                    // the message was not processed
+                    clearTimeout(timeoutId);
+                    hideLoading();
+                    setInputEnabled(true);
+                    const retryAfter = response.headers.get('Retry-After');
+                    const quotaLimit = response.headers.get('X-Quota-Limit');
+                    addSystemMessage((quotaLimit
+                        ? 'Usage limit reached (' + quotaLimit.replace(/_/g, ' ') + '). Please try again'
+                        : 'Server is busy. Please try again') +
+                        (retryAfter ? ' in ' + retryAfter + ' seconds.' : ' shortly.'));
+                    const h = getHistory();
+                    if (h.length > 0 && h[h.length - 1].role === 'user') {
+                        h.pop();
+                        setHistory(h);
+                    }
+                    return;
+                }
 
                 if (!response.ok) {
                     clearTimeout(timeoutId);
@@ -644,47 +4550,39 @@ CHAT_HTML = """<!DOCTYPE html>
                     return;
                 }
 
-                const reader = response.body.getReader();
-                const decoder = new TextDecoder();
-                let buffer = '';
-
-                while (true) {
-                    const { done, value } = await reader.read();
-                    if (done) break;
-
-                    buffer += decoder.decode(value, { stream: true });
-                    const lines = buffer.split('\\n');
-                    buffer = lines.pop() || '';
-
-                    for (const line of lines) {
-                        if (line.startsWith('event: done')) {
-                            streamDone = true;
-                            clearTimeout(timeoutId);
-                            hideLoading();
-                            // Final Markdown render
-                            if (assistantBubble && assistantText) {
-                                assistantBubble.innerHTML = marked.parse(assistantText);
-                                scrollToBottom();
-                            }
-                            appendToHistory('assistant', assistantText);
-                            setInputEnabled(true);
-                        } else if (line.startsWith('event: error')) {
-                            // Next data: line has the error message
-                            continue;
-                        } else if (line.startsWith('event: pruned')) {
-                            // Next data: line has the pruning notice
-                            continue;
-                        } else if (line.startsWith('data: ') && !streamDone) {
-                            const token = line.slice(6);
-                            // Check if previous event was error or pruned
-                            const prevLines = lines.slice(0, lines.indexOf(line));
-                            const lastEvent = [...prevLines].reverse().find(l => l.startsWith('event:'));
-
-                            if (lastEvent && lastEvent.startsWith('event: error')) {
+                // Every event carries an id; if the connection drops before
+                // the answer is complete, resume from the server's buffer.
+                const generationId = response.headers.get('X-Generation-Id');
+                let lastEventId = '';
+                let streamFailed = false;
+
+                async function readStream(body) {
+                    const reader = body.getReader();
+                    const decoder = new TextDecoder();
+                    const parse = createSseParser();
+
+                    while (true) {
+                        const { done, value } = await reader.read();
+                        if (done) return;
+
+                        for (const evt of parse(decoder.decode(value, { stream: true }))) {
+                            if (evt.id !== null) lastEventId = evt.id;
+
+                            if (evt.event === 'done') {
+                                streamDone = true;
                                 clearTimeout(timeoutId);
                                 hideLoading();
+                                // Render whatever Markdown is still pending
+                                if (renderer) renderer.finish();
+                                appendToHistory('assistant', assistantText);
+                                sessionStorage.setItem('Server_History_Length', String(getHistory().length));
                                 setInputEnabled(true);
-                                addSystemMessage(token || 'An error occurred.');
+                            } else if (evt.event === 'error') {
+                                streamFailed = true;
+                                clearTimeout(timeoutId);
+                                hideLoading();
+                                setInputEnabled(true);
+                                addSystemMessage(evt.data || 'An error occurred.');
                                 // Remove user message from history on error
                                 const h = getHistory();
                                 if (h.length > 0 && h[h.length - 1].role === 'user') {
@@ -692,27 +4590,50 @@ CHAT_HTML = """<!DOCTYPE html>
                                     setHistory(h);
                                 }
                                 return;
-                            } else if (lastEvent && lastEvent.startsWith('event: pruned')) {
-                                addSystemMessage(token || 'Older messages removed from context.');
-                                continue;
-                            }
-
-                            // Normal token
-                            if (!firstTokenReceived) {
-                                firstTokenReceived = true;
-                                clearTimeout(timeoutId);
-                                hideLoading();
-                            }
-                            assistantText += token;
-                            if (!assistantBubble) {
-                                assistantBubble = addMessageBubble('assistant', '', false);
+                            } else if (evt.event === 'pruned') {
+                                addSystemMessage(evt.data || 'Older messages removed from context.');
+                            } else if (evt.event === 'message' && !streamDone) {
+                                // Normal token
+                                if (!firstTokenReceived) {
+                                    firstTokenReceived = true;
+                                    clearTimeout(timeoutId);
+                                    hideLoading();
+                                }
+                                assistantText += evt.data;
+                                if (!renderer) {
+                                    renderer = createAssistantRenderer(addMessageBubble('assistant', '', false));
+                                }
+                                renderer.append(evt.data);
                             }
-                            assistantBubble.textContent = assistantText;
-                            scrollToBottom();
                         }
                     }
                 }
 
+                let body = response.body;
+                for (let attempt = 1; ; attempt++) {
+                    try {
+                        if (body) await readStream(body);
+                    } catch (err) {
+                        if (err.name === 'AbortError') throw err;
+                    }
+                    if (streamDone || streamFailed || !generationId || attempt > 3) break;
+
+                    // Reconnect with Last-Event-ID instead of regenerating
+                    await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+                    body = null;
+                    try {
+                        const resumed = await fetch('/chat/generations/' + encodeURIComponent(generationId), {
+                            headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+                            signal: signal
+                        });
+                        if (resumed.status === 404) break;
+                        if (resumed.ok) body = resumed.body;
+                    } catch (err) {
+                        if (err.name === 'AbortError') throw err;
+                    }
+                }
+                if (streamFailed) return;
+
                 // If stream ended without a done event
                 if (!streamDone && assistantText) {
                     clearTimeout(timeoutId);
@@ -762,9 +4683,8 @@ CHAT_HTML = """<!DOCTYPE html>
                 abortController.abort();
                 abortController = null;
             }
-            sessionStorage.removeItem('Conversation_History');
-            const msgs = chatContainer.querySelectorAll('.message');
-            msgs.forEach(m => m.remove());
+            resetConversation();
+            renderHistory();
             hideLoading();
             setInputEnabled(true);
             messageInput.value = '';
@@ -779,16 +4699,194 @@ CHAT_HTML = """<!DOCTYPE html>
 </html>"""
 
 
+# ---------------------------------------------------------------------------
+# Precompressed static assets
+#
+# The page and the vendored marked.js never change while the process runs, so
+# each is encoded and compressed once at startup instead of per request.
+# Responses carry a strong ETag, and a matching If-None-Match gets 304.
+# ---------------------------------------------------------------------------
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into ``{coding: qvalue}``."""
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class StaticAsset:
+    """An immutable response body, stored identity, gzip and (if the optional
+    ``brotli`` package is installed) brotli encoded."""
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str) -> None:
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:20]
+        self.bodies: Dict[str, bytes] = {
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        }
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        # Each encoding is a different byte sequence, so each gets its own
+        # strong validator.
+        if encoding == "identity":
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+    def choose_encoding(self, accept_encoding: str) -> str:
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return "identity"
+
+    def not_modified(self, if_none_match: Optional[str]) -> bool:
+        """Weak comparison, as RFC 9110 requires for If-None-Match."""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or any(self.etag(e) in tags for e in self.bodies)
+
+    def response(self, request: Request) -> Response:
+        encoding = self.choose_encoding(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": self.etag(encoding),
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self.not_modified(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+
+def _read_static(name: str) -> bytes:
+    path = os.path.join(STATIC_DIR, name)
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError as exc:
+        logger.error("ERROR: Cannot read bundled asset %s: %s", path, exc)
+        sys.exit(1)
+
+
+# marked.js is requested with its content hash in the query string, so it can
+# be cached for a year; the page itself is revalidated on every load.
+MARKED_JS = StaticAsset(
+    _read_static("marked.js"),
+    "text/javascript",
+    "public, max-age=31536000, immutable",
+)
+INDEX_PAGE = StaticAsset(
+    CHAT_HTML.replace("/static/marked.js", f"/static/marked.js?v={MARKED_JS.digest}").encode("utf-8"),
+    "text/html",
+    "no-cache",
+)
+
+
 # ---------------------------------------------------------------------------
 # GET / route — serve the embedded Chat_Interface (Requirements 1.1, 1.4, 8.1, 8.4)
 # ---------------------------------------------------------------------------
 
 
-@app.get("/")
-async def index() -> HTMLResponse:
+@router.get("/")
+async def index(request: Request) -> Response:
     """Serve the embedded chat interface."""
-    return HTMLResponse(content=CHAT_HTML)
+    return INDEX_PAGE.response(request)
+
+
+@router.get("/static/marked.js")
+async def marked_js(request: Request) -> Response:
+    """Serve the vendored marked.js Markdown renderer."""
+    return MARKED_JS.response(request)
+
+
+# ---------------------------------------------------------------------------
+# GET /metrics route — Prometheus text exposition
+# ---------------------------------------------------------------------------
+
+
+@router.get("/metrics")
+async def metrics_endpoint() -> Response:
+    """Expose in-process counters and gauges in Prometheus text format."""
+    return Response(
+        content=metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
 
+# ---------------------------------------------------------------------------
+# FastAPI application instance
+# ---------------------------------------------------------------------------
+
+
+def create_app(
+    settings: Optional[RuntimeSettings] = None,
+    backend: Optional[BedrockBackend] = None,
+) -> FastAPI:
+    """Build the ASGI app: every route, plus Basic Auth and tracing if enabled.
+
+    ``uvicorn --factory app:create_app`` serves a fresh instance; ``app``
+    below is the one ``python app.py`` serves.  All instances share this
+    module's limits, caches and quotas, which are read from the environment
+    at import.
+
+    *settings* replaces the model, region, credentials and auth users read
+    from the environment, as a reload would.  *backend* answers every chat
+    instead of a boto3 client, until a reload changes the AWS settings.
+    Both apply to the whole module, so the last call wins.
+    """
+    global bedrock_client
+    if settings is not None:
+        users = load_auth_users(settings) if auth_enabled else None
+        stale = any(getattr(settings, f) != getattr(runtime_settings, f) for f in _CLIENT_FIELDS)
+        _install_settings(settings, None, users)
+        if stale:
+            with _bedrock_client_lock:
+                bedrock_client = None  # rebuilt for the new settings on first use
+    if backend is not None:
+        with _bedrock_client_lock:
+            bedrock_client = backend
+
+    application = FastAPI(lifespan=lifespan)
+    application.include_router(router)
+
+    # Conditionally register BasicAuthMiddleware (Requirement 7.1)
+    if auth_enabled:
+        application.add_middleware(
+            BasicAuthMiddleware,
+            users=auth_users,
+            cache_size=AUTH_CACHE_SIZE,
+            cache_ttl=AUTH_CACHE_TTL_SECONDS,
+        )
+
+    # Outermost, so the root span also covers authentication
+    if tracer.enabled:
+        application.add_middleware(TracingMiddleware)
+    return application
+
+
+app = create_app()
 
 # ---------------------------------------------------------------------------
 # Application entry point
@@ -796,5 +4894,32 @@ async def index() -> HTMLResponse:
 if __name__ == "__main__":
     import uvicorn
 
-    logger.info("Starting bedrock-chat-app on 0.0.0.0:3000")
-    uvicorn.run(app, host="0.0.0.0", port=3000)
+    # log_config=None sends uvicorn's access and error logs through the queue
+    # too; on shutdown, open streams get SHUTDOWN_DRAIN_SECONDS to finish.
+    server_options = {
+        "host": "0.0.0.0",
+        "port": 3000,
+        "log_config": None,
+        "timeout_graceful_shutdown": SHUTDOWN_DRAIN_SECONDS,
+    }
+    if WORKERS > 1:
+        quotas.clear_streams()
+        generations.clear()
+        drain.clear()
+        # POST /admin/reload in a worker asks this process to restart them
+        os.environ[_SUPERVISOR_PID_ENV] = str(os.getpid())
+        # Workers tell these from the .env values they inherit
+        os.environ[_PROCESS_ENV_NAMES_ENV] = json.dumps(
+            sorted(_PROCESS_ENV_NAMES | {_SUPERVISOR_PID_ENV, _PROCESS_ENV_NAMES_ENV})
+        )
+        logger.info("Starting bedrock-chat-app on 0.0.0.0:3000 with %d workers", WORKERS)
+        # Each worker imports this file as the "app" module
+        uvicorn.run(
+            "app:app",
+            app_dir=os.path.dirname(os.path.abspath(__file__)),
+            workers=WORKERS,
+            **server_options,
+        )
+    else:
+        logger.info("Starting bedrock-chat-app on 0.0.0.0:3000")
+        uvicorn.run(app, **server_options)
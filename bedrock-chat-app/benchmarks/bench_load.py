@@ -0,0 +1,476 @@
+"""
+benchmarks/bench_load.py — Load test for POST /chat against a simulated Bedrock.
+
+Starts app.py under uvicorn in a child process, answering from
+benchmarks/mock_bedrock.py, and drives it over real HTTP with an async
+client.  Each concurrency level runs closed-loop: N clients send one chat
+after another for --duration seconds.  Reported per level:
+
+  * completed requests per second, and the share rejected (429/503) or failed
+  * time to first token (request sent to first text frame), p50/p95/p99
+  * inter-token latency (gap between text frames as the browser sees them,
+    after SSE coalescing), p50/p95/p99
+
+and overall:
+
+  * the highest level before degradation: the last level whose p95 time to
+    first token is within --degradation-factor of the 1-client level and
+    whose errors stay under 1%
+  * server memory per open stream (RSS growth with --memory-streams open
+    streams, divided by their number; Linux only)
+
+Results are written as JSON (default benchmarks/results/load-<commit>.json).
+--compare checks them against an earlier file and exits 1 on regressions
+beyond --tolerance.
+
+Usage:
+    python benchmarks/bench_load.py                          # levels 1,8,32,64,128
+    python benchmarks/bench_load.py --levels 1,16 --duration 5
+    python benchmarks/bench_load.py --backend http           # boto3 -> mock HTTP server
+    python benchmarks/bench_load.py --compare benchmarks/results/load-abc1234.json
+
+--backend inprocess (default) passes MockBedrock to create_app(); --backend
+http runs the mock as an HTTP server behind BEDROCK_ENDPOINT_URL, so boto3's
+connection pool and event-stream parsing are measured too.  App settings
+such as MAX_CONCURRENT_STREAMS are taken from the environment, as usual.
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(BENCH_DIR, "..", "app.py")
+
+# Runs in the child process: app.py under uvicorn, backed by MockBedrock
+_SERVER = r"""
+import importlib.util, json, os, sys
+sys.path.insert(0, sys.argv[1])
+import mock_bedrock
+
+backend = mock_bedrock.MockBedrock(mock_bedrock.MockBedrockConfig(**json.loads(sys.argv[3])))
+if sys.argv[4] == "http":
+    mock = mock_bedrock.start_server(backend)
+    os.environ["BEDROCK_ENDPOINT_URL"] = "http://127.0.0.1:%d" % mock.server_address[1]
+spec = importlib.util.spec_from_file_location("app", sys.argv[2])
+app_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_mod)
+application = app_mod.create_app(backend=backend if sys.argv[4] == "inprocess" else None)
+
+import uvicorn
+uvicorn.run(application, host="127.0.0.1", port=int(sys.argv[5]), log_config=None, log_level="warning")
+"""
+
+# Enough for app.py to start without AWS; the rest comes from the environment
+_SERVER_ENV = {
+    "AWS_BEARER_TOKEN_BEDROCK": "bench-token",
+    "AWS_ACCESS_KEY_ID": "",
+    "AWS_SECRET_ACCESS_KEY": "",
+    "AUTH_ENABLED": "false",
+    "BEDROCK_CLIENT_INIT": "startup",
+    "LOG_SAMPLE_RATE": "0",
+}
+
+# App settings that shape the results, recorded with them
+_RECORDED_SETTINGS = (
+    "MAX_CONCURRENT_STREAMS", "MAX_QUEUED_STREAMS", "BEDROCK_STREAM_WORKERS",
+    "BEDROCK_RATE_LIMIT_MAX", "SSE_COALESCE_WINDOW_MS", "SSE_COALESCE_BYTES",
+    "RESPONSE_CACHE", "CONVERSATION_STORE", "TRACING", "LOG_FORMAT",
+)
+
+
+# Streams opened, then dropped, before the memory baseline is read.  Dropped
+# generations keep their admission slot for GENERATION_ORPHAN_TIMEOUT.
+_WARM_UP_STREAMS = 4
+
+# Numbers every chat so no two are identical and none joins another's answer
+_request_numbers = itertools.count()
+
+
+class RequestResult(NamedTuple):
+    outcome: str  # "ok", "rejected" (429/503) or "error"
+    ttft: Optional[float]  # seconds to the first text frame
+    gaps: List[float]  # seconds between consecutive text frames
+    duration: float
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated *q*-th percentile (0-100); None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _distribution_ms(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        f"p{q}": None if percentile(values, q) is None else round(percentile(values, q) * 1000, 2)
+        for q in (50, 95, 99)
+    }
+
+
+def summarize_level(concurrency: int, results: List[RequestResult], elapsed: float) -> Dict[str, object]:
+    """Per-level figures from the requests of one closed-loop run."""
+    ok = [r for r in results if r.outcome == "ok"]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "requests_per_second": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "rejected_rate": round(sum(r.outcome == "rejected" for r in results) / max(len(results), 1), 4),
+        "error_rate": round(sum(r.outcome == "error" for r in results) / max(len(results), 1), 4),
+        "ttft_ms": _distribution_ms([r.ttft for r in ok if r.ttft is not None]),
+        "inter_token_ms": _distribution_ms([gap for r in ok for gap in r.gaps]),
+        "duration_ms": _distribution_ms([r.duration for r in ok]),
+    }
+
+
+def max_concurrency_before_degradation(levels: List[Dict[str, object]], factor: float) -> Optional[int]:
+    """Highest level reached before p95 TTFT exceeds *factor* x the first level's, or 1% fail."""
+    if not levels or levels[0]["ttft_ms"]["p95"] is None:
+        return None
+    limit = levels[0]["ttft_ms"]["p95"] * factor
+    best = None
+    for level in levels:
+        p95 = level["ttft_ms"]["p95"]
+        failed = level["rejected_rate"] + level["error_rate"]
+        if p95 is None or p95 > limit or failed > 0.01:
+            break
+        best = level["concurrency"]
+    return best
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+
+async def chat_once(client: httpx.AsyncClient, first_frame: Optional[asyncio.Event] = None) -> RequestResult:
+    """Send one chat and time its text frames; sets *first_frame* on the first."""
+    body = {"messages": [{"role": "user", "content": f"Load test request {next(_request_numbers)}"}]}
+    started = time.perf_counter()
+    frames: List[float] = []
+    outcome = "ok"
+    async with client.stream("POST", "/chat", json=body) as response:
+        if response.status_code in (429, 503):
+            await response.aread()
+            return RequestResult("rejected", None, [], time.perf_counter() - started)
+        if response.status_code != 200:
+            await response.aread()
+            return RequestResult("error", None, [], time.perf_counter() - started)
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event is None:
+                frames.append(time.perf_counter())
+                if first_frame is not None and len(frames) == 1:
+                    first_frame.set()
+            elif not line:
+                if event == "error":
+                    outcome = "error"
+                event = None
+    duration = time.perf_counter() - started
+    if not frames:
+        outcome = "error"
+    return RequestResult(
+        outcome,
+        frames[0] - started if frames else None,
+        [b - a for a, b in zip(frames, frames[1:])],
+        duration,
+    )
+
+
+def _client(base_url: str, connections: int) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(120.0),
+        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+    )
+
+
+async def run_level(base_url: str, concurrency: int, duration: float) -> Dict[str, object]:
+    """*concurrency* clients sending chats back to back for *duration* seconds."""
+    results: List[RequestResult] = []
+
+    async def _user(client: httpx.AsyncClient, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            try:
+                results.append(await chat_once(client))
+            except httpx.HTTPError:
+                results.append(RequestResult("error", None, [], 0.0))
+
+    async with _client(base_url, concurrency) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(_user(client, deadline) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize_level(concurrency, results, elapsed)
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of *pid*, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def _hold_streams(client: httpx.AsyncClient, count: int) -> List[asyncio.Task]:
+    """Open *count* chats and return their tasks once each has sent a text frame."""
+    started = [asyncio.Event() for _ in range(count)]
+    tasks = [asyncio.create_task(chat_once(client, event)) for event in started]
+    try:
+        await asyncio.wait_for(asyncio.gather(*(e.wait() for e in started)), timeout=60)
+    except BaseException:
+        await _close_streams(tasks)
+        raise
+    return tasks
+
+
+async def _close_streams(tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def measure_stream_memory(base_url: str, pid: int, streams: int) -> Optional[Dict[str, object]]:
+    """Server RSS growth while *streams* chats are open at once.
+
+    The server should answer slowly enough that no stream ends meanwhile.
+    """
+    # Warm up lazy imports, the Bedrock client and the worker threads
+    async with _client(base_url, _WARM_UP_STREAMS) as client:
+        await _close_streams(await _hold_streams(client, _WARM_UP_STREAMS))
+    idle = rss_bytes(pid)
+    if idle is None:
+        return None
+    async with _client(base_url, streams) as client:
+        tasks = await _hold_streams(client, streams)
+        busy = rss_bytes(pid)
+        await _close_streams(tasks)
+    return {
+        "open_streams": streams,
+        "idle_rss_mb": round(idle / 2**20, 1),
+        "busy_rss_mb": round(busy / 2**20, 1),
+        "kb_per_stream": round((busy - idle) / streams / 1024, 1),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Server process
+# ---------------------------------------------------------------------------
+
+
+class _Server:
+    """app.py in a child process on a free local port."""
+
+    def __init__(self, mock_config: Dict[str, object], backend: str, extra_env: Dict[str, str]) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self._log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", _SERVER, BENCH_DIR, APP_PATH, json.dumps(mock_config), backend, str(port)],
+            env={**os.environ, **_SERVER_ENV, **extra_env},
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+
+    def wait_ready(self, timeout: float = 60.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if httpx.get(self.url + "/metrics", timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        self._log.seek(0)
+        raise RuntimeError("app.py did not start:\n" + self._log.read().decode(errors="replace")[-4000:])
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def compare(baseline: Dict[str, object], current: Dict[str, object], tolerance: float) -> List[str]:
+    """Regressions of *current* against *baseline*, worse by more than *tolerance*."""
+    regressions = []
+
+    def _check(name: str, old: Optional[float], new: Optional[float], higher_is_better: bool) -> None:
+        if old is None or new is None or old == 0:
+            return
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {old} -> {new} ({change:+.0%})")
+
+    old_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in current["levels"]:
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        c = level["concurrency"]
+        _check(f"c={c} requests_per_second", old["requests_per_second"], level["requests_per_second"], True)
+        _check(f"c={c} ttft_ms.p95", old["ttft_ms"]["p95"], level["ttft_ms"]["p95"], False)
+        _check(f"c={c} inter_token_ms.p95", old["inter_token_ms"]["p95"], level["inter_token_ms"]["p95"], False)
+    if set(old_levels) == {level["concurrency"] for level in current["levels"]}:
+        # Only comparable when both runs tried the same levels
+        _check(
+            "max_concurrency_before_degradation",
+            baseline.get("max_concurrency_before_degradation"),
+            current.get("max_concurrency_before_degradation"),
+            True,
+        )
+    old_memory, new_memory = baseline.get("memory") or {}, current.get("memory") or {}
+    _check("memory.kb_per_stream", old_memory.get("kb_per_stream"), new_memory.get("kb_per_stream"), False)
+    return regressions
+
+
+def _print_summary(result: Dict[str, object]) -> None:
+    print(f"{'clients':>7} {'req/s':>8} {'fail%':>6} {'ttft p50':>9} {'p95':>8} {'p99':>8} "
+          f"{'itl p50':>8} {'p95':>7} {'p99':>7}   (ms)")
+    for level in result["levels"]:
+        ttft, itl = level["ttft_ms"], level["inter_token_ms"]
+        fields = [ttft["p50"], ttft["p95"], ttft["p99"], itl["p50"], itl["p95"], itl["p99"]]
+        cells = ["-" if v is None else f"{v:.1f}" for v in fields]
+        failed = (level["rejected_rate"] + level["error_rate"]) * 100
+        print(f"{level['concurrency']:>7} {level['requests_per_second']:>8.1f} {failed:>6.1f} "
+              f"{cells[0]:>9} {cells[1]:>8} {cells[2]:>8} {cells[3]:>8} {cells[4]:>7} {cells[5]:>7}")
+    print(f"max concurrency before degradation: {result['max_concurrency_before_degradation']}")
+    if result["memory"]:
+        memory = result["memory"]
+        print(f"memory: {memory['kb_per_stream']} KB per open stream "
+              f"({memory['idle_rss_mb']} -> {memory['busy_rss_mb']} MB with {memory['open_streams']} streams)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,8,32,64,128", help="comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level (default 10)")
+    parser.add_argument("--backend", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="mock time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="mock token rate")
+    parser.add_argument("--output-tokens", type=int, default=50, help="mock tokens per answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock share of failing calls")
+    parser.add_argument("--memory-streams", type=int, default=100,
+                        help="open streams for the memory measurement; 0 skips it")
+    parser.add_argument("--degradation-factor", type=float, default=2.0,
+                        help="p95 TTFT growth over 1 client that counts as degraded")
+    parser.add_argument("--output", help="JSON file (default benchmarks/results/load-<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier JSON result to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed regression (default 0.1 = 10%%)")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    mock_config = {
+        "ttft": args.ttft_ms / 1000,
+        "tokens_per_second": args.tokens_per_second,
+        "output_tokens": args.output_tokens,
+        "error_rate": args.error_rate,
+        "seed": 1,
+    }
+
+    server = _Server(mock_config, args.backend, {})
+    try:
+        server.wait_ready()
+        results = []
+        for concurrency in levels:
+            results.append(asyncio.run(run_level(server.url, concurrency, args.duration)))
+            print(f"  {concurrency} clients: {results[-1]['requests_per_second']} req/s", file=sys.stderr)
+    finally:
+        server.stop()
+
+    memory = None
+    if args.memory_streams:
+        # Long, slow answers so every stream stays open while RSS is read
+        slow = {**mock_config, "ttft": 0.0, "tokens_per_second": 1.0, "output_tokens": 120, "error_rate": 0.0}
+        limit = str(args.memory_streams + _WARM_UP_STREAMS)
+        server = _Server(slow, args.backend, {"MAX_CONCURRENT_STREAMS": limit, "BEDROCK_RATE_LIMIT_MAX": limit})
+        try:
+            server.wait_ready()
+            memory = asyncio.run(measure_stream_memory(server.url, server.process.pid, args.memory_streams))
+        finally:
+            server.stop()
+
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    result = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "backend": args.backend,
+        "duration_seconds": args.duration,
+        "mock": mock_config,
+        "settings": {name: os.environ[name] for name in _RECORDED_SETTINGS if name in os.environ},
+        "levels": results,
+        "max_concurrency_before_degradation": max_concurrency_before_degradation(
+            results, args.degradation_factor
+        ),
+        "memory": memory,
+    }
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"load-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    _print_summary(result)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.tolerance)
+        for key in ("backend", "mock", "settings", "duration_seconds"):
+            if baseline.get(key) != result[key]:
+                print(f"note: {key} differs from the baseline: {baseline.get(key)} -> {result[key]}")
+        print(f"compared with {baseline['commit']}: {len(regressions) or 'no'} regressions")
+        for line in regressions:
+            print(f"  REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
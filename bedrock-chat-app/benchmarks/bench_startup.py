@@ -0,0 +1,139 @@
+"""
+benchmarks/bench_startup.py — Cold-start timings for app.py.
+
+Each sample is a fresh Python process that:
+  1. imports app.py (the work done before uvicorn can bind),
+  2. serves its first request (GET / through the ASGI app, in process),
+  3. builds the Bedrock client (boto3 import + client), unless the import
+     already did.
+
+No AWS call is made: the client is only constructed, never used.
+
+Usage:
+    python benchmarks/bench_startup.py                 # lazy vs import, 10 runs each
+    python benchmarks/bench_startup.py --runs 20 --json
+    python benchmarks/bench_startup.py --max-import-ms 900   # exit 1 if slower
+
+Compare ``BEDROCK_CLIENT_INIT=lazy`` (what ``startup`` does before its
+background warm-up) with ``import`` (the old eager behaviour).  Use
+``--max-import-ms`` in CI to keep the lazy import time from creeping back up.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app.py")
+
+# Runs in the child process; prints one "BENCH {...}" line
+_CHILD = r"""
+import importlib.util, json, sys, time
+
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("app", sys.argv[1])
+app_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_mod)
+imported = time.perf_counter()
+
+from fastapi.testclient import TestClient
+
+client = TestClient(app_mod.app)
+status = client.get("/").status_code
+first_request = time.perf_counter()
+
+already_built = app_mod.bedrock_client is not None
+app_mod.get_bedrock_client()
+client_ready = time.perf_counter()
+
+print("BENCH " + json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (first_request - imported) * 1000,
+    "client_ms": 0.0 if already_built else (client_ready - first_request) * 1000,
+    "boto3_at_import": already_built,
+    "status": status,
+}))
+"""
+
+# Enough for app.py to start without touching AWS
+_ENV = {
+    "AWS_BEARER_TOKEN_BEDROCK": "bench-token",
+    "AWS_ACCESS_KEY_ID": "",
+    "AWS_SECRET_ACCESS_KEY": "",
+    "AWS_REGION": "us-east-1",
+    "AUTH_ENABLED": "false",
+    "LOG_SAMPLE_RATE": "0",
+}
+
+
+def sample(mode: str) -> dict:
+    """Time one cold start with BEDROCK_CLIENT_INIT=*mode*."""
+    env = {**os.environ, **_ENV, "BEDROCK_CLIENT_INIT": mode}
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD, APP_PATH],
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith("BENCH "):
+            return json.loads(line[len("BENCH "):])
+    raise RuntimeError(f"app.py failed to start ({mode}):\n{result.stdout}\n{result.stderr}")
+
+
+def summarize(samples: list) -> dict:
+    summary = {}
+    for key in ("import_ms", "first_request_ms", "client_ms"):
+        values = sorted(s[key] for s in samples)
+        summary[key] = {
+            "median": statistics.median(values),
+            "p90": values[min(len(values) - 1, int(len(values) * 0.9))],
+        }
+    summary["total_ms"] = {
+        "median": statistics.median(s["import_ms"] + s["first_request_ms"] + s["client_ms"] for s in samples)
+    }
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="cold starts per mode (default 10)")
+    parser.add_argument("--modes", default="lazy,import", help="comma-separated BEDROCK_CLIENT_INIT values")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument(
+        "--max-import-ms", type=float, default=0,
+        help="exit 1 if the median lazy import takes longer than this",
+    )
+    args = parser.parse_args()
+
+    sample(args.modes.split(",")[0])  # warm the OS file cache and .pyc files
+    results = {}
+    for mode in args.modes.split(","):
+        results[mode] = summarize([sample(mode) for _ in range(args.runs)])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'mode':<8} {'import':>10} {'1st request':>12} {'client':>10} {'total':>10}   (median ms)")
+        for mode, summary in results.items():
+            print(
+                f"{mode:<8} {summary['import_ms']['median']:>10.1f} "
+                f"{summary['first_request_ms']['median']:>12.1f} "
+                f"{summary['client_ms']['median']:>10.1f} {summary['total_ms']['median']:>10.1f}"
+            )
+
+    lazy = results.get("lazy")
+    if args.max_import_ms and lazy and lazy["import_ms"]["median"] > args.max_import_ms:
+        print(
+            f"FAIL: median lazy import {lazy['import_ms']['median']:.1f} ms > {args.max_import_ms:.1f} ms",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
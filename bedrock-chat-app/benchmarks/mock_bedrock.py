@@ -0,0 +1,330 @@
+"""
+benchmarks/mock_bedrock.py — Offline stand-in for Bedrock's ConverseStream.
+
+Answers with made-up text at a configurable time to first token and token
+rate, and can inject errors and throttling.  Two ways to use it:
+
+  * In process, as the app's backend (no HTTP between the app and "Bedrock"):
+
+        import app, mock_bedrock
+        asgi_app = app.create_app(backend=mock_bedrock.MockBedrock(ttft=0.3))
+
+  * As an HTTP server that speaks the bedrock-runtime protocol, so the real
+    boto3 client, its connection pool and event-stream parsing are exercised:
+
+        python benchmarks/mock_bedrock.py --port 8900 --ttft-ms 300 --tokens-per-second 60
+        BEDROCK_ENDPOINT_URL=http://127.0.0.1:8900 python app.py
+
+Only the standard library and botocore (already an app dependency) are used.
+No AWS account or network access is needed; credentials are not checked.
+"""
+
+import argparse
+import binascii
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, NamedTuple, Optional
+
+from botocore.exceptions import ClientError
+
+
+class MockBedrockConfig(NamedTuple):
+    """How the mock answers; rates of 0 turn a behaviour off."""
+
+    ttft: float = 0.2  # seconds from the call to the first token
+    tokens_per_second: float = 50.0  # 0 sends all tokens at once
+    output_tokens: int = 100  # tokens per answer
+    error_rate: float = 0.0  # share of calls failing before the stream
+    error_code: str = "ServiceUnavailableException"
+    mid_stream_error_rate: float = 0.0  # share of streams failing halfway
+    max_concurrent: int = 0  # open streams before ThrottlingException
+    requests_per_second: float = 0.0  # sustained calls (bursts of at least 1) before ThrottlingException
+    seed: Optional[int] = None
+
+
+# HTTP status Bedrock uses for each error code
+_ERROR_STATUS = {
+    "ThrottlingException": 429,
+    "ServiceUnavailableException": 503,
+    "InternalServerException": 500,
+    "ModelNotReadyException": 429,
+    "ModelTimeoutException": 408,
+    "ValidationException": 400,
+    "AccessDeniedException": 403,
+    "UnauthorizedException": 401,
+}
+
+_WORDS = (
+    "the quick brown fox jumps over a lazy dog while streaming tokens arrive "
+    "one by one from a model that never existed"
+).split()
+
+
+def _client_error(code: str, message: str) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": code, "Message": message},
+         "ResponseMetadata": {"HTTPStatusCode": _ERROR_STATUS.get(code, 400)}},
+        "ConverseStream",
+    )
+
+
+class _MockStream:
+    """The ``stream`` of a mock answer; frees its concurrency slot once, however it ends."""
+
+    def __init__(self, backend: "MockBedrock", input_tokens: int, fail_midway: bool) -> None:
+        self._backend = backend
+        self._released = False
+        self._events = backend._events(input_tokens, fail_midway, self._release)
+
+    def _release(self) -> None:
+        with self._backend._lock:
+            if not self._released:
+                self._released = True
+                self._backend.active -= 1
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self._events
+
+    def close(self) -> None:
+        self._events.close()
+        self._release()
+
+
+class MockBedrock:
+    """A BedrockBackend that makes up its answers; safe to call from many threads."""
+
+    def __init__(self, config: Optional[MockBedrockConfig] = None, **overrides) -> None:
+        self.config = (config or MockBedrockConfig())._replace(**overrides)
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._burst = max(1.0, self.config.requests_per_second)
+        self._tokens = self._burst
+        self._refilled = time.monotonic()
+        self.active = 0
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def _admit(self) -> Optional[str]:
+        """Count a call; return an error code if it must fail."""
+        cfg = self.config
+        with self._lock:
+            self.calls += 1
+            if cfg.requests_per_second:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._burst,
+                    self._tokens + (now - self._refilled) * cfg.requests_per_second,
+                )
+                self._refilled = now
+                if self._tokens < 1:
+                    self.throttled += 1
+                    return "ThrottlingException"
+                self._tokens -= 1
+            if cfg.max_concurrent and self.active >= cfg.max_concurrent:
+                self.throttled += 1
+                return "ThrottlingException"
+            if cfg.error_rate and self._random.random() < cfg.error_rate:
+                self.errors += 1
+                return cfg.error_code
+            self.active += 1
+            return None
+
+    def converse_stream(self, **kwargs) -> Dict:
+        code = self._admit()
+        if code is not None:
+            raise _client_error(code, f"Mock {code}")
+        with self._lock:
+            fail_midway = bool(
+                self.config.mid_stream_error_rate
+                and self._random.random() < self.config.mid_stream_error_rate
+            )
+        input_tokens = sum(
+            len(block.get("text", "")) // 4 + 1
+            for message in kwargs.get("messages", [])
+            for block in message.get("content", [])
+        )
+        return {"stream": _MockStream(self, input_tokens, fail_midway)}
+
+    def _events(self, input_tokens: int, fail_midway: bool, release) -> Iterator[Dict]:
+        cfg = self.config
+        started = time.monotonic()
+        try:
+            yield {"messageStart": {"role": "assistant"}}
+            for i in range(cfg.output_tokens):
+                due = started + cfg.ttft + (i / cfg.tokens_per_second if cfg.tokens_per_second else 0.0)
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if fail_midway and i == cfg.output_tokens // 2:
+                    with self._lock:
+                        self.errors += 1
+                    raise _client_error("modelStreamErrorException", "Mock stream error")
+                text = _WORDS[i % len(_WORDS)] + " "
+                yield {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": text}}}
+            yield {"contentBlockStop": {"contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            yield {"metadata": {
+                "usage": {
+                    "inputTokens": input_tokens,
+                    "outputTokens": cfg.output_tokens,
+                    "totalTokens": input_tokens + cfg.output_tokens,
+                },
+                "metrics": {"latencyMs": int((time.monotonic() - started) * 1000)},
+            }}
+        finally:
+            release()
+
+
+# ---------------------------------------------------------------------------
+# HTTP server
+# ---------------------------------------------------------------------------
+# ConverseStream answers with application/vnd.amazon.eventstream: binary
+# frames of prelude (total and header length, CRC32), string headers naming
+# the event, a JSON payload and a CRC32 of the whole frame.
+
+
+def _encode_header(name: str, value: str) -> bytes:
+    raw_name, raw_value = name.encode(), value.encode()
+    return (
+        struct.pack("!B", len(raw_name)) + raw_name
+        + b"\x07" + struct.pack("!H", len(raw_value)) + raw_value
+    )
+
+
+def encode_event_frame(headers: Dict[str, str], payload: bytes) -> bytes:
+    """One event-stream frame with string *headers* and *payload*."""
+    encoded = b"".join(_encode_header(name, value) for name, value in headers.items())
+    prelude = struct.pack("!II", 16 + len(encoded) + len(payload), len(encoded))
+    frame = prelude + struct.pack("!I", binascii.crc32(prelude)) + encoded + payload
+    return frame + struct.pack("!I", binascii.crc32(frame))
+
+
+def _event_frame(event: Dict) -> bytes:
+    (event_type, body), = event.items()
+    headers = {":event-type": event_type, ":content-type": "application/json", ":message-type": "event"}
+    return encode_event_frame(headers, json.dumps(body).encode())
+
+
+def _exception_frame(code: str, message: str) -> bytes:
+    headers = {":exception-type": code, ":content-type": "application/json", ":message-type": "exception"}
+    return encode_event_frame(headers, json.dumps({"message": message}).encode())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as boto3's connection pool expects
+    backend: MockBedrock  # set on the subclass made by start_server
+    verbose = False
+
+    def log_message(self, format, *args) -> None:  # noqa: A002 — BaseHTTPRequestHandler's name
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: Dict, error_code: str = "") -> None:
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        if error_code:
+            self.send_header("x-amzn-ErrorType", error_code)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "model" or parts[2] != "converse-stream":
+            self._send_json(404, {"message": f"Unknown operation {self.path}"}, "UnknownOperationException")
+            return
+        try:
+            request = json.loads(body or b"{}")
+            response = self.backend.converse_stream(modelId=urllib.parse.unquote(parts[1]), **request)
+        except ClientError as exc:
+            error = exc.response["Error"]
+            self._send_json(_ERROR_STATUS.get(error["Code"], 400), {"message": error["Message"]}, error["Code"])
+            return
+        except ValueError as exc:
+            self._send_json(400, {"message": str(exc)}, "ValidationException")
+            return
+
+        stream = response["stream"]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            try:
+                for event in stream:
+                    self._write_chunk(_event_frame(event))
+            except ClientError as exc:
+                error = exc.response["Error"]
+                self._write_chunk(_exception_frame(error["Code"], error["Message"]))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            stream.close()
+
+
+def start_server(backend: MockBedrock, host: str = "127.0.0.1", port: int = 0,
+                 verbose: bool = False) -> ThreadingHTTPServer:
+    """Serve *backend* from a daemon thread; ``server_address`` has the port."""
+    handler = type("MockBedrockHandler", (_Handler,), {"backend": backend, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-bedrock", daemon=True).start()
+    return server
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = MockBedrockConfig()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft * 1000, help="time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--output-tokens", type=int, default=defaults.output_tokens, help="tokens per answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls that fail at once")
+    parser.add_argument("--error-code", default=defaults.error_code)
+    parser.add_argument("--mid-stream-error-rate", type=float, default=0.0,
+                        help="share of streams that fail halfway")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="throttle beyond this many open streams")
+    parser.add_argument("--requests-per-second", type=float, default=0.0, help="throttle beyond this call rate")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    backend = MockBedrock(MockBedrockConfig(
+        ttft=args.ttft_ms / 1000,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        error_code=args.error_code,
+        mid_stream_error_rate=args.mid_stream_error_rate,
+        max_concurrent=args.max_concurrent,
+        requests_per_second=args.requests_per_second,
+        seed=args.seed,
+    ))
+    server = start_server(backend, args.host, args.port, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Mock Bedrock on http://{host}:{port} — set BEDROCK_ENDPOINT_URL=http://{host}:{port}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,6 @@
 # conftest.py — shared pytest fixtures and configuration for the bedrock-chat-app test suite
+import os
+
+# The tests load app.py with boto3.client patched to return a mock, so the
+# Bedrock client must be built during that import rather than on first use.
+os.environ.setdefault("BEDROCK_CLIENT_INIT", "import")
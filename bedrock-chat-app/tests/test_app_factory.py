@@ -0,0 +1,261 @@
+"""
+tests/test_app_factory.py — Tests for create_app(settings, backend) and the
+offline mock Bedrock in benchmarks/mock_bedrock.py.
+
+Tests cover:
+  - create_app(backend=...) answers chats without boto3
+  - BedrockBackend is a Protocol: boto3 clients and MockBedrock satisfy it
+    without subclassing
+  - create_app(settings=...) replaces the model, auth users and client
+  - The mock's time to first token, errors and throttling reach the client
+    as they would from Bedrock
+  - The mock HTTP server works with the real boto3 client via
+    BEDROCK_ENDPOINT_URL; its event-stream frames parse with botocore
+"""
+
+import importlib.util
+import json
+import os
+import time
+import unittest.mock
+
+from botocore.eventstream import EventStreamBuffer
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+MOCK_PATH = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "mock_bedrock.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_ACCESS_KEY_ID": "",
+        "AWS_SECRET_ACCESS_KEY": "",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        "SSE_COALESCE_WINDOW_MS": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_factory_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _load_mock_bedrock():
+    spec = importlib.util.spec_from_file_location("mock_bedrock_test", MOCK_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _texts(response_text):
+    return [line[len("data: "):] for line in response_text.splitlines() if line.startswith("data: ") and line != "data: "]
+
+
+MOCK = _load_mock_bedrock()
+APP = _load_app_module()
+
+
+# ---------------------------------------------------------------------------
+# create_app(settings, backend)
+# ---------------------------------------------------------------------------
+
+
+def test_backend_answers_without_boto3():
+    app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy"})
+    backend = MOCK.MockBedrock(ttft=0, tokens_per_second=0, output_tokens=3)
+
+    with unittest.mock.patch("boto3.client", side_effect=AssertionError("boto3 used")):
+        with TestClient(app_mod.create_app(backend=backend)) as client:
+            response = client.post("/chat", json=CHAT_BODY)
+
+    assert _texts(response.text) == ["the ", "quick ", "brown "]
+    assert "event: done" in response.text
+    assert backend.calls == 1 and backend.active == 0
+    assert app_mod._output_tokens_total.value() == 3
+
+
+def test_backends_satisfy_the_protocol_structurally():
+    app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy"})
+
+    boto3_client = app_mod.build_bedrock_client(app_mod.runtime_settings)
+
+    assert isinstance(boto3_client, app_mod.BedrockBackend)
+    assert isinstance(MOCK.MockBedrock(), app_mod.BedrockBackend)
+    assert app_mod.BedrockBackend not in type(MOCK.MockBedrock()).__mro__
+    assert not isinstance(object(), app_mod.BedrockBackend)
+
+
+def test_settings_replace_model_and_users():
+    env = {"AUTH_ENABLED": "true", "AUTH_USERNAME": "alice", "AUTH_PASSWORD": "old"}
+    app_mod = _load_app_module(extra_env=env)
+    backend = unittest.mock.Mock(wraps=MOCK.MockBedrock(ttft=0, output_tokens=1))
+    new = app_mod.read_runtime_settings(
+        {**env, "AWS_BEARER_TOKEN_BEDROCK": "t", "AUTH_PASSWORD": "new", "BEDROCK_MODEL_ID": "mock-model"},
+        auth_enabled=True,
+    )
+
+    client = TestClient(app_mod.create_app(new, backend))
+
+    assert client.post("/chat", json=CHAT_BODY, auth=("alice", "old")).status_code == 401
+    assert client.post("/chat", json=CHAT_BODY, auth=("alice", "new")).status_code == 200
+    assert backend.converse_stream.call_args.kwargs["modelId"] == "mock-model"
+    assert app_mod.bedrock_model_id == "mock-model"
+
+
+def test_new_aws_settings_drop_the_built_client():
+    app_mod = _load_app_module()
+    assert app_mod.bedrock_client is not None
+    same = app_mod.runtime_settings._replace(bedrock_model_id="other-model")
+    moved = app_mod.runtime_settings._replace(aws_region="eu-west-1")
+
+    app_mod.create_app(same)
+    kept = app_mod.bedrock_client
+    app_mod.create_app(moved)
+
+    assert kept is not None
+    assert app_mod.bedrock_client is None
+    assert app_mod.aws_region == "eu-west-1"
+
+
+# ---------------------------------------------------------------------------
+# MockBedrock behaviour through /chat
+# ---------------------------------------------------------------------------
+
+
+def test_time_to_first_token_and_token_rate():
+    backend = MOCK.MockBedrock(ttft=0.2, tokens_per_second=50, output_tokens=6)
+    started = time.monotonic()
+    events = list(backend.converse_stream(messages=[])["stream"])
+    elapsed = time.monotonic() - started
+
+    assert [next(iter(e)) for e in events] == (
+        ["messageStart"] + ["contentBlockDelta"] * 6 + ["contentBlockStop", "messageStop", "metadata"]
+    )
+    assert 0.2 + 5 / 50 <= elapsed < 0.2 + 5 / 50 + 0.2
+    assert events[-1]["metadata"]["usage"]["outputTokens"] == 6
+
+
+def test_injected_errors_reach_the_client():
+    app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy"})
+
+    failing = TestClient(app_mod.create_app(backend=MOCK.MockBedrock(error_rate=1.0)))
+    before = failing.post("/chat", json=CHAT_BODY).text
+    midway = TestClient(app_mod.create_app(
+        backend=MOCK.MockBedrock(ttft=0, mid_stream_error_rate=1.0, output_tokens=4)
+    )).post("/chat", json=CHAT_BODY).text
+
+    assert "event: error" in before and "Mock ServiceUnavailableException" in before
+    assert _texts(midway)[:2] == ["the ", "quick "]
+    assert "event: error" in midway and "Mock stream error" in midway
+    assert app_mod._bedrock_errors_total.value(code="ServiceUnavailableException") == 1
+    assert app_mod._bedrock_errors_total.value(code="ModelStreamErrorException") == 1
+
+
+def test_throttling_is_retried_then_reported():
+    app_mod = _load_app_module(extra_env={
+        "BEDROCK_CLIENT_INIT": "lazy", "BEDROCK_MAX_RETRIES": "3",
+        "BEDROCK_RETRY_BASE_DELAY": "0.05", "BEDROCK_RETRY_MAX_DELAY": "0.1",
+    })
+    backend = MOCK.MockBedrock(ttft=0, output_tokens=1, requests_per_second=0.2)
+
+    with TestClient(app_mod.create_app(backend=backend)) as client:
+        first = client.post("/chat", json=CHAT_BODY)
+        second = client.post("/chat", json=CHAT_BODY)
+
+    assert "event: done" in first.text
+    assert "Request throttled" in second.text
+    assert backend.throttled == 4
+    assert app_mod._throttles_total.value() == backend.throttled
+
+
+@settings(max_examples=50, deadline=None)
+@given(
+    max_concurrent=st.integers(min_value=1, max_value=4),
+    actions=st.lists(st.sampled_from(["open", "finish", "close"]), max_size=30),
+)
+def test_concurrency_throttle_holds(max_concurrent, actions):
+    backend = MOCK.MockBedrock(ttft=0, output_tokens=2, max_concurrent=max_concurrent)
+    open_streams, throttled = [], 0
+
+    for action in actions:
+        if action == "open":
+            try:
+                open_streams.append(backend.converse_stream(messages=[])["stream"])
+            except MOCK.ClientError as exc:
+                assert exc.response["Error"]["Code"] == "ThrottlingException"
+                assert len(open_streams) == max_concurrent
+                throttled += 1
+        elif open_streams:
+            stream = open_streams.pop(0)
+            if action == "finish":
+                list(stream)
+            stream.close()
+            stream.close()
+        assert backend.active == len(open_streams) <= max_concurrent
+
+    assert backend.throttled == throttled
+
+
+# ---------------------------------------------------------------------------
+# Mock HTTP server and BEDROCK_ENDPOINT_URL
+# ---------------------------------------------------------------------------
+
+
+def test_real_boto3_client_streams_from_the_mock_server():
+    backend = MOCK.MockBedrock(ttft=0, tokens_per_second=0, output_tokens=5)
+    server = MOCK.start_server(backend)
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+    try:
+        app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy", "BEDROCK_ENDPOINT_URL": url})
+        client = TestClient(app_mod.app)
+        answered = client.post("/chat", json=CHAT_BODY)
+        backend.config = backend.config._replace(error_rate=1.0, error_code="ValidationException")
+        rejected = client.post("/chat", json=CHAT_BODY)
+    finally:
+        server.shutdown()
+
+    assert _texts(answered.text) == ["the ", "quick ", "brown ", "fox ", "jumps "]
+    assert "event: done" in answered.text
+    assert "Bedrock service error: Mock ValidationException" in rejected.text
+    assert app_mod.bedrock_client.meta.endpoint_url == url
+    assert backend.calls == 2 and backend.active == 0
+
+
+@settings(max_examples=100, deadline=None)
+@given(
+    headers=st.dictionaries(
+        st.text(min_size=1, max_size=20).filter(lambda s: len(s.encode()) < 256),
+        st.text(max_size=40),
+        max_size=4,
+    ),
+    body=st.dictionaries(st.text(max_size=10), st.text(max_size=30), max_size=4),
+)
+def test_event_frames_parse_with_botocore(headers, body):
+    payload = json.dumps(body).encode()
+    buffer = EventStreamBuffer()
+    frame = MOCK.encode_event_frame(headers, payload)
+
+    buffer.add_data(frame[:7])
+    buffer.add_data(frame[7:])
+    message, = list(buffer)
+
+    assert message.headers == headers
+    assert json.loads(message.payload) == body
@@ -4,13 +4,21 @@ tests/test_auth.py — Unit and property tests for BasicAuthMiddleware in app.py
 Tests cover:
   - Task 6.3: Unit tests for auth middleware
   - Property 9: Auth middleware rejects any request without valid credentials
+  - Pure ASGI middleware: streams pass straight through, verified headers
+    are cached in a bounded TTL cache, failures are never cached
+  - AUTH_USERS_FILE: several users with scrypt / PBKDF2 password hashes
 
 Requirements: 7.1, 7.3, 7.4
 """
 
+import asyncio
 import base64
 import importlib.util
 import os
+import subprocess
+import sys
+import threading
+import time
 import unittest.mock
 
 import pytest
@@ -28,7 +36,7 @@ CONFIGURED_USERNAME = "admin"
 CONFIGURED_PASSWORD = "s3cret!"
 
 
-def _load_app_with_auth(auth_enabled: bool = True, username: str = CONFIGURED_USERNAME, password: str = CONFIGURED_PASSWORD):
+def _load_app_with_auth(auth_enabled: bool = True, username: str = CONFIGURED_USERNAME, password: str = CONFIGURED_PASSWORD, extra_env=None):
     """Import app.py with auth enabled or disabled.
 
     Returns the loaded module.
@@ -43,6 +51,7 @@ def _load_app_with_auth(auth_enabled: bool = True, username: str = CONFIGURED_US
         "AUTH_ENABLED": "true" if auth_enabled else "false",
         "AUTH_USERNAME": username,
         "AUTH_PASSWORD": password,
+        **(extra_env or {}),
     }
     with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
         with unittest.mock.patch("boto3.client", return_value=mock_client):
@@ -234,3 +243,312 @@ def test_property9_invalid_credentials_rejected(username, password):
         f"Expected 'Basic realm=\"Bedrock Chat\"' in WWW-Authenticate header, "
         f"got {response.headers['WWW-Authenticate']!r}"
     )
+
+
+# ---------------------------------------------------------------------------
+# Pure ASGI middleware and the verified-header cache
+# ---------------------------------------------------------------------------
+
+
+def _scope(headers):
+    return {"type": "http", "method": "GET", "path": "/", "headers": headers}
+
+
+def _auth_scope(username, password):
+    header = _basic_auth_header(username, password)["Authorization"].encode()
+    return _scope([(b"authorization", header)])
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+def _call(middleware, scope):
+    """Call the middleware directly; return the user the inner app saw, if any."""
+    seen = []
+
+    async def _send(message):
+        pass
+
+    async def _run():
+        await middleware(scope, _receive, _send)
+
+    middleware.app = lambda scope, receive, send: _record(scope, seen)
+    asyncio.run(_run())
+    return seen[0] if seen else None
+
+
+async def _record(scope, seen):
+    seen.append(scope["auth_user"])
+
+
+def _middleware(app_mod, users=None, **kwargs):
+    if users is None:
+        users = {CONFIGURED_USERNAME: app_mod._pbkdf2_hash(CONFIGURED_PASSWORD, 1000)}
+    return app_mod.BasicAuthMiddleware(None, users, **kwargs)
+
+
+def test_authorised_request_gets_original_send():
+    """No wrapping of the response channel: SSE bodies go straight out."""
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    seen = {}
+
+    async def _inner(scope, receive, send):
+        seen["send"] = send
+        seen["user"] = scope["auth_user"]
+
+    async def _send(message):
+        pass
+
+    middleware = _middleware(app_mod)
+    middleware.app = _inner
+    asyncio.run(middleware(_auth_scope(CONFIGURED_USERNAME, CONFIGURED_PASSWORD), _receive, _send))
+
+    assert seen == {"send": _send, "user": CONFIGURED_USERNAME}
+
+
+def test_non_http_scopes_pass_through():
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    calls = []
+
+    async def _inner(scope, receive, send):
+        calls.append(scope["type"])
+
+    middleware = _middleware(app_mod)
+    middleware.app = _inner
+    asyncio.run(middleware({"type": "lifespan"}, None, None))
+
+    assert calls == ["lifespan"]
+
+
+def test_verified_header_is_checked_once():
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    client = TestClient(app_mod.app)
+    headers = _basic_auth_header(CONFIGURED_USERNAME, CONFIGURED_PASSWORD)
+
+    with unittest.mock.patch.object(
+        app_mod, "verify_password", wraps=app_mod.verify_password
+    ) as verify:
+        for _ in range(5):
+            assert client.get("/", headers=headers).status_code == 200
+
+    assert verify.call_count == 1
+
+
+def test_failures_are_not_cached_and_cache_is_bounded():
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    middleware = _middleware(app_mod, cache_size=2)
+    valid = _basic_auth_header(CONFIGURED_USERNAME, CONFIGURED_PASSWORD)["Authorization"].encode()
+
+    assert _call(middleware, _auth_scope("x", "y")) is None
+    # The decoder skips characters outside the base64 alphabet, so these are
+    # distinct header values carrying the same valid credentials
+    for i in range(4):
+        assert _call(middleware, _scope([(b"authorization", valid + b"!" * i)])) == CONFIGURED_USERNAME
+
+    assert len(middleware._verified) == 2
+    assert [user for user, _, _ in middleware._verified.values()] == [CONFIGURED_USERNAME] * 2
+
+
+def test_cache_is_keyed_by_digest_not_header():
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    middleware = _middleware(app_mod)
+    header = _basic_auth_header(CONFIGURED_USERNAME, CONFIGURED_PASSWORD)["Authorization"].encode()
+
+    _call(middleware, _scope([(b"authorization", header)]))
+
+    (key,) = middleware._verified
+    assert header not in key and len(key) == 32
+    assert key != _middleware(app_mod)._cache_key
+
+
+def test_cached_verification_expires():
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    middleware = _middleware(app_mod, cache_ttl=0.0)
+    scope = _auth_scope(CONFIGURED_USERNAME, CONFIGURED_PASSWORD)
+
+    with unittest.mock.patch.object(
+        app_mod, "verify_password", wraps=app_mod.verify_password
+    ) as verify:
+        for _ in range(3):
+            assert _call(middleware, dict(scope)) == CONFIGURED_USERNAME
+
+    assert verify.call_count == 3
+
+
+@settings(max_examples=100, deadline=None)
+@given(
+    username=st.sampled_from([CONFIGURED_USERNAME, "Admin", "admin ", ""]),
+    password=st.sampled_from([CONFIGURED_PASSWORD, "s3cret", "s3cret!!", "x:y"]),
+)
+def test_cached_and_uncached_verification_agree(username, password):
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    client = TestClient(app_mod.app)
+    headers = _basic_auth_header(username, password)
+
+    statuses = [client.get("/", headers=headers).status_code for _ in range(2)]
+
+    expected = 200 if (username, password) == (CONFIGURED_USERNAME, CONFIGURED_PASSWORD) else 401
+    assert statuses == [expected, expected]
+
+
+def test_authenticated_stream_matches_unauthenticated():
+    tokens = ["Hel", "lo", "\n", "world"]
+
+    def _body(auth_enabled):
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {
+            "stream": [{"contentBlockDelta": {"delta": {"text": t}}} for t in tokens]
+        }
+        app_mod = _load_app_with_auth(auth_enabled=auth_enabled)
+        app_mod.bedrock_client = mock_client
+        client = TestClient(app_mod.app)
+        return client.post(
+            "/chat",
+            json={"messages": [{"role": "user", "content": "hi"}]},
+            headers=_basic_auth_header(CONFIGURED_USERNAME, CONFIGURED_PASSWORD),
+        ).text
+
+    body = _body(True)
+    assert "data: Hello" in body
+    assert body == _body(False)
+
+
+# ---------------------------------------------------------------------------
+# AUTH_USERS_FILE and password hashes
+# ---------------------------------------------------------------------------
+
+
+def _users_file(tmp_path, app_mod, **passwords):
+    lines = ["# username:hash", ""]
+    for i, (user, password) in enumerate(passwords.items()):
+        encoded = app_mod.hash_password(password) if i % 2 == 0 else app_mod._pbkdf2_hash(password, 1000)
+        lines.append(f"{user}:{encoded}")
+    path = tmp_path / "users"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_users_file_allows_each_user(tmp_path):
+    app_mod = _load_app_with_auth(auth_enabled=False)
+    path = _users_file(tmp_path, app_mod, alice="wonderland", bob="b:u:i:l:d")
+    app_mod = _load_app_with_auth(
+        auth_enabled=True, username="", password="", extra_env={"AUTH_USERS_FILE": path}
+    )
+    client = TestClient(app_mod.app)
+
+    assert client.get("/", headers=_basic_auth_header("alice", "wonderland")).status_code == 200
+    assert client.get("/", headers=_basic_auth_header("bob", "b:u:i:l:d")).status_code == 200
+    assert client.get("/", headers=_basic_auth_header("alice", "b:u:i:l:d")).status_code == 401
+    assert client.get("/", headers=_basic_auth_header(CONFIGURED_USERNAME, CONFIGURED_PASSWORD)).status_code == 401
+
+
+def test_loading_users_file_runs_no_hash(tmp_path):
+    """Lines are validated by parsing their fields, not by hashing."""
+    app_mod = _load_app_with_auth(auth_enabled=False)
+    path = _users_file(tmp_path, app_mod, **{f"user{i}": "pw" for i in range(20)})
+
+    with unittest.mock.patch("hashlib.scrypt", side_effect=AssertionError("hashed")), \
+            unittest.mock.patch("hashlib.pbkdf2_hmac", side_effect=AssertionError("hashed")):
+        app_mod = _load_app_with_auth(
+            auth_enabled=True, username="", password="", extra_env={"AUTH_USERS_FILE": path}
+        )
+
+    assert len(app_mod.auth_users) == 20
+
+
+def test_password_checks_run_on_their_own_bounded_threads():
+    """A burst of wrong passwords uses AUTH_VERIFY_WORKERS threads, not the default executor."""
+    app_mod = _load_app_with_auth(auth_enabled=True, extra_env={"AUTH_VERIFY_WORKERS": "1"})
+    middleware = _middleware(app_mod)
+    lock = threading.Lock()
+    running, peak, threads = [0], [0], set()
+    verify_password = app_mod.verify_password
+
+    def _verify(password, encoded):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            threads.add(threading.current_thread().name)
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return verify_password(password, encoded)
+
+    async def _send(message):
+        pass
+
+    async def _run():
+        await asyncio.gather(*[
+            middleware(_auth_scope("mallory", f"guess{i}"), _receive, _send) for i in range(6)
+        ])
+
+    with unittest.mock.patch.object(app_mod, "verify_password", side_effect=_verify):
+        asyncio.run(_run())
+
+    assert peak[0] == 1
+    assert threads and all(name.startswith("auth") for name in threads)
+
+
+def test_unknown_user_still_checks_a_hash():
+    """Unknown usernames cost a hash check, like wrong passwords."""
+    app_mod = _load_app_with_auth(auth_enabled=True)
+    middleware = _middleware(app_mod)
+
+    with unittest.mock.patch.object(
+        app_mod, "verify_password", wraps=app_mod.verify_password
+    ) as verify:
+        assert _call(middleware, _auth_scope("mallory", CONFIGURED_PASSWORD)) is None
+
+    assert verify.call_count == 1
+
+
+@pytest.mark.parametrize("content", [
+    "alice\n",
+    "alice:plaintext\n",
+    "alice:scrypt$1$2\n",
+    "alice:scrypt$3$8$1$AAAA$AAAA\n",
+    "alice:scrypt$16384$8$1$AAAA$not-base64\n",
+    "alice:pbkdf2_sha256$0$AAAA$AAAA\n",
+    "# only comments\n",
+])
+def test_malformed_users_file_exits(tmp_path, content):
+    path = tmp_path / "users"
+    path.write_text(content)
+
+    with pytest.raises(SystemExit) as exc:
+        _load_app_with_auth(auth_enabled=True, extra_env={"AUTH_USERS_FILE": str(path)})
+
+    assert exc.value.code == 1
+
+
+def test_missing_users_file_exits(tmp_path):
+    with pytest.raises(SystemExit) as exc:
+        _load_app_with_auth(auth_enabled=True, extra_env={"AUTH_USERS_FILE": str(tmp_path / "nope")})
+
+    assert exc.value.code == 1
+
+
+@settings(max_examples=5, deadline=None)
+@given(password=st.text(max_size=30), other=st.text(max_size=30))
+def test_hash_password_round_trip(password, other):
+    app_mod = _load_app_with_auth(auth_enabled=False)
+
+    encoded = app_mod.hash_password(password)
+
+    assert encoded.startswith("scrypt$")
+    assert app_mod.verify_password(password, encoded)
+    assert app_mod.verify_password(other, encoded) == (other == password)
+
+
+def test_hash_password_command_needs_no_aws_settings(tmp_path):
+    env = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": os.environ.get("PYTHONPATH", "")}
+
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(APP_PATH), "hash-password"],
+        input="s3cret!\n", env=env, cwd=tmp_path, capture_output=True, text=True, timeout=30,
+    )
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    encoded = result.stdout.strip().splitlines()[-1]
+    assert _load_app_with_auth(auth_enabled=False).verify_password("s3cret!", encoded)
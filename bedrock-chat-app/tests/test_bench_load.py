@@ -0,0 +1,105 @@
+"""
+tests/test_bench_load.py — Tests for the /chat load benchmark in
+benchmarks/bench_load.py.
+
+Tests cover:
+  - Percentiles, the degradation point and the comparison of two results
+  - A short closed-loop run against app.py in a child process measures
+    time to first token and inter-token gaps from the mock's settings
+"""
+
+import asyncio
+import importlib.util
+import os
+import statistics
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+BENCH_PATH = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "bench_load.py")
+
+
+def _load_bench_module():
+    spec = importlib.util.spec_from_file_location("bench_load_test", BENCH_PATH)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _level(concurrency, rps=10.0, ttft_p95=100.0, itl_p95=20.0, failed=0.0):
+    return {
+        "concurrency": concurrency,
+        "requests_per_second": rps,
+        "rejected_rate": failed,
+        "error_rate": 0.0,
+        "ttft_ms": {"p50": ttft_p95 / 2, "p95": ttft_p95, "p99": ttft_p95},
+        "inter_token_ms": {"p50": itl_p95 / 2, "p95": itl_p95, "p99": itl_p95},
+    }
+
+
+BENCH = _load_bench_module()
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=200, deadline=None)
+@given(values=st.lists(st.floats(min_value=0, max_value=1e6), min_size=1, max_size=50))
+def test_percentiles_are_ordered_and_bounded(values):
+    p50, p95, p99 = (BENCH.percentile(values, q) for q in (50, 95, 99))
+
+    assert min(values) <= p50 <= p95 <= p99 <= max(values)
+    assert BENCH.percentile(values, 0) == min(values)
+    assert BENCH.percentile(values, 100) == max(values)
+    assert abs(p50 - statistics.median(values)) <= 1e-6 * max(1.0, max(values))
+
+
+def test_degradation_point():
+    levels = [_level(1, ttft_p95=100), _level(8, ttft_p95=150), _level(32, ttft_p95=250), _level(64)]
+
+    assert BENCH.max_concurrency_before_degradation(levels, 2.0) == 8
+    assert BENCH.max_concurrency_before_degradation(levels, 3.0) == 64
+    levels[1]["rejected_rate"] = 0.05
+    assert BENCH.max_concurrency_before_degradation(levels, 3.0) == 1
+    assert BENCH.max_concurrency_before_degradation([], 2.0) is None
+
+
+def test_compare_reports_regressions_beyond_tolerance():
+    baseline = {
+        "levels": [_level(1), _level(8, rps=80.0)],
+        "max_concurrency_before_degradation": 8,
+        "memory": {"kb_per_stream": 50.0},
+    }
+    current = {
+        "levels": [_level(1, ttft_p95=105.0), _level(8, rps=60.0, itl_p95=30.0), _level(16)],
+        "max_concurrency_before_degradation": 1,
+        "memory": {"kb_per_stream": 54.0},
+    }
+
+    regressions = BENCH.compare(baseline, current, 0.1)
+
+    assert [r.split(":")[0] for r in regressions] == ["c=8 requests_per_second", "c=8 inter_token_ms.p95"]
+    current["levels"].pop()
+    assert "max_concurrency_before_degradation" in BENCH.compare(baseline, current, 0.1)[-1]
+    assert BENCH.compare(baseline, baseline, 0.0) == []
+
+
+# ---------------------------------------------------------------------------
+# Against app.py
+# ---------------------------------------------------------------------------
+
+
+def test_short_run_measures_the_mock():
+    server = BENCH._Server({"ttft": 0.2, "tokens_per_second": 20, "output_tokens": 5}, "inprocess", {})
+    try:
+        server.wait_ready()
+        level = asyncio.run(BENCH.run_level(server.url, 2, 1.0))
+    finally:
+        server.stop()
+
+    assert level["requests"] >= 2
+    assert level["error_rate"] == level["rejected_rate"] == 0
+    assert 200 <= level["ttft_ms"]["p50"] < 400
+    assert 30 <= level["inter_token_ms"]["p50"] < 80
@@ -0,0 +1,250 @@
+"""
+tests/test_client_init.py — Tests for lazy Bedrock client construction.
+
+Tests cover:
+  - With BEDROCK_CLIENT_INIT=lazy, importing app.py neither imports boto3 nor
+    builds a client; the first chat builds it exactly once
+  - With BEDROCK_CLIENT_INIT=startup, the client is warmed up in the
+    background when the app starts, and a failed warm-up is only logged
+  - A client built from settings that a reload or create_app() replaced
+    meanwhile is discarded
+  - create_app() builds independent apps with every route
+  - Invalid BEDROCK_CLIENT_INIT exits with code 1
+"""
+
+import importlib.util
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest.mock
+
+import pytest
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_client_init_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _answer_client():
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": [
+        {"contentBlockDelta": {"delta": {"text": "Hello"}}},
+    ]}
+    return mock_client
+
+
+APP = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy"})
+
+
+# ---------------------------------------------------------------------------
+# BEDROCK_CLIENT_INIT=lazy
+# ---------------------------------------------------------------------------
+
+
+def test_lazy_import_skips_boto3():
+    code = (
+        "import importlib.util, sys\n"
+        "spec = importlib.util.spec_from_file_location('app', sys.argv[1])\n"
+        "mod = importlib.util.module_from_spec(spec)\n"
+        "spec.loader.exec_module(mod)\n"
+        "print('BOTO3', 'boto3' in sys.modules, mod.bedrock_client)\n"
+    )
+    env = {
+        **os.environ,
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_CLIENT_INIT": "lazy",
+    }
+
+    result = subprocess.run(
+        [sys.executable, "-c", code, APP_PATH], env=env, capture_output=True, text=True, timeout=30
+    )
+
+    assert "BOTO3 False None" in result.stdout, result.stdout + result.stderr
+
+
+def test_first_chat_builds_the_client_once():
+    mock_client = _answer_client()
+    with unittest.mock.patch("boto3.client", return_value=mock_client) as factory:
+        app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy"})
+        assert factory.call_count == 0
+
+        client = TestClient(app_mod.app)
+        first = client.post("/chat", json=CHAT_BODY)
+        second = client.post("/chat", json={"messages": [{"role": "user", "content": "again"}]})
+
+    assert "data: Hello" in first.text and "data: Hello" in second.text
+    assert factory.call_count == 1
+    assert app_mod.bedrock_client is mock_client
+
+
+@settings(max_examples=20, deadline=None)
+@given(callers=st.integers(min_value=1, max_value=8))
+def test_concurrent_first_uses_share_one_client(callers):
+    APP.bedrock_client = None
+    barrier = threading.Barrier(callers)
+    clients = []
+
+    def _slow_build(settings):
+        time.sleep(0.01)
+        return object()
+
+    def _use():
+        barrier.wait()
+        clients.append(APP.get_bedrock_client())
+
+    with unittest.mock.patch.object(APP, "build_bedrock_client", side_effect=_slow_build) as build:
+        threads = [threading.Thread(target=_use) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+    assert build.call_count == 1
+    assert len(clients) == callers and len({id(c) for c in clients}) == 1
+
+
+def _build_blocked_until(release):
+    """A build_bedrock_client stand-in that waits for *release* and records its settings."""
+    built = []
+
+    def _build(settings):
+        release.wait(10)
+        built.append(settings)
+        return unittest.mock.Mock(name=settings.aws_region)
+
+    return built, _build
+
+
+def test_client_built_during_a_reload_does_not_replace_it():
+    app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy"})
+    release = threading.Event()
+    built, build = _build_blocked_until(release)
+    reloaded = object()
+    clients = []
+
+    with unittest.mock.patch.object(app_mod, "build_bedrock_client", side_effect=build):
+        first_use = threading.Thread(target=lambda: clients.append(app_mod.get_bedrock_client()))
+        first_use.start()
+        time.sleep(0.05)
+        app_mod._install_settings(app_mod.runtime_settings._replace(aws_region="eu-west-1"), reloaded, None)
+        release.set()
+        first_use.join(timeout=10)
+
+    assert len(built) == 1
+    assert clients == [reloaded]
+    assert app_mod.bedrock_client is reloaded
+
+
+def test_client_built_from_replaced_settings_is_rebuilt():
+    app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "lazy"})
+    release = threading.Event()
+    built, build = _build_blocked_until(release)
+    clients = []
+
+    with unittest.mock.patch.object(app_mod, "build_bedrock_client", side_effect=build):
+        first_use = threading.Thread(target=lambda: clients.append(app_mod.get_bedrock_client()))
+        first_use.start()
+        time.sleep(0.05)
+        app_mod.create_app(app_mod.runtime_settings._replace(aws_region="eu-west-1"))
+        release.set()
+        first_use.join(timeout=10)
+
+    assert [settings.aws_region for settings in built] == ["us-east-1", "eu-west-1"]
+    assert clients == [app_mod.bedrock_client]
+    assert app_mod.bedrock_client._mock_name == "eu-west-1"
+
+
+# ---------------------------------------------------------------------------
+# BEDROCK_CLIENT_INIT=startup
+# ---------------------------------------------------------------------------
+
+
+def test_startup_warms_the_client_in_the_background():
+    mock_client = _answer_client()
+    with unittest.mock.patch("boto3.client", return_value=mock_client) as factory:
+        app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "startup"})
+        assert app_mod.bedrock_client is None
+
+        with TestClient(app_mod.app) as client:
+            for _ in range(100):
+                if app_mod.bedrock_client is not None:
+                    break
+                time.sleep(0.02)
+            response = client.post("/chat", json=CHAT_BODY)
+
+    assert app_mod.bedrock_client is mock_client
+    assert factory.call_count == 1
+    assert "data: Hello" in response.text
+
+
+def test_failed_warm_up_is_logged_and_retried(caplog):
+    app_mod = _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "startup"})
+
+    with unittest.mock.patch("boto3.client", side_effect=[ValueError("bad region"), _answer_client()]):
+        with caplog.at_level(logging.ERROR):
+            with TestClient(app_mod.app) as client:
+                for _ in range(100):
+                    if any("warm-up failed" in r.getMessage() for r in caplog.records):
+                        break
+                    time.sleep(0.02)
+                response = client.post("/chat", json=CHAT_BODY)
+
+    assert any("bad region" in r.getMessage() for r in caplog.records)
+    assert "data: Hello" in response.text
+
+
+# ---------------------------------------------------------------------------
+# create_app and settings
+# ---------------------------------------------------------------------------
+
+
+def test_create_app_returns_fresh_apps_with_every_route():
+    env = {"BEDROCK_CLIENT_INIT": "lazy", "AUTH_ENABLED": "true", "AUTH_USERNAME": "u", "AUTH_PASSWORD": "p"}
+    app_mod = _load_app_module(extra_env=env)
+
+    other = app_mod.create_app()
+
+    paths = {route.path for route in app_mod.app.routes}
+    assert other is not app_mod.app
+    assert {"/", "/chat", "/metrics", "/admin/usage", "/admin/reload"} <= paths
+    assert {route.path for route in other.routes} == paths
+    assert [m.cls for m in other.user_middleware] == [app_mod.BasicAuthMiddleware]
+    assert TestClient(other).get("/").status_code == 401
+
+
+def test_invalid_client_init_exits_1():
+    with pytest.raises(SystemExit) as exc:
+        _load_app_module(extra_env={"BEDROCK_CLIENT_INIT": "eager"})
+    assert exc.value.code == 1
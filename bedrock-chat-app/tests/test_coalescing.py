@@ -0,0 +1,174 @@
+"""
+tests/test_coalescing.py — Tests for coalescing streamed text deltas into
+fewer SSE frames.
+
+Tests cover:
+  - Text and event order survive coalescing unchanged
+  - Flushes on the byte threshold and on the time window
+  - /chat coalesces by default and counts deltas vs frames
+  - Closing the coalescer closes the upstream generator
+"""
+
+import asyncio
+import importlib.util
+import os
+import unittest.mock
+
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_coalescing_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+async def _source(events, delay=0.0):
+    for event in events:
+        if delay:
+            await asyncio.sleep(delay)
+        yield event
+
+
+def _coalesce(app_mod, events, max_bytes=2048, window=1.0, delay=0.0):
+    async def _run():
+        return [
+            e async for e in app_mod.coalesce_events(_source(events, delay), max_bytes, window)
+        ]
+
+    return asyncio.run(_run())
+
+
+# ---------------------------------------------------------------------------
+# coalesce_events
+# ---------------------------------------------------------------------------
+
+
+_event_kinds = st.sampled_from(["text", "text", "text", "pruned", "error"])
+
+
+@settings(max_examples=100, deadline=None)
+@given(
+    items=st.lists(st.tuples(_event_kinds, st.text(max_size=8)), max_size=30),
+    max_bytes=st.integers(min_value=1, max_value=64),
+)
+def test_coalescing_preserves_text_and_event_order(items, max_bytes):
+    """Concatenated text between non-text events is unchanged, and so is their order."""
+    app_mod = _load_app_module()
+    events = [app_mod.StreamEvent(kind, data) for kind, data in items if kind != "text" or data]
+    events.append(app_mod.StreamEvent("done"))
+
+    out = _coalesce(app_mod, events, max_bytes=max_bytes)
+
+    def _segments(seq):
+        segments, text = [], ""
+        for event in seq:
+            if event.kind == "text":
+                text += event.data
+            else:
+                segments.append((text, event))
+                text = ""
+        return segments
+
+    assert _segments(out) == _segments(events)
+    assert all(e.data for e in out if e.kind == "text")
+
+
+def test_flushes_on_byte_threshold():
+    app_mod = _load_app_module()
+    events = [app_mod.StreamEvent("text", "0123456789") for _ in range(5)]
+
+    out = _coalesce(app_mod, events, max_bytes=25)
+
+    assert [len(e.data) for e in out] == [30, 20]
+
+
+def test_flushes_on_time_window():
+    """Deltas further apart than the window are sent separately."""
+    app_mod = _load_app_module()
+    events = [app_mod.StreamEvent("text", t) for t in ["a", "b", "c"]]
+
+    slow = _coalesce(app_mod, events, window=0.01, delay=0.1)
+    fast = _coalesce(app_mod, events, window=1.0, delay=0.01)
+
+    assert [e.data for e in slow] == ["a", "b", "c"]
+    assert [e.data for e in fast] == ["abc"]
+
+
+def test_closing_coalescer_closes_upstream():
+    app_mod = _load_app_module()
+    closed = []
+
+    async def _upstream():
+        try:
+            yield app_mod.StreamEvent("text", "first")
+            await asyncio.sleep(60)
+        finally:
+            closed.append(True)
+
+    async def _run():
+        coalescer = app_mod.coalesce_events(_upstream(), 2048, 0.01)
+        assert (await coalescer.__anext__()).data == "first"
+        await coalescer.aclose()
+
+    asyncio.run(asyncio.wait_for(_run(), timeout=2))
+    assert closed == [True]
+
+
+# ---------------------------------------------------------------------------
+# POST /chat
+# ---------------------------------------------------------------------------
+
+
+def test_chat_coalesces_fast_deltas():
+    tokens = ["Hel", "lo", ", ", "wor", "ld"]
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.return_value = {
+        "stream": [{"contentBlockDelta": {"delta": {"text": t}}} for t in tokens]
+    }
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    body = client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]}).text
+
+    assert "data: Hello, world\n\n" in body
+    assert body.endswith("event: done\ndata: \n\n")
+    assert app_mod._sse_text_deltas_total.value() == len(tokens)
+    assert app_mod._sse_text_frames_total.value() == 1
+
+
+def test_coalescing_can_be_disabled():
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.return_value = {
+        "stream": [{"contentBlockDelta": {"delta": {"text": t}}} for t in ["a", "b"]]
+    }
+    app_mod = _load_app_module(mock_client, extra_env={"SSE_COALESCE_WINDOW_MS": "0"})
+    client = TestClient(app_mod.app)
+
+    body = client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]}).text
+
+    assert "data: a\n\n" in body
+    assert "data: b\n\n" in body
@@ -0,0 +1,306 @@
+"""
+tests/test_concurrency.py — Tests that concurrent /chat streams never block
+each other or the event loop.
+
+Tests cover:
+  - Off-loop upstream streaming: N concurrent streams progress in parallel
+  - GET / stays responsive while an upstream read is blocked
+  - AdmissionController: in-flight cap, bounded fair queue, 429 + Retry-After
+"""
+
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import unittest.mock
+from typing import List
+
+import httpx
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+# Delay between upstream events; long enough that serial execution is obvious
+EVENT_DELAY = 0.2
+EVENTS_PER_STREAM = 4
+CONCURRENT_STREAMS = 5
+
+
+def _load_app_module(mock_client, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_concurrency_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _slow_stream(tokens: List[str], delay: float):
+    """Blocking generator that mimics a slow botocore EventStream."""
+    for token in tokens:
+        time.sleep(delay)
+        yield {"contentBlockDelta": {"delta": {"text": token}}}
+
+
+def _make_slow_mock_client():
+    mock_client = unittest.mock.MagicMock()
+    tokens = [f"t{i}" for i in range(EVENTS_PER_STREAM)]
+    mock_client.converse_stream.side_effect = lambda **kwargs: {
+        "stream": _slow_stream(tokens, EVENT_DELAY)
+    }
+    return mock_client
+
+
+# ---------------------------------------------------------------------------
+# Concurrent streams progress in parallel
+# ---------------------------------------------------------------------------
+
+
+def test_concurrent_stream_response_calls_run_in_parallel():
+    """N concurrent stream_response generators finish in roughly the time of one."""
+    app_mod = _load_app_module(_make_slow_mock_client())
+
+    async def _collect():
+        chunks = []
+        async for chunk in app_mod.stream_response([{"role": "user", "content": "hi"}]):
+            chunks.append(chunk)
+        return chunks
+
+    async def _run():
+        return await asyncio.gather(*(_collect() for _ in range(CONCURRENT_STREAMS)))
+
+    started = time.monotonic()
+    results = asyncio.run(_run())
+    elapsed = time.monotonic() - started
+
+    serial_time = CONCURRENT_STREAMS * EVENTS_PER_STREAM * EVENT_DELAY
+    assert elapsed < serial_time / 2, (
+        f"Streams did not progress in parallel: {elapsed:.2f}s elapsed, "
+        f"serial execution would take {serial_time:.2f}s"
+    )
+    for chunks in results:
+        assert chunks[-1] == "event: done\ndata: \n\n"
+        assert len([c for c in chunks if c.startswith("data: ")]) == EVENTS_PER_STREAM
+
+
+def test_concurrent_chat_requests_run_in_parallel():
+    """N concurrent POST /chat requests stream in parallel through the ASGI app."""
+    app_mod = _load_app_module(_make_slow_mock_client())
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app_mod.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+                for _ in range(CONCURRENT_STREAMS)
+            ))
+
+    started = time.monotonic()
+    responses = asyncio.run(_run())
+    elapsed = time.monotonic() - started
+
+    serial_time = CONCURRENT_STREAMS * EVENTS_PER_STREAM * EVENT_DELAY
+    assert elapsed < serial_time / 2, (
+        f"/chat streams did not progress in parallel: {elapsed:.2f}s elapsed, "
+        f"serial execution would take {serial_time:.2f}s"
+    )
+    for response in responses:
+        assert response.status_code == 200
+        assert "event: done" in response.text
+
+
+def test_index_responsive_while_upstream_read_blocks():
+    """GET / is served while a /chat stream is blocked on an upstream read."""
+    release = threading.Event()
+
+    def _blocked_stream():
+        release.wait(timeout=10)
+        yield {"contentBlockDelta": {"delta": {"text": "late"}}}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _blocked_stream()}
+    app_mod = _load_app_module(mock_client)
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app_mod.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            chat_task = asyncio.create_task(
+                client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+            )
+            await asyncio.sleep(0.1)
+            index = await asyncio.wait_for(client.get("/"), timeout=2)
+            assert not chat_task.done(), "chat stream finished before the upstream was released"
+            release.set()
+            chat = await asyncio.wait_for(chat_task, timeout=5)
+            return index, chat
+
+    try:
+        index, chat = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert index.status_code == 200
+    assert chat.status_code == 200
+    assert "data: late" in chat.text
+    assert "event: done" in chat.text
+
+
+# ---------------------------------------------------------------------------
+# AdmissionController — bounded in-flight streams, fair bounded queue
+# ---------------------------------------------------------------------------
+
+
+def _make_controller(app_mod, max_in_flight=1, max_queued=4, queue_timeout=5.0):
+    return app_mod.AdmissionController(
+        max_in_flight=max_in_flight,
+        max_queued=max_queued,
+        queue_timeout=queue_timeout,
+    )
+
+
+def test_admission_limits_in_flight_streams():
+    """Requests beyond max_in_flight wait until a slot is released."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+
+    async def _run():
+        controller = _make_controller(app_mod, max_in_flight=2)
+        first = await controller.acquire("a")
+        second = await controller.acquire("b")
+        third_task = asyncio.create_task(controller.acquire("c"))
+        await asyncio.sleep(0.05)
+        assert not third_task.done()
+        assert controller.in_flight == 2
+        assert controller.queued == 1
+
+        first.release()
+        third = await asyncio.wait_for(third_task, timeout=1)
+        assert controller.in_flight == 2
+        assert controller.queued == 0
+
+        second.release()
+        third.release()
+        third.release()  # idempotent
+        assert controller.in_flight == 0
+
+    asyncio.run(_run())
+
+
+def test_admission_rejects_immediately_when_queue_full():
+    """A full wait queue rejects new requests without waiting."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+
+    async def _run():
+        controller = _make_controller(app_mod, max_in_flight=1, max_queued=1)
+        await controller.acquire("a")
+        queued = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0.01)
+
+        started = time.monotonic()
+        try:
+            await controller.acquire("c")
+        except app_mod.AdmissionRejected as exc:
+            assert exc.reason == "queue full"
+            assert exc.retry_after >= 1
+        else:
+            raise AssertionError("expected AdmissionRejected")
+        assert time.monotonic() - started < 0.1
+        queued.cancel()
+
+    asyncio.run(_run())
+
+
+def test_admission_queue_deadline():
+    """A queued request is rejected once its wait exceeds the deadline."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+
+    async def _run():
+        controller = _make_controller(app_mod, max_in_flight=1, queue_timeout=0.1)
+        await controller.acquire("a")
+        try:
+            await controller.acquire("b")
+        except app_mod.AdmissionRejected as exc:
+            assert exc.reason == "queue timeout"
+        else:
+            raise AssertionError("expected AdmissionRejected")
+        assert controller.queued == 0
+
+    asyncio.run(_run())
+
+
+def test_admission_round_robin_across_clients():
+    """Freed slots rotate across clients instead of draining one client's burst."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+
+    async def _run():
+        controller = _make_controller(app_mod, max_in_flight=1, max_queued=10)
+        slot = await controller.acquire("first")
+        order = []
+
+        async def _waiter(client, label):
+            granted = await controller.acquire(client)
+            order.append(label)
+            granted.release()
+
+        tasks = [asyncio.create_task(_waiter("greedy", f"greedy{i}")) for i in range(3)]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(_waiter("polite", "polite0")))
+        await asyncio.sleep(0.01)
+
+        slot.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+        assert controller.in_flight == 0
+        return order
+
+    order = asyncio.run(_run())
+    assert order == ["greedy0", "polite0", "greedy1", "greedy2"], (
+        f"Slots were not handed out round-robin across clients: {order!r}"
+    )
+
+
+def test_chat_returns_429_with_retry_after_when_queue_full():
+    """POST /chat gets a fast 429 + Retry-After when no slot or queue space is left."""
+    release = threading.Event()
+
+    def _blocked_stream():
+        release.wait(timeout=10)
+        yield {"contentBlockDelta": {"delta": {"text": "done"}}}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _blocked_stream()}
+    app_mod = _load_app_module(
+        mock_client,
+        extra_env={"MAX_CONCURRENT_STREAMS": "1", "MAX_QUEUED_STREAMS": "0"},
+    )
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app_mod.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"messages": [{"role": "user", "content": "hi"}]}
+            first = asyncio.create_task(client.post("/chat", json=body))
+            await asyncio.sleep(0.1)
+            rejected = await asyncio.wait_for(client.post("/chat", json=body), timeout=2)
+            release.set()
+            return await asyncio.wait_for(first, timeout=5), rejected
+
+    try:
+        first, rejected = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert first.status_code == 200
+    assert "event: done" in first.text
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert app_mod.admission.in_flight == 0
@@ -0,0 +1,378 @@
+"""
+tests/test_conversation_store.py — Tests for the server-side conversation store.
+
+Tests cover:
+  - InMemoryConversationStore LRU eviction
+  - SQLiteConversationStore persistence and eviction; its row count is kept
+    by triggers and its queries run off the event loop
+  - /chat delta requests: stored history is prepended, only successful
+    turns are committed; unknown conversations, deltas without an id and
+    deltas to a server without a store get HTTP 409
+  - Conversations are keyed by the caller's identity as well as their id
+  - Frontend sends deltas once the server advertises the store
+"""
+
+import asyncio
+import importlib.util
+import os
+import threading
+import unittest.mock
+
+import pytest
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        "CONVERSATION_STORE": "memory",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_store_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _reply_client(*replies):
+    """Mock client whose successive converse_stream calls stream the given replies."""
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = [
+        {"stream": [{"contentBlockDelta": {"delta": {"text": reply}}}]}
+        for reply in replies
+    ]
+    return mock_client
+
+
+def _text(role, text):
+    return {"role": role, "content": [{"text": text}]}
+
+
+# ---------------------------------------------------------------------------
+# Store backends
+# ---------------------------------------------------------------------------
+
+
+def test_memory_store_evicts_least_recently_used():
+    app_mod = _load_app_module()
+    store = app_mod.InMemoryConversationStore(max_conversations=2)
+    conv = app_mod.StoredConversation(1, [_text("user", "hi")])
+
+    store.put("ip:1", "a", conv)
+    store.put("ip:1", "b", conv)
+    assert store.get("ip:1", "a") == conv  # "a" is now most recently used
+    store.put("ip:1", "c", conv)
+
+    assert store.get("ip:1", "b") is None
+    assert store.get("ip:1", "a") == conv
+    assert store.get("ip:1", "c") == conv
+    assert store.get("ip:2", "a") is None
+
+
+def test_sqlite_store_round_trip_and_eviction(tmp_path):
+    app_mod = _load_app_module()
+    path = str(tmp_path / "conversations.db")
+    store = app_mod.SQLiteConversationStore(path, max_conversations=2)
+    conv = app_mod.StoredConversation(2, [_text("user", "hi"), _text("assistant", "hello")])
+
+    store.put("ip:1", "a", conv)
+    store.put("ip:1", "b", conv)
+    store.put("ip:2", "b", conv)
+
+    reopened = app_mod.SQLiteConversationStore(path, max_conversations=2)
+    assert reopened.get("ip:1", "a") is None
+    assert reopened.get("ip:1", "b") == reopened.get("ip:2", "b") == conv
+    reopened.delete("ip:2", "b")
+    assert reopened.get("ip:2", "b") is None
+    assert reopened.get("ip:1", "b") == conv
+
+
+@settings(max_examples=50, deadline=None)
+@given(texts=st.lists(st.text(min_size=1), min_size=1, max_size=10))
+def test_sqlite_store_preserves_message_text(tmp_path_factory, texts):
+    """Any message text survives the JSON round trip through SQLite."""
+    app_mod = _load_app_module()
+    path = str(tmp_path_factory.mktemp("db") / "conversations.db")
+    store = app_mod.SQLiteConversationStore(path, max_conversations=10)
+    messages = [_text("user", t) for t in texts]
+
+    store.put("ip:1", "conv", app_mod.StoredConversation(len(messages), messages))
+
+    assert store.get("ip:1", "conv").messages == messages
+
+
+@settings(max_examples=50, deadline=None)
+@given(
+    limit=st.integers(min_value=1, max_value=4),
+    ops=st.lists(st.tuples(st.booleans(), st.sampled_from("abcdef")), max_size=30),
+)
+def test_sqlite_store_count_tracks_rows(tmp_path_factory, limit, ops):
+    """True puts a conversation, False deletes it; the newest ``limit`` are kept."""
+    app_mod = _load_app_module()
+    path = str(tmp_path_factory.mktemp("db") / "conversations.db")
+    store = app_mod.SQLiteConversationStore(path, max_conversations=limit)
+    recent = []
+
+    for i, (put, key) in enumerate(ops):
+        if key in recent:
+            recent.remove(key)
+        if put:
+            store._conn.execute("UPDATE conversations SET updated = updated - 1")
+            store.put("ip:1", key, app_mod.StoredConversation(i, []))
+            recent.append(key)
+        else:
+            store.delete("ip:1", key)
+        recent = recent[-limit:]
+
+        rows = {k for (k,) in store._conn.execute("SELECT id FROM conversations")}
+        (count,) = store._conn.execute("SELECT n FROM conversation_count").fetchone()
+        assert rows == set(recent)
+        assert count == len(rows)
+
+
+def test_sqlite_store_runs_off_the_loop(tmp_path):
+    app_mod = _load_app_module()
+    store = app_mod.SQLiteConversationStore(str(tmp_path / "conversations.db"), max_conversations=2)
+    conv = app_mod.StoredConversation(1, [_text("user", "hi")])
+    threads = []
+    get, put = store.get, store.put
+
+    def _get(*args):
+        threads.append(threading.get_ident())
+        return get(*args)
+
+    def _put(*args):
+        threads.append(threading.get_ident())
+        put(*args)
+
+    async def _run():
+        await store.put_async("ip:1", "a", conv)
+        return await store.get_async("ip:1", "a")
+
+    with unittest.mock.patch.object(store, "get", side_effect=_get), \
+            unittest.mock.patch.object(store, "put", side_effect=_put):
+        assert asyncio.run(_run()) == conv
+
+    assert len(threads) == 2 and threading.get_ident() not in threads
+
+
+def test_store_interface_is_abstract():
+    app_mod = _load_app_module()
+
+    class Partial(app_mod.ConversationStore):
+        def get(self, owner, conversation_id):
+            return None
+
+    with pytest.raises(TypeError):
+        app_mod.ConversationStore()
+    with pytest.raises(TypeError):
+        Partial()
+
+
+# ---------------------------------------------------------------------------
+# POST /chat with a conversation_id
+# ---------------------------------------------------------------------------
+
+
+def test_delta_request_prepends_stored_history():
+    mock_client = _reply_client("Hello!", "Fine, thanks.")
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    first = client.post("/chat", json={
+        "conversation_id": "conv1",
+        "messages": [{"role": "user", "content": "Hi"}],
+    })
+    assert first.headers["X-Conversation-Store"] == "1"
+    assert "event: done" in first.text
+
+    second = client.post("/chat", json={
+        "conversation_id": "conv1",
+        "history_length": 2,
+        "messages": [{"role": "user", "content": "How are you?"}],
+    })
+    assert second.status_code == 200
+    assert "data: Fine, thanks." in second.text
+
+    sent = mock_client.converse_stream.call_args.kwargs["messages"]
+    assert sent == [
+        _text("user", "Hi"),
+        _text("assistant", "Hello!"),
+        _text("user", "How are you?"),
+    ]
+    assert app_mod.conversation_store.get("ip:testclient", "conv1").total == 4
+
+
+def test_other_callers_cannot_continue_a_conversation():
+    mock_client = _reply_client("Hello!", "Fresh start.")
+    app_mod = _load_app_module(mock_client)
+    TestClient(app_mod.app, client=("10.0.0.1", 1000)).post("/chat", json={
+        "conversation_id": "conv1",
+        "messages": [{"role": "user", "content": "My secret"}],
+    })
+    other = TestClient(app_mod.app, client=("10.0.0.2", 1000))
+
+    stolen = other.post("/chat", json={
+        "conversation_id": "conv1",
+        "history_length": 2,
+        "messages": [{"role": "user", "content": "What did I say?"}],
+    })
+    own = other.post("/chat", json={
+        "conversation_id": "conv1",
+        "messages": [{"role": "user", "content": "Hi"}],
+    })
+
+    assert stolen.status_code == 409
+    assert "data: Fresh start." in own.text
+    assert mock_client.converse_stream.call_args.kwargs["messages"] == [_text("user", "Hi")]
+    assert app_mod.conversation_store.get("ip:10.0.0.1", "conv1").messages[0] == _text("user", "My secret")
+
+
+def test_sqlite_store_drops_rows_without_owner(tmp_path):
+    import sqlite3
+
+    app_mod = _load_app_module()
+    path = str(tmp_path / "conversations.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE conversations (id TEXT PRIMARY KEY, total INTEGER NOT NULL,"
+            " messages TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO conversations VALUES ('a', 1, '[]', 0)")
+
+    store = app_mod.SQLiteConversationStore(path, max_conversations=2)
+
+    assert store.get("ip:1", "a") is None
+    store.put("ip:1", "a", app_mod.StoredConversation(1, [_text("user", "hi")]))
+    assert store.get("ip:1", "a").total == 1
+
+
+def test_delta_request_for_unknown_conversation_returns_409():
+    app_mod = _load_app_module()
+    client = TestClient(app_mod.app)
+
+    response = client.post("/chat", json={
+        "conversation_id": "missing",
+        "history_length": 4,
+        "messages": [{"role": "user", "content": "Hi"}],
+    })
+
+    assert response.status_code == 409
+
+
+def test_delta_request_with_stale_length_returns_409():
+    app_mod = _load_app_module(_reply_client("Hello!"))
+    client = TestClient(app_mod.app)
+    client.post("/chat", json={
+        "conversation_id": "conv1",
+        "messages": [{"role": "user", "content": "Hi"}],
+    })
+
+    response = client.post("/chat", json={
+        "conversation_id": "conv1",
+        "history_length": 5,
+        "messages": [{"role": "user", "content": "Again"}],
+    })
+
+    assert response.status_code == 409
+
+
+def test_failed_turn_is_not_committed():
+    """Failed Bedrock responses do not mutate the stored conversation (Requirement 5.6)."""
+    from botocore.exceptions import ClientError
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = [
+        {"stream": [{"contentBlockDelta": {"delta": {"text": "Hello!"}}}]},
+        ClientError({"Error": {"Code": "InternalServerException", "Message": "Boom"}}, "converse_stream"),
+    ]
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+    client.post("/chat", json={"conversation_id": "c", "messages": [{"role": "user", "content": "Hi"}]})
+
+    failed = client.post("/chat", json={
+        "conversation_id": "c",
+        "history_length": 2,
+        "messages": [{"role": "user", "content": "More"}],
+    })
+
+    assert "event: error" in failed.text
+    stored = app_mod.conversation_store.get("ip:testclient", "c")
+    assert stored.total == 2
+    assert stored.messages == [_text("user", "Hi"), _text("assistant", "Hello!")]
+
+
+def test_store_disabled_ignores_conversation_id():
+    mock_client = _reply_client("Hello!")
+    app_mod = _load_app_module(mock_client, extra_env={"CONVERSATION_STORE": "none"})
+    client = TestClient(app_mod.app)
+
+    response = client.post("/chat", json={
+        "conversation_id": "conv1",
+        "messages": [{"role": "user", "content": "Hi"}],
+    })
+
+    assert response.status_code == 200
+    assert "X-Conversation-Store" not in response.headers
+    assert app_mod.conversation_store is None
+
+
+@pytest.mark.parametrize("store, body", [
+    ("memory", {}),
+    ("none", {"conversation_id": "conv1"}),
+], ids=["no-conversation-id", "store-disabled"])
+def test_delta_request_the_server_cannot_complete_returns_409(store, body):
+    """A delta is never answered without the history it refers to."""
+    mock_client = _reply_client("Hello!")
+    app_mod = _load_app_module(mock_client, extra_env={"CONVERSATION_STORE": store})
+    client = TestClient(app_mod.app)
+
+    response = client.post("/chat", json={
+        **body,
+        "history_length": 6,
+        "messages": [{"role": "user", "content": "and the second one?"}],
+    })
+
+    assert response.status_code == 409
+    mock_client.converse_stream.assert_not_called()
+
+
+def test_invalid_conversation_id_returns_422():
+    app_mod = _load_app_module()
+    client = TestClient(app_mod.app)
+
+    response = client.post("/chat", json={
+        "conversation_id": "../etc/passwd",
+        "messages": [{"role": "user", "content": "Hi"}],
+    })
+
+    assert response.status_code == 422
+
+
+def test_frontend_sends_deltas_when_store_advertised():
+    app_mod = _load_app_module()
+    client = TestClient(app_mod.app)
+
+    html = client.get("/").text
+
+    assert "X-Conversation-Store" in html
+    assert "history_length" in html
+    assert "response.status === 409" in html
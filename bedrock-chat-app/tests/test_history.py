@@ -3,6 +3,7 @@ tests/test_history.py — Property and unit tests for conversation history manag
 
 Tests cover:
   - Property 6: Conversation history pruning preserves recency and enforces the 100-turn cap
+  - Token-budget pruning (HISTORY_TOKEN_BUDGET)
 
 Requirements: 5.5
 """
@@ -11,6 +12,7 @@ from __future__ import annotations
 
 import importlib.util
 import os
+import re
 import sys
 import unittest.mock
 from typing import List
@@ -373,8 +375,10 @@ def test_property5_assistant_response_in_sse_stream(content):
     assert response.status_code == 200
     body = response.text
 
-    # The assistant response content should appear as a data: event
-    assert f"data: {content}" in body, (
+    # The assistant response content should appear as data: events, one
+    # data: line per line of content
+    expected = "".join(f"data: {line}\n" for line in re.split(r"\r\n|\r|\n", content))
+    assert expected in body, (
         f"Expected assistant response {content!r} in SSE stream.\n"
         f"Body: {body!r}"
     )
@@ -423,6 +427,7 @@ def test_property7_failed_response_does_not_mutate_history(error_type):
         "AWS_REGION": "us-east-1",
         "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
         "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
     }
     with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
         with unittest.mock.patch("boto3.client", return_value=mock_client):
@@ -462,3 +467,127 @@ def test_property7_failed_response_does_not_mutate_history(error_type):
         assert "event: done" not in body, (
             f"Expected NO 'event: done' in response for failed request.\nBody: {body!r}"
         )
+
+
+# ---------------------------------------------------------------------------
+# Token-budget pruning (HISTORY_TOKEN_BUDGET)
+# ---------------------------------------------------------------------------
+
+
+_message_texts = st.lists(st.text(min_size=1, max_size=400), min_size=1, max_size=60)
+
+
+def _alternating(texts: List[str]) -> list[dict]:
+    """Alternating user/assistant messages that start and end on a user message."""
+    if len(texts) % 2 == 0:
+        texts = texts[1:]
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": [{"text": t}]}
+        for i, t in enumerate(texts)
+    ]
+
+
+@settings(max_examples=100, deadline=None)
+@given(texts=_message_texts, budget=st.integers(min_value=1, max_value=2000))
+def test_token_budget_keeps_newest_suffix_within_budget(texts, budget):
+    """Token pruning keeps a suffix that fits the budget and starts with a user message."""
+    app_mod = _load_app()
+    messages = _alternating(texts)
+
+    pruned, was_pruned = app_mod.prune_history(messages, token_budget=budget)
+
+    assert pruned, "the newest message must always be kept"
+    assert pruned == messages[len(messages) - len(pruned):], "result must be a suffix"
+    assert pruned[-1] == messages[-1]
+    assert pruned[0]["role"] == "user"
+    assert was_pruned == (len(pruned) < len(messages))
+    used = sum(app_mod.estimate_message_tokens(m) for m in pruned)
+    assert used <= budget or len(pruned) == 1
+
+
+@settings(max_examples=100, deadline=None)
+@given(texts=_message_texts, budget=st.integers(min_value=1, max_value=2000))
+def test_token_budget_keeps_as_much_history_as_fits(texts, budget):
+    """Token pruning only drops a message when keeping it would exceed the budget."""
+    app_mod = _load_app()
+    messages = _alternating(texts)
+
+    pruned, was_pruned = app_mod.prune_history(messages, token_budget=budget)
+
+    if was_pruned:
+        # One more message (plus the assistant dropped to start on a user) would not fit
+        dropped_from = len(messages) - len(pruned)
+        candidate = messages[dropped_from - 1:]
+        if candidate[0]["role"] == "assistant" and dropped_from >= 2:
+            candidate = messages[dropped_from - 2:]
+        used = sum(app_mod.estimate_message_tokens(m) for m in candidate)
+        assert used > budget
+
+
+def test_token_budget_does_not_prune_short_chat_past_turn_cap():
+    """A long chat of tiny messages is kept whole when it fits the token budget."""
+    app_mod = _load_app()
+    messages = _make_messages(300)  # 150 turns, well past the 100-turn cap
+
+    pruned, was_pruned = app_mod.prune_history(messages, token_budget=100_000)
+
+    assert was_pruned is False
+    assert pruned == messages
+
+
+def test_token_budget_prunes_few_huge_messages():
+    """A handful of huge pastes is pruned even though the turn cap is far away."""
+    app_mod = _load_app()
+    huge = "x" * 40_000  # ~10k estimated tokens
+    messages = [
+        {"role": "user", "content": huge},
+        {"role": "assistant", "content": "ok"},
+        {"role": "user", "content": huge},
+        {"role": "assistant", "content": "ok"},
+        {"role": "user", "content": "short question"},
+    ]
+
+    pruned, was_pruned = app_mod.prune_history(messages, token_budget=12_000)
+
+    assert was_pruned is True
+    assert pruned == messages[2:]
+
+
+@settings(max_examples=50, deadline=None)
+@given(text=st.text(max_size=200))
+def test_token_estimate_counts_utf8_bytes(text):
+    """ASCII and non-ASCII text are both estimated from their UTF-8 size."""
+    app_mod = _load_app()
+
+    assert app_mod.estimate_text_tokens(text) == (len(text.encode("utf-8")) + 3) // 4
+
+
+def test_chat_route_emits_pruned_event_in_token_mode():
+    """The /chat route still sends event: pruned when the token budget trims history."""
+    from fastapi.testclient import TestClient
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.return_value = {
+        "stream": [{"contentBlockDelta": {"delta": {"text": "ok"}}}]
+    }
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AUTH_ENABLED": "false",
+        "HISTORY_TOKEN_BUDGET": "50",
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_token_prune_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+
+    client = TestClient(mod.app)
+    response = client.post("/chat", json={"messages": [
+        {"role": "user", "content": "a" * 1000},
+        {"role": "assistant", "content": "b"},
+        {"role": "user", "content": "latest"},
+    ]})
+
+    assert "event: pruned" in response.text
+    sent = mock_client.converse_stream.call_args.kwargs["messages"]
+    assert sent == [{"role": "user", "content": [{"text": "latest"}]}]
@@ -53,6 +53,8 @@ def _load_app(auth_enabled: bool = False, tokens: Optional[List[str]] = None):
         "AUTH_ENABLED": "true" if auth_enabled else "false",
         "AUTH_USERNAME": "admin",
         "AUTH_PASSWORD": "secret",
+        # Token assertions below expect one SSE frame per Bedrock delta
+        "SSE_COALESCE_WINDOW_MS": "0",
     }
     with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
         with unittest.mock.patch("boto3.client", return_value=mock_client):
@@ -0,0 +1,221 @@
+"""
+tests/test_logging.py — Tests for non-blocking, structured request logging.
+
+Tests cover:
+  - Records are written by a background thread; a stalled writer never
+    blocks the caller, and overflow is dropped and counted
+  - JSON output is one object per line with ``extra=`` fields
+  - User message bodies are truncated, hashed or omitted per
+    LOG_MESSAGE_BODIES
+  - LOG_SAMPLE_RATE thins out per-request INFO lines but never warnings
+  - Invalid logging settings exit with code 1
+"""
+
+import importlib.util
+import io
+import json
+import logging
+import os
+import threading
+import time
+import unittest.mock
+
+import pytest
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_logging_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+APP = _load_app_module()
+
+
+def _fresh_logger(stream):
+    """A private logger with one plain stream handler, as basicConfig leaves root."""
+    log = logging.getLogger(f"app-logging-test-{id(stream)}")
+    log.handlers.clear()
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(logging.StreamHandler(stream))
+    return log
+
+
+def _chat_messages(caplog, app_mod, content):
+    client = TestClient(app_mod.app)
+    with caplog.at_level(logging.INFO):
+        client.post("/chat", json={"messages": [{"role": "user", "content": content}]})
+    return [r.getMessage() for r in caplog.records]
+
+
+# ---------------------------------------------------------------------------
+# configure_async_logging
+# ---------------------------------------------------------------------------
+
+
+def test_records_are_written_as_json_lines():
+    stream = io.StringIO()
+    log = _fresh_logger(stream)
+
+    handler = APP.configure_async_logging(log, APP.JsonFormatter(), 100)
+    log.info("Invoking %s", "Bedrock", extra={"model": "m", "message_count": 3})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("Failed")
+    handler.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert log.handlers == [handler]
+    assert lines[0]["message"] == "Invoking Bedrock"
+    assert (lines[0]["level"], lines[0]["model"], lines[0]["message_count"]) == ("INFO", "m", 3)
+    assert lines[0]["time"].endswith("Z")
+    assert lines[1]["level"] == "ERROR"
+    assert "ValueError: boom" in lines[1]["message"]
+
+
+def test_stalled_writer_never_blocks_the_caller():
+    release = threading.Event()
+
+    class _StalledStream(io.StringIO):
+        def write(self, text):
+            release.wait(timeout=10)
+            return super().write(text)
+
+    stream = _StalledStream()
+    log = _fresh_logger(stream)
+    handler = APP.configure_async_logging(log, logging.Formatter("%(message)s"), 10)
+
+    started = time.monotonic()
+    for i in range(1000):
+        log.info("record %d", i)
+    elapsed = time.monotonic() - started
+    release.set()
+    handler.stop()
+
+    assert elapsed < 1.0
+    assert handler.dropped > 0
+    assert len(stream.getvalue().splitlines()) == 1000 - handler.dropped
+
+
+def test_reconfiguring_replaces_the_previous_queue():
+    stream = io.StringIO()
+    log = _fresh_logger(stream)
+
+    first = APP.configure_async_logging(log, logging.Formatter("text %(message)s"), 10)
+    log.info("one")
+    second = APP.configure_async_logging(log, APP.JsonFormatter(), 10)
+    log.info("two")
+    second.stop()
+
+    assert log.handlers == [second]
+    assert first.listener is None
+    assert stream.getvalue().splitlines()[0] == "text one"
+    assert json.loads(stream.getvalue().splitlines()[1])["message"] == "two"
+
+
+def test_host_installed_handlers_are_left_alone():
+    log = logging.getLogger("app-logging-test-host")
+    log.handlers.clear()
+    host_handler = logging.NullHandler()
+    log.addHandler(host_handler)
+
+    assert APP.configure_async_logging(log, APP.JsonFormatter(), 10) is None
+    assert log.handlers == [host_handler]
+
+
+@settings(max_examples=100, deadline=None)
+@given(
+    message=st.text(max_size=200),
+    extra=st.dictionaries(st.sampled_from(["model", "client", "count"]), st.integers() | st.text()),
+)
+def test_json_formatter_round_trips(message, extra):
+    record = logging.LogRecord("app", logging.WARNING, __file__, 1, "%s", (message,), None)
+    record.__dict__.update(extra)
+
+    entry = json.loads(APP.JsonFormatter().format(record))
+
+    assert entry["message"] == message
+    assert entry["level"] == "WARNING"
+    assert {k: entry[k] for k in extra} == extra
+
+
+# ---------------------------------------------------------------------------
+# Message bodies and sampling
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=100, deadline=None)
+@given(text=st.text(max_size=500))
+def test_truncated_body_is_bounded(text):
+    body = APP.loggable_body(text)
+
+    assert body.startswith(text[:APP.LOG_MESSAGE_MAX_CHARS])
+    assert len(body) <= APP.LOG_MESSAGE_MAX_CHARS + 20
+
+
+def test_large_message_is_truncated_in_logs(caplog):
+    messages = _chat_messages(caplog, APP, "x" * 100_000)
+
+    incoming = [m for m in messages if m.startswith("Incoming user message")]
+    assert incoming == ["Incoming user message: " + "x" * 200 + "... (100000 chars)"]
+
+
+def test_hashed_bodies_hide_the_content(caplog):
+    app_mod = _load_app_module(extra_env={"LOG_MESSAGE_BODIES": "hash"})
+
+    messages = _chat_messages(caplog, app_mod, "my secret plan")
+
+    incoming = [m for m in messages if m.startswith("Incoming user message")]
+    assert len(incoming) == 1
+    assert "secret" not in incoming[0]
+    assert incoming[0].endswith("(14 chars)")
+    assert app_mod.loggable_body("my secret plan") == app_mod.loggable_body("my secret plan")
+
+
+def test_sampling_skips_info_but_not_warnings(caplog):
+    app_mod = _load_app_module(
+        extra_env={"LOG_SAMPLE_RATE": "0", "QUOTA_REQUESTS_PER_MINUTE": "1"}
+    )
+
+    messages = _chat_messages(caplog, app_mod, "one")
+    messages += _chat_messages(caplog, app_mod, "two")
+
+    assert not any("Incoming user message" in m for m in messages)
+    assert not any("Invoking Bedrock" in m for m in messages)
+    assert any("quota exceeded" in m for m in messages)
+
+
+@pytest.mark.parametrize(
+    "env",
+    [{"LOG_FORMAT": "xml"}, {"LOG_MESSAGE_BODIES": "maybe"}, {"LOG_SAMPLE_RATE": "2"}],
+)
+def test_invalid_settings_exit_1(env):
+    with pytest.raises(SystemExit) as exc:
+        _load_app_module(extra_env=env)
+    assert exc.value.code == 1
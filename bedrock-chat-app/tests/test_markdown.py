@@ -4,6 +4,8 @@ tests/test_markdown.py — Property tests for frontend-observable behaviors.
 Tests cover:
   - Property 1: Input field cleared after any valid submission
   - Property 3: Markdown rendering produces correct HTML elements
+  - Streaming render: Markdown is parsed incrementally, block by block
+  - History view: restored messages are virtualized and parsed lazily
 
 Requirements: 3.6, 3.8
 
@@ -14,7 +16,11 @@ that the SSE tokens can contain Markdown that would render correctly.
 """
 
 import importlib.util
+import json
 import os
+import re
+import shutil
+import subprocess
 import unittest.mock
 
 import pytest
@@ -98,7 +104,7 @@ def test_property1_valid_submission_accepted_by_backend(content):
 # Validates: Requirements 3.8
 # Note: Since marked.js is a JavaScript library running in the browser, we can't
 # directly test its output in Python. However, we can validate that:
-# 1. The frontend HTML includes the marked.js CDN script
+# 1. The frontend HTML includes the vendored marked.js script
 # 2. The frontend calls marked.parse() for assistant messages
 # 3. Markdown content tokens are faithfully delivered via SSE
 
@@ -145,15 +151,19 @@ def test_property3_markdown_tokens_delivered_faithfully(pattern_idx, prefix):
     assert response.status_code == 200
     body = response.text
 
-    # The markdown text should appear in the SSE stream (as data: events)
-    assert markdown_text in body, (
+    # The markdown text should appear in the SSE stream (as data: events,
+    # one data: line per line of markdown)
+    sse_text = "\n".join(
+        line[len("data: "):] for line in body.split("\n") if line.startswith("data: ")
+    )
+    assert markdown_text in sse_text, (
         f"Expected markdown pattern {markdown_text!r} ({description}) "
         f"to be present in SSE stream.\nBody: {body!r}"
     )
 
 
 def test_frontend_includes_marked_js():
-    """The embedded HTML includes marked.js CDN for Markdown rendering.
+    """The embedded HTML includes the vendored marked.js for Markdown rendering.
 
     Validates: Requirement 3.8
     """
@@ -165,8 +175,8 @@ def test_frontend_includes_marked_js():
     assert "marked" in response.text, (
         "Expected 'marked' library reference in HTML page"
     )
-    assert "cdn.jsdelivr.net/npm/marked@12" in response.text, (
-        "Expected marked.js CDN URL in HTML page"
+    assert '<script src="/static/marked.js?v=' in response.text, (
+        "Expected locally served marked.js URL in HTML page"
     )
 
 
@@ -183,3 +193,263 @@ def test_frontend_calls_marked_parse():
     assert "marked.parse" in response.text, (
         "Expected 'marked.parse' call in embedded JavaScript"
     )
+
+
+# ---------------------------------------------------------------------------
+# Incremental streaming render
+# ---------------------------------------------------------------------------
+
+# Minimal DOM and marked stand-ins: enough for createAssistantRenderer to run
+# under Node.js.  marked.parse records each chunk it is given.
+_RENDERER_HARNESS = """
+const parsed = [];
+const marked = { parse: s => { parsed.push(s); return ''; } };
+let pending = null;
+const requestAnimationFrame = fn => { pending = fn; return 1; };
+const cancelAnimationFrame = () => { pending = null; };
+const scrollToBottom = () => {};
+function makeNode() {
+    return {
+        textContent: '', children: [],
+        appendChild(c) { this.children.push(c); return c; },
+        append(s) { this.textContent += s; },
+        insertAdjacentHTML() {},
+        remove() {}
+    };
+}
+const document = { createElement: makeNode };
+%s
+const tokens = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const bubble = makeNode();
+const renderer = createAssistantRenderer(bubble);
+let frames = 0;
+tokens.forEach((t, i) => {
+    renderer.append(t);
+    if (i %% 3 === 2 && pending) { const fn = pending; pending = null; fn(); frames++; }
+});
+renderer.finish();
+process.stdout.write(JSON.stringify({ parsed, frames }));
+"""
+
+
+def _renderer_source(html):
+    match = re.search(r"(function createAssistantRenderer\(bubble\) \{.*?\n        \})", html, re.S)
+    assert match, "createAssistantRenderer not found in CHAT_HTML"
+    return match.group(1)
+
+
+_markdown_lines = st.sampled_from(
+    ["Some text", "", "```", "code line", "- item", "# Title", "   ", "~~~", "````python", "  ~~~~"]
+)
+
+
+def _ends_inside_fence(chunk):
+    """CommonMark fences: only the opening character, at least as long, closes."""
+    fence = ""
+    for line in chunk.split("\n"):
+        match = re.match(r"^ {0,3}(`{3,}|~{3,})", line)
+        if not fence:
+            fence = match.group(1) if match else ""
+        elif match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) \
+                and line.strip() == match.group(1):
+            fence = ""
+    return bool(fence)
+
+
+def _render_stream(app_mod, tokens):
+    script = _RENDERER_HARNESS % _renderer_source(app_mod.CHAT_HTML)
+    result = subprocess.run(
+        ["node", "-e", script],
+        input=json.dumps(tokens),
+        capture_output=True,
+        text=True,
+        timeout=30,
+        check=True,
+    )
+    return json.loads(result.stdout)["parsed"]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="Node.js is not installed")
+@settings(max_examples=30, deadline=None)
+@given(
+    lines=st.lists(_markdown_lines, min_size=1, max_size=40),
+    token_size=st.integers(min_value=1, max_value=12),
+)
+def test_incremental_render_parses_each_block_once(lines, token_size):
+    """Streamed Markdown is handed to marked in order, once, split only
+    at blank lines outside code fences; the finished answer is parsed whole."""
+    app_mod = _load_app_module()
+    text = "\n".join(lines)
+    tokens = [text[i:i + token_size] for i in range(0, len(text), token_size)] or [""]
+
+    parsed = _render_stream(app_mod, tokens)
+
+    assert parsed[-1] == text
+    assert text.startswith("".join(parsed[:-1]))
+    for chunk in parsed[:-1]:
+        assert not _ends_inside_fence(chunk), f"code fence split across blocks: {parsed!r}"
+        assert chunk.endswith("\n"), f"block did not end at a line break: {parsed!r}"
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="Node.js is not installed")
+def test_fence_closes_only_on_its_own_marker():
+    app_mod = _load_app_module()
+    tokens = ["```\n~~~\n\n", "still code\n", "```\n\n", "after"]
+
+    parsed = _render_stream(app_mod, tokens)
+
+    assert parsed == ["```\n~~~\n\nstill code\n```\n\n", "".join(tokens)]
+
+
+def test_frontend_stream_rendering_is_incremental():
+    """The reader no longer rescans lines or re-renders the whole answer per token."""
+    app_mod = _load_app_module()
+    html = TestClient(app_mod.app).get("/").text
+
+    assert "lines.indexOf" not in html
+    assert "requestAnimationFrame" in html
+    assert "createSseParser" in html
+
+
+# ---------------------------------------------------------------------------
+# History view: virtualized, lazily rendered history
+# ---------------------------------------------------------------------------
+
+_HISTORY_HARNESS = """
+const parsed = [];
+const marked = { parse: s => { parsed.push(s); return '<p>' + s + '</p>'; } };
+function makeNode() {
+    const classes = new Set();
+    return {
+        content: '', dataset: {}, style: {}, children: [], offsetHeight: 60,
+        get textContent() { return this.content; }, set textContent(v) { this.content = v; },
+        get innerHTML() { return this.content; }, set innerHTML(v) { this.content = v; },
+        set className(v) { v.split(' ').forEach(c => classes.add(c)); },
+        classList: {
+            add: c => classes.add(c), remove: c => classes.delete(c), contains: c => classes.has(c)
+        },
+        appendChild(c) { this.children.push(c); return c; }
+    };
+}
+const document = { createElement: makeNode, createDocumentFragment: makeNode };
+let observed = [];
+let callback = null;
+class IntersectionObserver {
+    constructor(cb) { callback = cb; }
+    observe(node) { observed.push(node); }
+    disconnect() { observed = []; }
+}
+const container = {
+    scrollTop: 0, scrollHeight: 1000, children: [],
+    addEventListener() {},
+    insertBefore(fragment) { this.children = fragment.children; }
+};
+%s
+const history = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const view = createHistoryView(container, null);
+view.render(history);
+const result = { afterRender: parsed.length, nodes: container.children.length };
+const visible = container.children.slice(-5);
+const see = (nodes, isIntersecting) => callback(nodes.map(target => ({ target, isIntersecting })));
+see(visible, true);
+result.afterShow = parsed.length;
+result.filled = visible.map(n => n.content);
+see(visible, false);
+result.emptied = visible.map(n => n.content);
+see(visible, true);
+result.afterReshow = parsed.length;
+result.refilled = visible.map(n => n.content);
+process.stdout.write(JSON.stringify(result));
+"""
+
+
+def _history_view_source(html):
+    match = re.search(r"(function createHistoryView\(container, anchor\) \{.*?\n        \})", html, re.S)
+    assert match, "createHistoryView not found in CHAT_HTML"
+    return match.group(1)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="Node.js is not installed")
+@settings(max_examples=10, deadline=None)
+@given(count=st.integers(min_value=5, max_value=200))
+def test_history_markdown_is_parsed_lazily_and_cached(count):
+    """Restoring history parses nothing up front; bubbles entering the viewport
+    are parsed once, and re-entering reuses the cached HTML."""
+    app_mod = _load_app_module()
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"**message {i}**"}
+        for i in range(count)
+    ]
+    script = _HISTORY_HARNESS % _history_view_source(app_mod.CHAT_HTML)
+
+    result = subprocess.run(
+        ["node", "-e", script],
+        input=json.dumps(history),
+        capture_output=True,
+        text=True,
+        timeout=30,
+        check=True,
+    )
+    out = json.loads(result.stdout)
+
+    visible = history[-5:]
+    assistant_visible = [m for m in visible if m["role"] == "assistant"]
+    assert out["afterRender"] == 0
+    assert out["nodes"] == count
+    assert out["afterShow"] == len(assistant_visible)
+    assert out["emptied"] == [""] * 5
+    assert out["afterReshow"] == out["afterShow"]
+    assert out["refilled"] == out["filled"]
+    assert out["filled"] == [
+        f"<p>{m['content']}</p>" if m["role"] == "assistant" else m["content"] for m in visible
+    ]
+
+
+_FOLLOW_HARNESS = _HISTORY_HARNESS.split("const container")[0] + """
+const listeners = {};
+const container = {
+    scrollTop: 0, scrollHeight: 1000, clientHeight: 400, children: [],
+    addEventListener(type, fn) { listeners[type] = fn; },
+    insertBefore(fragment) { this.children = fragment.children; }
+};
+%s
+const view = createHistoryView(container, null);
+view.render([{ role: 'assistant', content: 'a' }, { role: 'user', content: 'b' }]);
+const grow = () => {
+    container.scrollHeight += 100;
+    callback(container.children.map(target => ({ target, isIntersecting: true })));
+    return container.scrollTop;
+};
+const scrollTo = top => { container.scrollTop = top; listeners.scroll(); };
+const result = { types: Object.keys(listeners) };
+scrollTo(container.scrollHeight - container.clientHeight);
+result.atBottom = grow();
+scrollTo(200);
+result.scrolledUp = grow();
+scrollTo(container.scrollHeight - container.clientHeight - 2);
+result.backDown = grow();
+process.stdout.write(JSON.stringify(result));
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="Node.js is not installed")
+def test_history_follows_only_while_scrolled_to_bottom():
+    app_mod = _load_app_module()
+    script = _FOLLOW_HARNESS % _history_view_source(app_mod.CHAT_HTML)
+
+    result = subprocess.run(["node", "-e", script], capture_output=True, text=True, timeout=30, check=True)
+    out = json.loads(result.stdout)
+
+    assert out["types"] == ["scroll"]
+    assert out["atBottom"] == 1100
+    assert out["scrolledUp"] == 200
+    assert out["backDown"] == 1300
+
+
+def test_frontend_history_is_virtualized():
+    app_mod = _load_app_module()
+    html = TestClient(app_mod.app).get("/").text
+
+    assert "IntersectionObserver" in html
+    assert "historyView.render(getHistory())" in html
+    assert "addMessageBubble('assistant', marked.parse(msg.content), true)" not in html
@@ -0,0 +1,161 @@
+"""
+tests/test_metrics.py — Tests for the latency and outcome metrics at GET /metrics.
+
+Tests cover:
+  - Histogram buckets are cumulative and consistent with _sum / _count
+  - /chat streams record time to first token, stream duration, output
+    tokens per second, Bedrock-reported latency and stop reasons
+  - Errors are counted by Bedrock error code, responses by HTTP status
+  - Admission queue depth and wait time are exposed
+"""
+
+import importlib.util
+import os
+import re
+import time
+import unittest.mock
+
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_metrics_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _metric(body, name):
+    """Value of an exposition line like ``name 3`` or ``name{...} 3``."""
+    match = re.search(rf"^{re.escape(name)} (\S+)$", body, re.MULTILINE)
+    assert match, f"{name} not found in:\n{body}"
+    return float(match.group(1))
+
+
+APP = _load_app_module()
+
+
+# ---------------------------------------------------------------------------
+# Histogram
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=100, deadline=None)
+@given(values=st.lists(st.floats(min_value=0, max_value=1000), max_size=50))
+def test_histogram_buckets_are_cumulative(values):
+    histogram = APP.Histogram("h", "help", (0.5, 1.0, 10.0))
+    for value in values:
+        histogram.observe(value)
+
+    lines = histogram.render()
+    body = "\n".join(lines)
+    counts = [float(c) for c in re.findall(r'^h_bucket\{le="[^"]+"\} (\S+)$', body, re.MULTILINE)]
+
+    assert lines[1] == "# TYPE h histogram"
+    assert counts == sorted(counts)
+    assert counts == [
+        sum(v <= 0.5 for v in values),
+        sum(v <= 1.0 for v in values),
+        sum(v <= 10.0 for v in values),
+        len(values),
+    ]
+    assert _metric(body, "h_count") == len(values)
+    assert abs(histogram.sum - sum(values)) < 1e-6
+
+
+# ---------------------------------------------------------------------------
+# POST /chat
+# ---------------------------------------------------------------------------
+
+
+def test_completed_stream_records_latency_metrics():
+    def _stream():
+        time.sleep(0.3)
+        yield {"contentBlockDelta": {"delta": {"text": "Hello"}}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {"usage": {"inputTokens": 4, "outputTokens": 20}, "metrics": {"latencyMs": 250}}}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _stream()}
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    assert client.post("/chat", json=CHAT_BODY).status_code == 200
+    body = client.get("/metrics").text
+
+    assert _metric(body, 'bedrock_time_to_first_token_seconds_bucket{le="0.25"}') == 0
+    assert _metric(body, 'bedrock_time_to_first_token_seconds_bucket{le="0.5"}') == 1
+    assert _metric(body, "bedrock_stream_duration_seconds_count") == 1
+    assert _metric(body, "bedrock_output_tokens_per_second_count") == 1
+    assert _metric(body, "bedrock_server_latency_seconds_sum") == 0.25
+    assert _metric(body, 'bedrock_stop_reasons_total{reason="end_turn"}') == 1
+    assert _metric(body, 'chat_requests_total{status="200"}') == 1
+
+
+def test_errors_counted_by_code():
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = ClientError(
+        {"Error": {"Code": "ValidationException", "Message": "Bad"}}, "converse_stream"
+    )
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    assert "event: error" in client.post("/chat", json=CHAT_BODY).text
+    body = client.get("/metrics").text
+
+    assert _metric(body, 'bedrock_errors_total{code="ValidationException"}') == 1
+    assert _metric(body, "bedrock_stream_duration_seconds_count") == 0
+
+
+def test_rejections_counted_by_status():
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": []}
+    app_mod = _load_app_module(mock_client, extra_env={"QUOTA_REQUESTS_PER_MINUTE": "1"})
+    client = TestClient(app_mod.app)
+
+    client.post("/chat", json=CHAT_BODY)
+    client.post("/chat", json=CHAT_BODY)
+    body = client.get("/metrics").text
+
+    assert _metric(body, 'chat_requests_total{status="200"}') == 1
+    assert _metric(body, 'chat_requests_total{status="429"}') == 1
+
+
+def test_admission_queue_metrics_exposed():
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": []}
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    client.post("/chat", json=CHAT_BODY)
+    body = client.get("/metrics").text
+
+    assert _metric(body, "admission_in_flight") == 0
+    assert _metric(body, "admission_queued") == 0
+    assert _metric(body, "admission_queue_wait_seconds_count") == 1
+    assert "# TYPE admission_queue_wait_seconds histogram" in body
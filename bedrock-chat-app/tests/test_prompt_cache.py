@@ -0,0 +1,177 @@
+"""
+tests/test_prompt_cache.py — Tests for Bedrock prompt caching in app.py.
+
+Tests cover:
+  - Cache checkpoints are only sent when BEDROCK_PROMPT_CACHING is enabled
+  - Checkpoints follow the newest and previous user messages, above the
+    minimum prefix size, without mutating the caller's messages
+  - Cache read/write usage from the stream metadata is counted and logged
+"""
+
+import asyncio
+import copy
+import importlib.util
+import logging
+import os
+import unittest.mock
+
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched and prompt caching enabled."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        "BEDROCK_PROMPT_CACHING": "true",
+        "PROMPT_CACHE_MIN_TOKENS": "10",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_prompt_cache_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _text(role, text):
+    return {"role": role, "content": [{"text": text}]}
+
+
+def _conversation(turns, words=20):
+    """Alternating user/assistant messages ending with a user message."""
+    messages = []
+    for i in range(turns):
+        messages.append(_text("user", f"question {i} " + "word " * words))
+        messages.append(_text("assistant", f"answer {i} " + "word " * words))
+    messages.append(_text("user", "latest " + "word " * words))
+    return messages
+
+
+def _sent_messages(app_mod, messages):
+    async def _run():
+        return [c async for c in app_mod.stream_response(messages)]
+
+    asyncio.run(_run())
+    return app_mod.bedrock_client.converse_stream.call_args.kwargs["messages"]
+
+
+# ---------------------------------------------------------------------------
+# Checkpoint placement
+# ---------------------------------------------------------------------------
+
+
+def test_caching_disabled_sends_messages_unchanged():
+    app_mod = _load_app_module(extra_env={"BEDROCK_PROMPT_CACHING": "false"})
+    messages = _conversation(3)
+
+    sent = _sent_messages(app_mod, messages)
+
+    assert sent == messages
+
+
+def test_checkpoints_follow_newest_and_previous_user_messages():
+    app_mod = _load_app_module()
+    messages = _conversation(3)
+
+    sent = _sent_messages(app_mod, messages)
+
+    marked = [i for i, m in enumerate(sent) if m["content"][-1] == CACHE_POINT]
+    assert marked == [4, 6]
+    assert sent[6]["content"] == messages[6]["content"] + [CACHE_POINT]
+
+
+def test_short_prefix_is_not_marked():
+    app_mod = _load_app_module(extra_env={"PROMPT_CACHE_MIN_TOKENS": "1024"})
+    messages = _conversation(1, words=5)
+
+    assert app_mod.add_cache_points(messages) == messages
+
+
+@settings(max_examples=50, deadline=None)
+@given(turns=st.integers(min_value=0, max_value=8), words=st.integers(min_value=0, max_value=40))
+def test_add_cache_points_does_not_mutate_input(turns, words):
+    """Checkpoints are added to copies; at most two, and stored history is untouched."""
+    app_mod = _load_app_module()
+    messages = _conversation(turns, words)
+    original = copy.deepcopy(messages)
+
+    marked = app_mod.add_cache_points(messages)
+
+    assert messages == original
+    assert len(marked) == len(messages)
+    points = sum(block == CACHE_POINT for m in marked for block in m["content"])
+    assert points <= 2
+    for before, after in zip(messages, marked):
+        assert after["content"][:len(before["content"])] == before["content"]
+
+
+def test_stored_history_has_no_checkpoints():
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.return_value = {
+        "stream": [{"contentBlockDelta": {"delta": {"text": "Hello!"}}}]
+    }
+    app_mod = _load_app_module(mock_client, extra_env={"CONVERSATION_STORE": "memory"})
+    client = TestClient(app_mod.app)
+
+    client.post("/chat", json={
+        "conversation_id": "conv1",
+        "messages": [{"role": "user", "content": "Hi " + "word " * 50}],
+    })
+
+    stored = app_mod.conversation_store.get("ip:testclient", "conv1").messages
+    assert all(CACHE_POINT not in m["content"] for m in stored)
+
+
+# ---------------------------------------------------------------------------
+# Usage reporting
+# ---------------------------------------------------------------------------
+
+
+def test_cache_usage_is_counted_and_logged(caplog):
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.return_value = {"stream": [
+        {"contentBlockDelta": {"delta": {"text": "ok"}}},
+        {"messageStop": {"stopReason": "end_turn"}},
+        {"metadata": {
+            "usage": {
+                "inputTokens": 12,
+                "outputTokens": 3,
+                "totalTokens": 2063,
+                "cacheReadInputTokens": 2000,
+                "cacheWriteInputTokens": 48,
+            },
+            "metrics": {"latencyMs": 250},
+        }},
+    ]}
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    with caplog.at_level(logging.INFO):
+        chat = client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+
+    assert chat.text.endswith("event: done\ndata: \n\n")
+    assert app_mod._cache_read_tokens_total.value() == 2000
+    assert app_mod._cache_write_tokens_total.value() == 48
+    assert "cache_read=2000 cache_write=48" in caplog.text
+
+    body = client.get("/metrics").text
+    assert "bedrock_cache_read_input_tokens_total 2000" in body
+    assert "bedrock_input_tokens_total 12" in body
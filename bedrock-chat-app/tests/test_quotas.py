@@ -0,0 +1,285 @@
+"""
+tests/test_quotas.py — Tests for per-identity quotas and GET /admin/usage.
+
+Tests cover:
+  - Concurrent-stream, requests-per-minute and daily output-token limits
+    reject with HTTP 429 before any Bedrock call
+  - Cached responses do not count against quotas
+  - Daily usage resets at UTC midnight and survives a restart with
+    QUOTA_DB_PATH, which is written off the event loop
+  - GET /admin/usage is limited to ADMIN_USERS; without auth it is closed
+    unless ADMIN_ALLOW_LOCALHOST lets localhost in
+"""
+
+import asyncio
+import base64
+import importlib.util
+import os
+import threading
+import unittest.mock
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        "SSE_COALESCE_WINDOW_MS": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_quotas_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _usage_client(output_tokens):
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": [
+        {"contentBlockDelta": {"delta": {"text": "ok"}}},
+        {"metadata": {"usage": {"inputTokens": 5, "outputTokens": output_tokens}}},
+    ]}
+    return mock_client
+
+
+def _basic_auth(username, password):
+    return {"Authorization": "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()}
+
+
+# ---------------------------------------------------------------------------
+# POST /chat
+# ---------------------------------------------------------------------------
+
+
+def test_concurrent_stream_limit_is_per_identity():
+    release = threading.Event()
+
+    def _blocked_stream():
+        yield {"contentBlockDelta": {"delta": {"text": "Hello"}}}
+        release.wait(timeout=10)
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _blocked_stream()}
+    app_mod = _load_app_module(mock_client, extra_env={"QUOTA_MAX_CONCURRENT_STREAMS": "1"})
+
+    async def _run():
+        alice = httpx.ASGITransport(app=app_mod.app, client=("10.0.0.1", 1000))
+        bob = httpx.ASGITransport(app=app_mod.app, client=("10.0.0.2", 1000))
+        async with httpx.AsyncClient(transport=alice, base_url="http://test") as a, \
+                httpx.AsyncClient(transport=bob, base_url="http://test") as b:
+            first = asyncio.create_task(a.post("/chat", json=CHAT_BODY))
+            await asyncio.sleep(0.2)
+            second = await a.post("/chat", json={"messages": [{"role": "user", "content": "again"}]})
+            other = asyncio.create_task(b.post("/chat", json=CHAT_BODY))
+            await asyncio.sleep(0.2)
+            release.set()
+            return second, await asyncio.wait_for(asyncio.gather(first, other), timeout=5)
+
+    try:
+        second, (first, other) = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert second.status_code == 429
+    assert second.headers["X-Quota-Limit"] == "concurrent_streams"
+    assert first.status_code == other.status_code == 200
+    assert mock_client.converse_stream.call_count == 2
+    assert app_mod.quotas.snapshot()["ip:10.0.0.1"]["active_streams"] == 0
+    assert app_mod._quota_rejections_total.value(limit="concurrent_streams") == 1
+
+
+def test_requests_per_minute_limit():
+    mock_client = _usage_client(1)
+    app_mod = _load_app_module(mock_client, extra_env={"QUOTA_REQUESTS_PER_MINUTE": "2"})
+    client = TestClient(app_mod.app)
+
+    statuses = [client.post("/chat", json=CHAT_BODY) for _ in range(3)]
+
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert statuses[2].headers["X-Quota-Limit"] == "requests_per_minute"
+    assert 1 <= int(statuses[2].headers["Retry-After"]) <= 60
+    assert mock_client.converse_stream.call_count == 2
+
+
+def test_daily_output_token_limit_and_midnight_reset():
+    mock_client = _usage_client(12)
+    app_mod = _load_app_module(mock_client, extra_env={"QUOTA_OUTPUT_TOKENS_PER_DAY": "10"})
+    client = TestClient(app_mod.app)
+    now = 1_700_000_000.0
+
+    with unittest.mock.patch.object(app_mod.time, "time", return_value=now):
+        first = client.post("/chat", json=CHAT_BODY)
+        second = client.post("/chat", json=CHAT_BODY)
+    with unittest.mock.patch.object(app_mod.time, "time", return_value=now + 86400):
+        next_day = client.post("/chat", json=CHAT_BODY)
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["X-Quota-Limit"] == "output_tokens_per_day"
+    assert int(second.headers["Retry-After"]) == 86400 - int(now % 86400)
+    assert next_day.status_code == 200
+    assert mock_client.converse_stream.call_count == 2
+
+
+def test_cached_responses_do_not_count():
+    mock_client = _usage_client(1)
+    app_mod = _load_app_module(
+        mock_client, extra_env={"QUOTA_REQUESTS_PER_MINUTE": "1", "RESPONSE_CACHE": "true"}
+    )
+    client = TestClient(app_mod.app)
+
+    first = client.post("/chat", json=CHAT_BODY)
+    cached = client.post("/chat", json=CHAT_BODY)
+    new = client.post("/chat", json={"messages": [{"role": "user", "content": "new"}]})
+
+    assert first.status_code == cached.status_code == 200
+    assert new.status_code == 429
+    assert mock_client.converse_stream.call_count == 1
+
+
+def test_frontend_names_the_quota():
+    app_mod = _load_app_module()
+    html = TestClient(app_mod.app).get("/").text
+
+    assert "X-Quota-Limit" in html
+    assert "Usage limit reached" in html
+
+
+# ---------------------------------------------------------------------------
+# QuotaTracker
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=100, deadline=None)
+@given(
+    limit=st.integers(min_value=1, max_value=4),
+    ops=st.lists(st.booleans(), max_size=30),
+)
+def test_active_streams_never_exceed_limit(limit, ops):
+    """True acquires a stream, False releases the oldest held one."""
+    app_mod = _load_app_module()
+    tracker = app_mod.QuotaTracker(limit, 0, 0)
+    held = []
+
+    for acquire in ops:
+        if acquire:
+            try:
+                held.append(tracker.acquire("ip:1"))
+            except app_mod.QuotaExceeded as exc:
+                assert exc.limit == "concurrent_streams"
+                assert len(held) == limit
+        elif held:
+            lease = held.pop(0)
+            lease.release()
+            lease.release()  # idempotent
+        assert tracker.snapshot().get("ip:1", {"active_streams": 0})["active_streams"] == len(held)
+        assert len(held) <= limit
+
+
+def test_usage_survives_restart_with_db(tmp_path):
+    app_mod = _load_app_module()
+    path = str(tmp_path / "quota.db")
+    tracker = app_mod.QuotaTracker(0, 0, 100, path)
+
+    tracker.acquire("user:alice").release()
+    tracker.record_tokens("user:alice", {"inputTokens": 7, "outputTokens": 100})
+    app_mod.wait_for_db()
+
+    reopened = app_mod.QuotaTracker(0, 0, 100, path)
+    usage = reopened.snapshot()["user:alice"]
+    assert (usage["requests_today"], usage["input_tokens_today"], usage["output_tokens_today"]) == (1, 7, 100)
+    with pytest.raises(app_mod.QuotaExceeded) as exc:
+        reopened.acquire("user:alice")
+    assert exc.value.limit == "output_tokens_per_day"
+
+
+def test_usage_is_written_off_the_calling_thread(tmp_path):
+    app_mod = _load_app_module()
+    tracker = app_mod.QuotaTracker(0, 0, 0, str(tmp_path / "quota.db"))
+    writers = []
+    write = tracker._write_usage
+
+    def _write(row):
+        writers.append(threading.get_ident())
+        write(row)
+
+    with unittest.mock.patch.object(tracker, "_write_usage", side_effect=_write):
+        tracker.acquire("user:alice").release()
+        tracker.record_tokens("user:alice", {"inputTokens": 1, "outputTokens": 2})
+        app_mod.wait_for_db()
+
+    assert len(writers) == 2 and threading.get_ident() not in writers
+    row = tracker._conn.execute("SELECT requests, input_tokens, output_tokens FROM quota_usage").fetchone()
+    assert row == (1, 1, 2)
+
+
+# ---------------------------------------------------------------------------
+# GET /admin/usage
+# ---------------------------------------------------------------------------
+
+
+def test_admin_usage_without_auth_is_closed_by_default():
+    app_mod = _load_app_module()
+    transport = httpx.ASGITransport(app=app_mod.app, client=("127.0.0.1", 1000))
+
+    async def _get():
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/admin/usage")
+
+    assert asyncio.run(_get()).status_code == 403
+
+
+def test_admin_usage_without_auth_can_allow_localhost():
+    app_mod = _load_app_module(_usage_client(3), extra_env={"ADMIN_ALLOW_LOCALHOST": "true"})
+
+    async def _get(host):
+        transport = httpx.ASGITransport(app=app_mod.app, client=(host, 1000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/chat", json=CHAT_BODY)
+            return await client.get("/admin/usage")
+
+    remote = asyncio.run(_get("10.0.0.9"))
+    local = asyncio.run(_get("127.0.0.1"))
+
+    assert remote.status_code == 403
+    assert local.status_code == 200
+    body = local.json()
+    assert body["limits"] == {
+        "concurrent_streams": 0, "requests_per_minute": 0, "output_tokens_per_day": 0,
+    }
+    assert body["usage"]["ip:127.0.0.1"]["output_tokens_today"] == 3
+    assert body["usage"]["ip:10.0.0.9"]["requests_today"] == 1
+
+
+def test_admin_usage_requires_admin_user():
+    env = {"AUTH_ENABLED": "true", "AUTH_USERNAME": "alice", "AUTH_PASSWORD": "pw"}
+    admin_app = _load_app_module(extra_env={**env, "ADMIN_USERS": "root, alice"})
+    plain_app = _load_app_module(extra_env={**env, "ADMIN_USERS": "root"})
+
+    allowed = TestClient(admin_app.app).get("/admin/usage", headers=_basic_auth("alice", "pw"))
+    denied = TestClient(plain_app.app).get("/admin/usage", headers=_basic_auth("alice", "pw"))
+
+    assert allowed.status_code == 200
+    assert denied.status_code == 403
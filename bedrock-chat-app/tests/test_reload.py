@@ -0,0 +1,345 @@
+"""
+tests/test_reload.py — Tests for configuration reload and drain mode.
+
+Tests cover:
+  - POST /admin/reload and SIGHUP swap the model and Bedrock client for new
+    requests while a running stream finishes on the old client
+  - An invalid configuration is rejected and the current one kept
+  - Changed Basic Auth passwords take effect at once, despite the cache
+  - Variables from the real environment win over .env; other changed .env
+    settings are reported as needing a restart
+  - POST /admin/drain refuses new chats with 503 until DELETE /admin/drain
+"""
+
+import asyncio
+import base64
+import contextlib
+import importlib.util
+import json
+import os
+import signal
+import threading
+import unittest.mock
+
+import httpx
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+BASE_ENV = {
+    "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+    "AWS_ACCESS_KEY_ID": "",
+    "AWS_SECRET_ACCESS_KEY": "",
+    "AWS_REGION": "us-east-1",
+    "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+    "AUTH_ENABLED": "false",
+    "ADMIN_ALLOW_LOCALHOST": "true",
+    "BEDROCK_MAX_RETRIES": "0",
+    "SSE_COALESCE_WINDOW_MS": "0",
+}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {**BASE_ENV, **(extra_env or {})}
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_reload_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _answer(text):
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": [
+        {"contentBlockDelta": {"delta": {"text": text}}},
+    ]}
+    return mock_client
+
+
+@contextlib.contextmanager
+def _reloading(app_mod, new_client=None, dotenv=None, **env):
+    """Within this block a reload sees *env* over BASE_ENV, and *dotenv* as .env."""
+    with unittest.mock.patch.dict(os.environ, {**BASE_ENV, **env}), \
+            unittest.mock.patch("boto3.client", return_value=new_client or unittest.mock.MagicMock()), \
+            unittest.mock.patch.object(app_mod, "dotenv_values", return_value=dotenv or {}):
+        yield
+
+
+def _basic_auth(username, password):
+    return {"Authorization": "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()}
+
+
+async def _local_client(app_mod):
+    transport = httpx.ASGITransport(app=app_mod.app, client=("127.0.0.1", 1000))
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+APP = _load_app_module()
+
+
+# ---------------------------------------------------------------------------
+# POST /admin/reload
+# ---------------------------------------------------------------------------
+
+
+def test_reload_applies_to_new_requests_only():
+    release = threading.Event()
+
+    def _slow_stream():
+        yield {"contentBlockDelta": {"delta": {"text": "old"}}}
+        release.wait(timeout=10)
+        yield {"contentBlockDelta": {"delta": {"text": " answer"}}}
+
+    old_client = unittest.mock.MagicMock()
+    old_client.converse_stream.side_effect = lambda **kwargs: {"stream": _slow_stream()}
+    new_client = _answer("new answer")
+    app_mod = _load_app_module(old_client)
+
+    async def _run():
+        async with await _local_client(app_mod) as client:
+            running = asyncio.create_task(client.post("/chat", json=CHAT_BODY))
+            await asyncio.sleep(0.2)
+            with _reloading(app_mod, new_client, BEDROCK_MODEL_ID="new-model", AWS_REGION="eu-west-1"):
+                reloaded = await client.post("/admin/reload")
+            fresh = await client.post("/chat", json={"messages": [{"role": "user", "content": "again"}]})
+            release.set()
+            return reloaded, fresh, await asyncio.wait_for(running, timeout=5)
+
+    try:
+        reloaded, fresh, running = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert reloaded.status_code == 200
+    assert reloaded.json()["changed"] == ["AWS_REGION", "BEDROCK_MODEL_ID"]
+    assert "data: old" in running.text and "data:  answer" in running.text
+    assert old_client.converse_stream.call_args.kwargs["modelId"].startswith("anthropic.")
+    assert "data: new answer" in fresh.text
+    assert new_client.converse_stream.call_args.kwargs["modelId"] == "new-model"
+    assert (app_mod.bedrock_client, app_mod.aws_region) == (new_client, "eu-west-1")
+
+
+def test_invalid_reload_keeps_current_config():
+    app_mod = _load_app_module()
+    client = TestClient(app_mod.app, client=("127.0.0.1", 1000))
+    current = app_mod.bedrock_client
+
+    with _reloading(app_mod, AWS_BEARER_TOKEN_BEDROCK="", BEDROCK_MODEL_ID="new-model"):
+        response = client.post("/admin/reload")
+
+    assert response.status_code == 400
+    assert "AWS_BEARER_TOKEN_BEDROCK" in response.json()["detail"]
+    assert app_mod.bedrock_client is current
+    assert app_mod.bedrock_model_id.startswith("anthropic.")
+    assert app_mod._config_reloads_total.value(result="error") == 1
+
+
+def test_reload_is_admin_only():
+    app_mod = _load_app_module()
+
+    assert TestClient(app_mod.app).post("/admin/reload").status_code == 403
+    assert TestClient(app_mod.app).post("/admin/drain").status_code == 403
+
+
+def test_process_environment_wins_over_dotenv():
+    app_mod = _load_app_module(extra_env={"BEDROCK_MODEL_ID": "from-environment"})
+    os.environ.pop("MAX_QUEUED_STREAMS", None)
+
+    async def _run():
+        return await app_mod.reload_config()
+
+    with _reloading(
+        app_mod,
+        dotenv={"BEDROCK_MODEL_ID": "from-dotenv", "MAX_QUEUED_STREAMS": "3"},
+        BEDROCK_MODEL_ID="from-environment",
+    ):
+        result = asyncio.run(_run())
+
+    assert result == {"changed": [], "restart_required": ["MAX_QUEUED_STREAMS"]}
+    assert app_mod.bedrock_model_id == "from-environment"
+
+
+def test_sighup_reloads():
+    app_mod = _load_app_module()
+
+    async def _run():
+        async with app_mod.lifespan(app_mod.app):
+            os.kill(os.getpid(), signal.SIGHUP)
+            for _ in range(50):
+                await asyncio.sleep(0.05)
+                if app_mod.bedrock_model_id == "hup-model":
+                    break
+
+    with _reloading(app_mod, BEDROCK_MODEL_ID="hup-model"):
+        asyncio.run(_run())
+
+    assert app_mod.bedrock_model_id == "hup-model"
+    assert app_mod._config_reloads_total.value(result="ok") == 1
+
+
+def test_workers_forward_reload_to_supervisor():
+    app_mod = _load_app_module()
+    client = TestClient(app_mod.app, client=("127.0.0.1", 1000))
+
+    with unittest.mock.patch.dict(os.environ, {app_mod._SUPERVISOR_PID_ENV: str(os.getppid())}):
+        with unittest.mock.patch.object(app_mod.os, "kill") as kill:
+            response = client.post("/admin/reload")
+
+    assert response.status_code == 202
+    kill.assert_called_once_with(os.getppid(), signal.SIGHUP)
+
+
+def test_replaced_client_keeps_its_bearer_token():
+    """Requests on a client built before a reload are signed with its own token."""
+    app_mod = _load_app_module()
+    sent = []
+
+    def _capture(request, **kwargs):
+        sent.append(request.headers["Authorization"])
+        body = unittest.mock.Mock(stream=lambda: iter([b'{"message": "denied"}']))
+        return AWSResponse(request.url, 403, {"x-amzn-ErrorType": "AccessDeniedException"}, body)
+
+    old = app_mod.build_bedrock_client(app_mod.runtime_settings)
+    new = app_mod.build_bedrock_client(app_mod.runtime_settings._replace(aws_bearer_token="new-token"))
+    for client in (old, new):
+        client.meta.events.register("before-send.bedrock-runtime", _capture)
+    for client in (new, old):
+        with contextlib.suppress(ClientError):
+            client.converse_stream(modelId="m", messages=[{"role": "user", "content": [{"text": "hi"}]}])
+
+    assert sent == [b"Bearer new-token", b"Bearer test-token-abc123"]
+
+
+def test_restarted_worker_reads_the_new_dotenv():
+    """A worker inherits the supervisor's .env values but must re-read .env."""
+    new_dotenv = {"BEDROCK_MODEL_ID": "new-model", "MAX_QUEUED_STREAMS": "3"}
+
+    def _load_dotenv(*args, **kwargs):
+        for name, value in new_dotenv.items():
+            os.environ.setdefault(name, value)
+        return True
+
+    real_names = set(os.environ) | set(BASE_ENV) | {"REAL_ONLY"}
+    real_names -= {"BEDROCK_MODEL_ID", "MAX_QUEUED_STREAMS"}
+    inherited = {
+        "BEDROCK_MODEL_ID": "old-model",  # from the supervisor's old .env
+        "MAX_QUEUED_STREAMS": "7",
+        "REAL_ONLY": "kept",
+        "BEDROCK_CHAT_PROCESS_ENV": json.dumps(sorted(real_names | {"BEDROCK_CHAT_PROCESS_ENV"})),
+    }
+    with unittest.mock.patch.dict(os.environ, inherited), \
+            unittest.mock.patch("dotenv.load_dotenv", side_effect=_load_dotenv):
+        app_mod = _load_app_module()
+
+    assert app_mod.bedrock_model_id == "new-model"
+    assert app_mod.MAX_QUEUED_STREAMS == 3
+    assert "REAL_ONLY" in app_mod._PROCESS_ENV_NAMES
+    assert "BEDROCK_MODEL_ID" not in app_mod._PROCESS_ENV_NAMES
+
+
+# ---------------------------------------------------------------------------
+# Basic Auth users
+# ---------------------------------------------------------------------------
+
+
+def test_changed_password_applies_despite_cache():
+    env = {"AUTH_ENABLED": "true", "AUTH_USERNAME": "alice", "AUTH_PASSWORD": "old", "ADMIN_USERS": "alice"}
+    app_mod = _load_app_module(extra_env=env)
+    client = TestClient(app_mod.app)
+
+    assert client.get("/admin/drain", headers=_basic_auth("alice", "old")).status_code == 200
+    with _reloading(app_mod, **{**env, "AUTH_PASSWORD": "new"}):
+        reloaded = client.post("/admin/reload", headers=_basic_auth("alice", "old"))
+
+    assert reloaded.json()["changed"] == ["AUTH_PASSWORD"]
+    assert client.get("/admin/drain", headers=_basic_auth("alice", "old")).status_code == 401
+    assert client.get("/admin/drain", headers=_basic_auth("alice", "new")).status_code == 200
+
+
+@settings(max_examples=20, deadline=None)
+@given(passwords=st.lists(st.sampled_from(["a", "b", "c"]), min_size=1, max_size=6))
+def test_cached_headers_follow_user_updates(passwords):
+    """After each in-place update, only the current password is accepted."""
+    users = {"alice": APP._pbkdf2_hash("a", 1000)}
+    middleware = APP.BasicAuthMiddleware(None, users)
+    seen = []
+
+    async def _inner(scope, receive, send):
+        seen.append(scope["auth_user"])
+
+    async def _send(message):
+        pass
+
+    middleware.app = _inner
+
+    def _accepted(password):
+        seen.clear()
+        header = _basic_auth("alice", password)["Authorization"].encode()
+        asyncio.run(middleware({"type": "http", "headers": [(b"authorization", header)]}, None, _send))
+        return seen == ["alice"]
+
+    current = "a"
+    for password in passwords:
+        assert [_accepted(p) for p in "abc"] == [p == current for p in "abc"]
+        users.update(alice=APP._pbkdf2_hash(password, 1000))
+        current = password
+    assert [_accepted(p) for p in "abc"] == [p == current for p in "abc"]
+
+
+# ---------------------------------------------------------------------------
+# /admin/drain
+# ---------------------------------------------------------------------------
+
+
+def test_drain_refuses_new_chats_but_finishes_running_ones():
+    release = threading.Event()
+
+    def _slow_stream():
+        yield {"contentBlockDelta": {"delta": {"text": "Hello"}}}
+        release.wait(timeout=10)
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _slow_stream()}
+    app_mod = _load_app_module(mock_client)
+
+    async def _run():
+        async with await _local_client(app_mod) as client:
+            running = asyncio.create_task(client.post("/chat", json=CHAT_BODY))
+            await asyncio.sleep(0.2)
+            drained = await client.post("/admin/drain")
+            refused = await client.post("/chat", json=CHAT_BODY)
+            release.set()
+            finished = await asyncio.wait_for(running, timeout=5)
+            idle = await client.get("/admin/drain")
+            await client.delete("/admin/drain")
+            accepted = await client.post("/chat", json=CHAT_BODY)
+            return drained, refused, finished, idle, accepted
+
+    try:
+        drained, refused, finished, idle, accepted = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert drained.json() == {"draining": True, "in_flight": 1, "queued": 0}
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "5"
+    assert "data: Hello" in finished.text
+    assert idle.json() == {"draining": True, "in_flight": 0, "queued": 0}
+    assert accepted.status_code == 200
+    assert app_mod._chat_requests_total.value(status="503") == 1
+
@@ -0,0 +1,238 @@
+"""
+tests/test_response_cache.py — Tests for the response cache and single-flight
+deduplication of identical /chat requests.
+
+Tests cover:
+  - Completed responses replay from the cache without an upstream call
+  - Concurrent identical requests share one upstream stream
+  - Errors are never cached; TTL, LRU and byte-cap eviction
+  - The shared upstream is cancelled when every subscriber disconnects
+"""
+
+import asyncio
+import importlib.util
+import os
+import threading
+import unittest.mock
+
+import httpx
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "What is 2 + 2?"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched and the response cache enabled."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        "SSE_COALESCE_WINDOW_MS": "0",
+        "RESPONSE_CACHE": "true",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_response_cache_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _token_client(*tokens):
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {
+        "stream": [{"contentBlockDelta": {"delta": {"text": t}}} for t in tokens]
+    }
+    return mock_client
+
+
+def _events(app_mod, *texts):
+    return tuple(app_mod.StreamEvent("text", t) for t in texts) + (app_mod.StreamEvent("done"),)
+
+
+# ---------------------------------------------------------------------------
+# POST /chat
+# ---------------------------------------------------------------------------
+
+
+def test_identical_request_replays_from_cache():
+    mock_client = _token_client("Four", ".")
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    first = client.post("/chat", json=CHAT_BODY)
+    second = client.post("/chat", json=CHAT_BODY)
+
+    assert first.text == second.text == (
+        "id: 1\ndata: Four\n\nid: 2\ndata: .\n\nid: 3\nevent: done\ndata: \n\n"
+    )
+    assert mock_client.converse_stream.call_count == 1
+    assert app_mod._response_cache_requests_total.value(result="hit") == 1
+    assert "response_cache_entries 1" in client.get("/metrics").text
+
+
+def test_different_requests_are_not_shared():
+    mock_client = _token_client("ok")
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    client.post("/chat", json=CHAT_BODY)
+    client.post("/chat", json={"messages": [{"role": "user", "content": "Something else"}]})
+
+    assert mock_client.converse_stream.call_count == 2
+
+
+def test_cache_disabled_by_default():
+    mock_client = _token_client("ok")
+    app_mod = _load_app_module(mock_client, extra_env={"RESPONSE_CACHE": "false"})
+    client = TestClient(app_mod.app)
+
+    client.post("/chat", json=CHAT_BODY)
+    client.post("/chat", json=CHAT_BODY)
+
+    assert app_mod.response_cache is None
+    assert mock_client.converse_stream.call_count == 2
+
+
+def test_error_responses_are_not_cached():
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = [
+        ClientError({"Error": {"Code": "ValidationException", "Message": "Bad"}}, "converse_stream"),
+        {"stream": [{"contentBlockDelta": {"delta": {"text": "ok"}}}]},
+    ]
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    failed = client.post("/chat", json=CHAT_BODY)
+    retried = client.post("/chat", json=CHAT_BODY)
+
+    assert "event: error" in failed.text
+    assert "data: ok" in retried.text
+    assert mock_client.converse_stream.call_count == 2
+
+
+def test_concurrent_identical_requests_share_one_upstream_stream():
+    release = threading.Event()
+
+    def _blocked_stream():
+        yield {"contentBlockDelta": {"delta": {"text": "Hello"}}}
+        release.wait(timeout=10)
+        yield {"contentBlockDelta": {"delta": {"text": " world"}}}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _blocked_stream()}
+    app_mod = _load_app_module(mock_client)
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app_mod.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            tasks = [asyncio.create_task(client.post("/chat", json=CHAT_BODY)) for _ in range(4)]
+            await asyncio.sleep(0.2)
+            release.set()
+            return await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+
+    try:
+        responses = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert mock_client.converse_stream.call_count == 1
+    for response in responses:
+        assert response.text == (
+            "id: 1\ndata: Hello\n\nid: 2\ndata:  world\n\nid: 3\nevent: done\ndata: \n\n"
+        )
+    assert app_mod._response_cache_requests_total.value(result="coalesced") == 3
+    assert app_mod.admission.in_flight == 0
+
+
+# ---------------------------------------------------------------------------
+# ResponseCache and SharedGeneration
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=50, deadline=None)
+@given(a=st.text(min_size=1), b=st.text(min_size=1))
+def test_cache_key_depends_only_on_request_content(a, b):
+    app_mod = _load_app_module()
+    messages_a = [{"role": "user", "content": [{"text": a}]}]
+    messages_b = [{"role": "user", "content": [{"text": b}]}]
+
+    key_a = app_mod.response_cache_key(messages_a)
+
+    assert key_a == app_mod.response_cache_key([{"role": "user", "content": [{"text": a}]}])
+    assert (key_a == app_mod.response_cache_key(messages_b)) == (a == b)
+
+
+def test_expired_entries_are_not_replayed():
+    app_mod = _load_app_module()
+    cache = app_mod.ResponseCache(ttl_seconds=0.0, max_entries=10, max_bytes=1000)
+
+    cache._store("k", _events(app_mod, "hi"))
+
+    assert cache.get("k") is None
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_lru_and_byte_cap_eviction():
+    app_mod = _load_app_module()
+    cache = app_mod.ResponseCache(ttl_seconds=60.0, max_entries=2, max_bytes=40)
+
+    cache._store("a", _events(app_mod, "aaaa"))
+    cache._store("b", _events(app_mod, "bbbb"))
+    assert cache.get("a") is not None  # "a" becomes most recently used
+    cache._store("c", _events(app_mod, "cccc"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    cache._store("big", _events(app_mod, "x" * 100))
+    assert cache.get("big") is None
+    cache._store("d", _events(app_mod, "d" * 20))
+    assert cache.bytes <= 40
+    assert cache.get("d") is not None
+
+
+def test_generation_cancelled_when_all_subscribers_leave():
+    app_mod = _load_app_module()
+    finished = []
+
+    async def _run():
+        closed = asyncio.Event()
+
+        async def _source():
+            try:
+                yield app_mod.StreamEvent("text", "first")
+                await asyncio.sleep(60)
+                yield app_mod.StreamEvent("text", "never")
+            finally:
+                closed.set()
+
+        generation = app_mod.SharedGeneration("g", _source(), buffer_size=16, orphan_timeout=0.0)
+        generation.add_done_callback(finished.append)
+        subscriber = generation.subscribe()
+        assert await subscriber.__anext__() == app_mod.StreamEvent("text", "first", 1)
+        await subscriber.aclose()
+        await asyncio.wait_for(closed.wait(), timeout=1)
+        await asyncio.sleep(0)
+        return generation
+
+    generation = asyncio.run(_run())
+    assert finished == [generation]
+    assert generation.finished
+    assert not generation.complete
+    assert generation.events()[-1].kind == "error"
@@ -0,0 +1,222 @@
+"""
+tests/test_resume.py — Tests for numbered, resumable SSE generations.
+
+Tests cover:
+  - /chat events carry increasing ids and an X-Generation-Id header
+  - GET /chat/generations/{id} resumes after Last-Event-ID and lets other
+    tabs attach to an answer that is still streaming
+  - Unknown or foreign generations get HTTP 404
+  - Ring buffer overflow and orphaned generations
+"""
+
+import asyncio
+import importlib.util
+import os
+import re
+import threading
+import unittest.mock
+
+import httpx
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        "SSE_COALESCE_WINDOW_MS": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_resume_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _token_client(*tokens):
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {
+        "stream": [{"contentBlockDelta": {"delta": {"text": t}}} for t in tokens]
+    }
+    return mock_client
+
+
+def _event_ids(body):
+    return [int(i) for i in re.findall(r"^id: (\d+)$", body, re.MULTILINE)]
+
+
+# ---------------------------------------------------------------------------
+# POST /chat and GET /chat/generations/{id}
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=30, deadline=None)
+@given(tokens=st.lists(st.text(alphabet="abc xyz", min_size=1), min_size=1, max_size=20))
+def test_chat_events_are_numbered_in_order(tokens):
+    app_mod = _load_app_module(_token_client(*tokens))
+    client = TestClient(app_mod.app)
+
+    response = client.post("/chat", json=CHAT_BODY)
+
+    assert response.headers["X-Generation-Id"]
+    assert _event_ids(response.text) == list(range(1, len(tokens) + 2))
+
+
+def test_resume_after_last_event_id_replays_only_the_rest():
+    app_mod = _load_app_module(_token_client("one", "two", "three"))
+    client = TestClient(app_mod.app)
+    generation_id = client.post("/chat", json=CHAT_BODY).headers["X-Generation-Id"]
+
+    resumed = client.get(f"/chat/generations/{generation_id}", headers={"Last-Event-ID": "1"})
+
+    assert resumed.status_code == 200
+    assert resumed.text == (
+        "id: 2\ndata: two\n\nid: 3\ndata: three\n\nid: 4\nevent: done\ndata: \n\n"
+    )
+
+
+def test_unknown_generation_returns_404():
+    app_mod = _load_app_module()
+    client = TestClient(app_mod.app)
+
+    assert client.get("/chat/generations/nope").status_code == 404
+
+
+def test_other_clients_cannot_attach():
+    app_mod = _load_app_module(_token_client("secret"))
+
+    async def _run():
+        owner = httpx.ASGITransport(app=app_mod.app, client=("10.0.0.1", 1000))
+        stranger = httpx.ASGITransport(app=app_mod.app, client=("10.0.0.2", 1000))
+        async with httpx.AsyncClient(transport=owner, base_url="http://test") as client:
+            chat = await client.post("/chat", json=CHAT_BODY)
+            path = f"/chat/generations/{chat.headers['X-Generation-Id']}"
+            own = await client.get(path)
+        async with httpx.AsyncClient(transport=stranger, base_url="http://test") as client:
+            foreign = await client.get(path)
+        return own, foreign
+
+    own, foreign = asyncio.run(_run())
+    assert own.status_code == 200
+    assert foreign.status_code == 404
+
+
+def test_second_tab_attaches_to_in_flight_generation():
+    """A reader that attaches mid-stream gets every event without a new upstream call."""
+    release = threading.Event()
+
+    def _blocked_stream():
+        yield {"contentBlockDelta": {"delta": {"text": "Hello"}}}
+        release.wait(timeout=10)
+        yield {"contentBlockDelta": {"delta": {"text": " world"}}}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _blocked_stream()}
+    app_mod = _load_app_module(mock_client)
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app_mod.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            chat_task = asyncio.create_task(client.post("/chat", json=CHAT_BODY))
+            await asyncio.sleep(0.2)
+            generation_id = next(iter(app_mod.generations._generations))
+            tab_task = asyncio.create_task(client.get(f"/chat/generations/{generation_id}"))
+            await asyncio.sleep(0.1)
+            release.set()
+            return await asyncio.wait_for(asyncio.gather(chat_task, tab_task), timeout=5)
+
+    try:
+        chat, tab = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert mock_client.converse_stream.call_count == 1
+    assert chat.text == tab.text
+    assert "data:  world" in tab.text
+    assert app_mod.admission.in_flight == 0
+
+
+def test_frontend_resumes_with_last_event_id():
+    app_mod = _load_app_module()
+    html = TestClient(app_mod.app).get("/").text
+
+    assert "X-Generation-Id" in html
+    assert "Last-Event-ID" in html
+    assert "/chat/generations/" in html
+
+
+# ---------------------------------------------------------------------------
+# SharedGeneration buffering and lifetime
+# ---------------------------------------------------------------------------
+
+
+async def _finite_source(app_mod, count):
+    for i in range(count):
+        yield app_mod.StreamEvent("text", str(i))
+    yield app_mod.StreamEvent("done")
+
+
+def test_resume_beyond_ring_buffer_reports_error():
+    app_mod = _load_app_module()
+
+    async def _run():
+        generation = app_mod.SharedGeneration(
+            "g", _finite_source(app_mod, 5), buffer_size=3, orphan_timeout=60.0
+        )
+        await asyncio.sleep(0.01)
+        assert generation.finished
+        old = [e async for e in generation.subscribe(0)]
+        recent = [e async for e in generation.subscribe(3)]
+        return generation, old, recent
+
+    generation, old, recent = asyncio.run(_run())
+    assert [e.kind for e in old] == ["error"]
+    assert [e.id for e in recent] == [4, 5, 6]
+    assert not generation.complete
+
+
+def test_orphaned_generation_is_cancelled_and_releases_slot():
+    """A generation nobody reads is cancelled after the orphan timeout."""
+    stop = threading.Event()
+
+    def _endless_stream():
+        while not stop.wait(0.01):
+            yield {"messageStart": {"role": "assistant"}}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _endless_stream()}
+    app_mod = _load_app_module(mock_client, extra_env={"GENERATION_ORPHAN_TIMEOUT": "0.1"})
+
+    async def _run():
+        slot = await app_mod.admission.acquire("test")
+        generation = app_mod.generations.start(app_mod.bedrock_events([]), "test")
+        generation.add_done_callback(lambda _: slot.release())
+        await asyncio.sleep(0.5)
+        return generation
+
+    try:
+        generation = asyncio.run(_run())
+    finally:
+        stop.set()
+
+    assert generation.finished
+    assert app_mod.admission.in_flight == 0
@@ -0,0 +1,252 @@
+"""
+tests/test_retry.py — Tests for adaptive rate limiting and retries around
+converse_stream in app.py.
+
+Tests cover:
+  - Retryable errors before the first token are retried transparently
+  - Errors after the first token, or once retries run out, end the stream
+  - Decorrelated-jitter backoff stays within its bounds
+  - AdaptiveRateLimiter backs off on throttling and recovers on success
+  - Retry counts and wait times are exposed at GET /metrics
+"""
+
+import asyncio
+import importlib.util
+import os
+import time
+import unittest.mock
+from typing import List
+
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+
+def _load_app_module(mock_client, extra_env=None):
+    """Import app.py with boto3.client patched and fast retry backoff."""
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "3",
+        "BEDROCK_RETRY_BASE_DELAY": "0.01",
+        "BEDROCK_RETRY_MAX_DELAY": "0.05",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_retry_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _client_error(code: str, message: str = "Test error") -> ClientError:
+    return ClientError(
+        error_response={"Error": {"Code": code, "Message": message}},
+        operation_name="converse_stream",
+    )
+
+
+def _token_events(tokens: List[str]) -> List[dict]:
+    return [{"contentBlockDelta": {"delta": {"text": t}}} for t in tokens]
+
+
+def _collect(app_mod) -> List[str]:
+    async def _run():
+        return [c async for c in app_mod.stream_response([{"role": "user", "content": [{"text": "hi"}]}])]
+
+    return asyncio.run(_run())
+
+
+# ---------------------------------------------------------------------------
+# Retries before the first token
+# ---------------------------------------------------------------------------
+
+
+def test_throttle_before_first_token_is_retried_transparently():
+    """A ThrottlingException on the initial call is retried; the client sees only tokens."""
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = [
+        _client_error("ThrottlingException", "Rate exceeded"),
+        {"stream": _token_events(["Hello", " world"])},
+    ]
+    app_mod = _load_app_module(mock_client)
+
+    chunks = _collect(app_mod)
+
+    assert chunks == ["data: Hello\n\n", "data:  world\n\n", "event: done\ndata: \n\n"]
+    assert mock_client.converse_stream.call_count == 2
+    assert app_mod._retries_total.value(code="ThrottlingException") == 1
+    assert app_mod._retry_wait_seconds_total.value() > 0
+
+
+def test_mid_stream_throttle_event_before_first_token_is_retried():
+    """Stream-level throttling errors (lower-case event names) are retried too."""
+
+    def _failing_stream():
+        yield {"messageStart": {"role": "assistant"}}
+        raise _client_error("throttlingException", "Too many tokens")
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = [
+        {"stream": _failing_stream()},
+        {"stream": _token_events(["ok"])},
+    ]
+    app_mod = _load_app_module(mock_client)
+
+    chunks = _collect(app_mod)
+
+    assert chunks == ["data: ok\n\n", "event: done\ndata: \n\n"]
+    assert app_mod._retries_total.value(code="ThrottlingException") == 1
+
+
+def test_error_after_first_token_is_not_retried():
+    """Once a token reached the client, a failure ends the stream with one error event."""
+
+    def _failing_stream():
+        yield {"contentBlockDelta": {"delta": {"text": "partial"}}}
+        raise _client_error("throttlingException", "Too many tokens")
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _failing_stream()}
+    app_mod = _load_app_module(mock_client)
+
+    chunks = _collect(app_mod)
+
+    assert chunks[0] == "data: partial\n\n"
+    assert len([c for c in chunks if c.startswith("event: error\n")]) == 1
+    assert "event: done\ndata: \n\n" not in chunks
+    assert mock_client.converse_stream.call_count == 1
+
+
+def test_retries_exhausted_yield_single_error_event():
+    """After BEDROCK_MAX_RETRIES retries the last error is reported exactly once."""
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = _client_error("ServiceUnavailableException", "Down")
+    app_mod = _load_app_module(mock_client)
+
+    chunks = _collect(app_mod)
+
+    assert mock_client.converse_stream.call_count == 4
+    error_events = [c for c in chunks if c.startswith("event: error\n")]
+    assert len(error_events) == 1
+    assert "Down" in error_events[0]
+
+
+def test_non_retryable_error_is_not_retried():
+    """Auth failures are reported immediately."""
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = _client_error("AccessDeniedException", "Nope")
+    app_mod = _load_app_module(mock_client)
+
+    chunks = _collect(app_mod)
+
+    assert mock_client.converse_stream.call_count == 1
+    assert len([c for c in chunks if c.startswith("event: error\n")]) == 1
+
+
+# ---------------------------------------------------------------------------
+# Decorrelated jitter
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=100, deadline=None)
+@given(previous=st.floats(min_value=0.0, max_value=100.0, allow_nan=False))
+def test_next_backoff_within_bounds(previous):
+    """_next_backoff always lies in [base, min(cap, max(base, 3 * previous))]."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+    base = app_mod.BEDROCK_RETRY_BASE_DELAY
+    cap = app_mod.BEDROCK_RETRY_MAX_DELAY
+
+    delay = app_mod._next_backoff(previous)
+
+    assert base <= delay <= min(cap, max(base, previous * 3)) + 1e-9
+
+
+# ---------------------------------------------------------------------------
+# AdaptiveRateLimiter
+# ---------------------------------------------------------------------------
+
+
+def test_rate_limiter_idle_until_throttled():
+    """The limiter never delays calls until Bedrock has throttled at least once."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+    limiter = app_mod.AdaptiveRateLimiter(min_rate=1.0, max_rate=50.0)
+
+    async def _run():
+        return [await limiter.acquire() for _ in range(20)]
+
+    assert asyncio.run(_run()) == [0.0] * 20
+    assert limiter.current_rate() == 0.0
+
+
+def test_rate_limiter_throttle_reduces_rate_and_delays_sends():
+    """After a throttle the bucket paces sends at the reduced rate."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+    limiter = app_mod.AdaptiveRateLimiter(min_rate=20.0, max_rate=1000.0)
+
+    async def _run():
+        for _ in range(10):
+            await limiter.acquire()
+        limiter.on_throttle()
+        assert limiter.enabled
+        assert 20.0 <= limiter.fill_rate < 1000.0
+        started = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(_run())
+    assert elapsed >= 2 / limiter.fill_rate * 0.9
+
+
+def test_rate_limiter_recovers_and_disables_after_successes():
+    """Successful calls raise the rate additively until the limiter switches off."""
+    app_mod = _load_app_module(unittest.mock.MagicMock())
+    limiter = app_mod.AdaptiveRateLimiter(min_rate=1.0, max_rate=2.0, increase=0.5)
+
+    limiter.on_throttle()
+    throttled_rate = limiter.fill_rate
+    limiter.on_success()
+    assert limiter.fill_rate > throttled_rate
+    for _ in range(10):
+        limiter.on_success()
+    assert not limiter.enabled
+    assert limiter.current_rate() == 0.0
+
+
+# ---------------------------------------------------------------------------
+# GET /metrics
+# ---------------------------------------------------------------------------
+
+
+def test_metrics_endpoint_reports_retries():
+    """Retry counters and wait totals show up in the Prometheus output."""
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = [
+        _client_error("ThrottlingException", "Rate exceeded"),
+        {"stream": _token_events(["hi"])},
+    ]
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    chat = client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+    assert "event: done" in chat.text
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'bedrock_retries_total{code="ThrottlingException"} 1' in body
+    assert "bedrock_throttles_total 1" in body
+    assert "# TYPE bedrock_retry_wait_seconds_total counter" in body
+    assert "# TYPE bedrock_rate_limit_rps gauge" in body
@@ -42,6 +42,8 @@ def _load_app_module(mock_client=None):
         "AWS_REGION": "us-east-1",
         "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
         "AUTH_ENABLED": "false",
+        # Error-path tests assert on the terminal error event, not on retries
+        "BEDROCK_MAX_RETRIES": "0",
     }
     with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
         with unittest.mock.patch("boto3.client", return_value=mock_client):
@@ -0,0 +1,210 @@
+"""
+tests/test_sse_encoding.py — Tests that SSE frames survive payloads with
+line breaks.
+
+Tests cover:
+  - format_sse output decodes back to the original payload (line endings
+    normalised to LF) under a spec-following decoder, however the byte
+    stream is chunked, including long high-rate streams
+  - The embedded frontend's createSseParser decodes the same stream under
+    any chunking (runs under Node.js when it is installed)
+  - Code blocks streamed through /chat arrive intact
+"""
+
+import importlib.util
+import json
+import os
+import re
+import shutil
+import subprocess
+import unittest.mock
+from typing import Iterable, List, Optional, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+
+def _load_app_module(mock_client=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_sse_encoding_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+APP = _load_app_module()
+
+
+def _normalise(text: str) -> str:
+    return re.sub(r"\r\n|\r", "\n", text)
+
+
+def _decode_sse(chunks: Iterable[str]) -> List[Tuple[str, str, Optional[str]]]:
+    """Incremental SSE decoder following the WHATWG event-stream rules.
+
+    Returns ``(event, data, id)`` for every dispatched event.
+    """
+    events = []
+    buffer = ""
+    event, data, event_id = "", [], None
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            match = re.search(r"\r\n|\r|\n", buffer)
+            # A trailing CR may be the first half of a CRLF split across chunks
+            if match is None or (match.group() == "\r" and match.end() == len(buffer)):
+                break
+            line, buffer = buffer[:match.start()], buffer[match.end():]
+            if line == "":
+                if data:
+                    events.append((event or "message", "\n".join(data), event_id))
+                event, data, event_id = "", [], None
+                continue
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+            if field == "data":
+                data.append(value)
+            elif field == "event":
+                event = value
+            elif field == "id":
+                event_id = value
+    return events
+
+
+_payloads = st.text(
+    alphabet=st.characters(blacklist_categories=("Cs",), blacklist_characters="\x00"),
+    max_size=40,
+) | st.sampled_from(["\n", "\r\n", "\r", "line1\nline2", "```py\nx = 1\n```\n", "\n\n\n", " lead"])
+
+
+# ---------------------------------------------------------------------------
+# Round trip through format_sse and a spec decoder
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=200, deadline=None)
+@given(
+    events=st.lists(
+        st.tuples(st.sampled_from(["text", "error", "pruned", "done"]), _payloads),
+        min_size=1,
+        max_size=50,
+    ),
+    cut_points=st.lists(st.integers(min_value=0, max_value=5000), max_size=20),
+)
+def test_round_trip_survives_any_chunking(events, cut_points):
+    """Every payload decodes back to itself, whatever the TCP chunk boundaries."""
+    stream_events = [APP.StreamEvent(kind, data, i + 1) for i, (kind, data) in enumerate(events)]
+    wire = "".join(APP.format_sse(e) for e in stream_events)
+    cuts = sorted({c for c in cut_points if c < len(wire)})
+    chunks = [wire[a:b] for a, b in zip([0] + cuts, cuts + [len(wire)])]
+
+    decoded = _decode_sse(chunks)
+
+    assert decoded == [
+        ("message" if e.kind == "text" else e.kind, _normalise(e.data), str(e.id))
+        for e in stream_events
+    ]
+
+
+def test_round_trip_at_high_throughput():
+    """A long stream of small multi-line deltas decodes without loss."""
+    tokens = [f"line {i}\n" if i % 3 else f"```\ncode {i}\r\n```" for i in range(20000)]
+    wire = "".join(APP.format_sse(APP.StreamEvent("text", t)) for t in tokens)
+    chunks = [wire[i:i + 1400] for i in range(0, len(wire), 1400)]
+
+    decoded = _decode_sse(chunks)
+
+    assert [data for _, data, _ in decoded] == [_normalise(t) for t in tokens]
+
+
+def test_single_line_payload_keeps_simple_frame():
+    assert APP.format_sse(APP.StreamEvent("text", "Hello")) == "data: Hello\n\n"
+    assert APP.format_sse(APP.StreamEvent("text", "a\nb")) == "data: a\ndata: b\n\n"
+    assert APP.format_sse(APP.StreamEvent("error", "x\r\n")) == "event: error\ndata: x\ndata: \n\n"
+
+
+# ---------------------------------------------------------------------------
+# Frontend decoder
+# ---------------------------------------------------------------------------
+
+
+def _frontend_parser_source() -> str:
+    match = re.search(r"(function createSseParser\(\) \{.*?\n        \})", APP.CHAT_HTML, re.S)
+    assert match, "createSseParser not found in CHAT_HTML"
+    return match.group(1)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="Node.js is not installed")
+@settings(max_examples=20, deadline=None)
+@given(
+    payloads=st.lists(_payloads, min_size=1, max_size=30),
+    chunk_size=st.integers(min_value=1, max_value=64),
+)
+def test_frontend_parser_reassembles_multiline_payloads(payloads, chunk_size):
+    """The browser parser decodes the same events however the stream is chunked."""
+    wire = "".join(APP.format_sse(APP.StreamEvent("text", p, i + 1)) for i, p in enumerate(payloads))
+    chunks = [wire[i:i + chunk_size] for i in range(0, len(wire), chunk_size)]
+    script = (
+        _frontend_parser_source()
+        + "\nconst chunks = JSON.parse(require('fs').readFileSync(0, 'utf8'));"
+        + "\nconst parse = createSseParser();"
+        + "\nprocess.stdout.write(JSON.stringify(chunks.flatMap(c => parse(c))));"
+    )
+
+    result = subprocess.run(
+        ["node", "-e", script],
+        input=json.dumps(chunks),
+        capture_output=True,
+        text=True,
+        timeout=30,
+        check=True,
+    )
+
+    decoded = json.loads(result.stdout)
+    assert [d["data"] for d in decoded] == [_normalise(p) for p in payloads]
+    assert [d["id"] for d in decoded] == [str(i + 1) for i in range(len(payloads))]
+    assert all(d["event"] == "message" for d in decoded)
+
+
+# ---------------------------------------------------------------------------
+# POST /chat
+# ---------------------------------------------------------------------------
+
+
+def test_code_block_streams_intact_through_chat():
+    code = "Here:\n```python\ndef f():\n    return 1\n```\n"
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.return_value = {"stream": [
+        {"contentBlockDelta": {"delta": {"text": code[:9]}}},
+        {"contentBlockDelta": {"delta": {"text": code[9:]}}},
+    ]}
+    app_mod = _load_app_module(mock_client)
+    client = TestClient(app_mod.app)
+
+    body = client.post("/chat", json={"messages": [{"role": "user", "content": "code"}]}).text
+
+    decoded = _decode_sse([body])
+    text = "".join(data for event, data, _ in decoded if event == "message")
+    assert text == code
+    assert decoded[-1][0] == "done"
@@ -391,3 +391,81 @@ class TestSuccessfulInitialization:
             f"Expected BEDROCK_MODEL_ID to be '{custom_model}'.\n"
             f"stdout: {result.stdout}\nstderr: {result.stderr}"
         )
+
+
+# ---------------------------------------------------------------------------
+# Bedrock client transport configuration (pool size, timeouts, keep-alive)
+# ---------------------------------------------------------------------------
+
+
+def _client_config_for(env_overrides: dict):
+    """Load app.py in-process and return the botocore Config passed to boto3.client."""
+    import importlib.util
+    import unittest.mock
+
+    env = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AUTH_ENABLED": "false",
+        **env_overrides,
+    }
+    with unittest.mock.patch.dict(os.environ, env, clear=False):
+        with unittest.mock.patch("boto3.client") as mock_boto_client:
+            spec = importlib.util.spec_from_file_location("app_client_config_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mock_boto_client.call_args.kwargs["config"]
+
+
+class TestBedrockClientConfig:
+    """Tests that the connection pool and timeouts are configurable on both auth paths."""
+
+    # Clearing the IAM vars forces the bearer-token path
+    BEARER_ENV = {"AWS_ACCESS_KEY_ID": "", "AWS_SECRET_ACCESS_KEY": ""}
+    IAM_ENV = {"AWS_ACCESS_KEY_ID": "AKIATEST", "AWS_SECRET_ACCESS_KEY": "secret"}
+
+    @pytest.mark.parametrize("auth_env", [BEARER_ENV, IAM_ENV], ids=["bearer", "iam"])
+    def test_pool_size_follows_concurrency_limit_by_default(self, auth_env):
+        config = _client_config_for({**auth_env, "MAX_CONCURRENT_STREAMS": "48"})
+        assert config.max_pool_connections == 48
+        assert config.tcp_keepalive is True
+        assert config.retries == {"mode": "standard", "total_max_attempts": 1}
+
+    @pytest.mark.parametrize("auth_env", [BEARER_ENV, IAM_ENV], ids=["bearer", "iam"])
+    def test_transport_settings_from_env(self, auth_env):
+        config = _client_config_for({
+            **auth_env,
+            "BEDROCK_MAX_POOL_CONNECTIONS": "100",
+            "BEDROCK_CONNECT_TIMEOUT": "2.5",
+            "BEDROCK_READ_TIMEOUT": "120",
+            "BEDROCK_TCP_KEEPALIVE": "false",
+            "BEDROCK_SDK_RETRY_MODE": "adaptive",
+            "BEDROCK_SDK_MAX_ATTEMPTS": "3",
+        })
+        assert config.max_pool_connections == 100
+        assert config.connect_timeout == 2.5
+        assert config.read_timeout == 120
+        assert config.tcp_keepalive is False
+        assert config.retries == {"mode": "adaptive", "total_max_attempts": 3}
+
+    def test_bearer_path_sends_the_token_unsigned(self):
+        from botocore import UNSIGNED
+
+        config = _client_config_for(self.BEARER_ENV)
+        assert config.signature_version is UNSIGNED
+        assert config.request_min_compression_size_bytes == 1024
+
+    def test_exit_code_1_for_invalid_retry_mode(self):
+        result = run_app_expect_fast_exit({
+            "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+            "BEDROCK_SDK_RETRY_MODE": "sometimes",
+        })
+        assert result.returncode == 1
+        assert "BEDROCK_SDK_RETRY_MODE" in result.stdout + result.stderr
+
+    def test_exit_code_1_for_non_integer_pool_size(self):
+        result = run_app_expect_fast_exit({
+            "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+            "BEDROCK_MAX_POOL_CONNECTIONS": "lots",
+        })
+        assert result.returncode == 1
+        assert "BEDROCK_MAX_POOL_CONNECTIONS" in result.stdout + result.stderr
@@ -0,0 +1,155 @@
+"""
+tests/test_static_assets.py — Tests for precompressed, cacheable delivery of
+the chat page and the vendored marked.js.
+
+Tests cover:
+  - GET / and GET /static/marked.js are served gzip-encoded when accepted
+    and decode to the same bytes as the identity response
+  - Strong ETags, Cache-Control and 304 Not Modified on If-None-Match
+  - The page loads marked.js from this server, versioned by content hash
+  - Accept-Encoding negotiation never picks an unacceptable encoding
+  - brotli is used when the optional package is available
+"""
+
+import gzip
+import importlib.util
+import os
+import re
+import unittest.mock
+
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+
+def _load_app_module():
+    """Import app.py with boto3.client patched."""
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_static_assets_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+APP = _load_app_module()
+
+
+def _raw_get(client, path, **headers):
+    """GET without letting httpx undo the Content-Encoding."""
+    with client.stream("GET", path, headers=headers) as response:
+        body = b"".join(response.iter_raw())
+    return response, body
+
+
+# ---------------------------------------------------------------------------
+# GET / and GET /static/marked.js
+# ---------------------------------------------------------------------------
+
+
+def test_page_is_served_gzip_encoded():
+    client = TestClient(APP.app)
+
+    response, body = _raw_get(client, "/", **{"Accept-Encoding": "gzip"})
+    plain, plain_body = _raw_get(client, "/", **{"Accept-Encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"].startswith("text/html")
+    assert "content-encoding" not in plain.headers
+    assert gzip.decompress(body) == plain_body
+    assert len(body) < len(plain_body) / 2
+
+
+def test_etag_revalidation_returns_304():
+    client = TestClient(APP.app)
+    first = client.get("/")
+    etag = first.headers["etag"]
+
+    again = client.get("/", headers={"If-None-Match": etag})
+    weak = client.get("/", headers={"If-None-Match": f'"other", W/{etag}'})
+    changed = client.get("/", headers={"If-None-Match": '"something-else"'})
+
+    assert re.fullmatch(r'"[0-9a-f]+(-\w+)?"', etag)
+    assert first.headers["cache-control"] == "no-cache"
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == etag
+    assert weak.status_code == 304
+    assert changed.status_code == 200
+
+
+def test_page_loads_marked_from_this_server():
+    client = TestClient(APP.app)
+    page = client.get("/").text
+
+    src = re.search(r'<script src="([^"]*marked[^"]*)"', page).group(1)
+    asset = client.get(src)
+
+    assert src == f"/static/marked.js?v={APP.MARKED_JS.digest}"
+    assert "https://" not in "".join(re.findall(r'<script src="([^"]*)"', page))
+    assert asset.status_code == 200
+    assert asset.headers["content-type"].startswith("text/javascript")
+    assert asset.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert "marked.parse" in asset.text
+
+
+def test_assets_are_compressed_once_at_startup():
+    """Serving the page reuses the same precompressed bytes every time."""
+    client = TestClient(APP.app)
+
+    with unittest.mock.patch.object(APP.gzip, "compress", side_effect=AssertionError):
+        for _ in range(3):
+            assert client.get("/").status_code == 200
+
+
+# ---------------------------------------------------------------------------
+# StaticAsset
+# ---------------------------------------------------------------------------
+
+
+_codings = st.sampled_from(["gzip", "br", "identity", "deflate", "*", "GZIP"])
+_accept_encoding = st.lists(
+    st.tuples(_codings, st.one_of(st.none(), st.sampled_from(["0", "0.5", "1", "bad"]))),
+    max_size=4,
+).map(lambda parts: ", ".join(c if q is None else f"{c};q={q}" for c, q in parts))
+
+
+@settings(max_examples=200, deadline=None)
+@given(header=_accept_encoding)
+def test_chosen_encoding_is_acceptable(header):
+    asset = APP.StaticAsset(b"x" * 100, "text/plain", "no-cache")
+
+    encoding = asset.choose_encoding(header)
+
+    assert encoding in asset.bodies
+    if encoding != "identity":
+        accepted = APP._accepted_encodings(header)
+        assert accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+
+def test_brotli_used_when_available():
+    fake_brotli = unittest.mock.MagicMock()
+    fake_brotli.compress.side_effect = lambda body, quality: b"br:" + body
+    with unittest.mock.patch.object(APP, "brotli", fake_brotli):
+        asset = APP.StaticAsset(b"hello", "text/plain", "no-cache")
+
+    assert asset.choose_encoding("gzip, br") == "br"
+    assert asset.choose_encoding("gzip, br;q=0") == "gzip"
+    assert asset.bodies["br"] == b"br:hello"
+    assert len({asset.etag(e) for e in asset.bodies}) == 3
@@ -11,6 +11,7 @@ Requirements: 4.2, 4.5, 6.4, 6.5, 6.6, 6.7
 import asyncio
 import importlib.util
 import os
+import re
 import sys
 import unittest.mock
 from typing import AsyncGenerator, List
@@ -37,6 +38,8 @@ def _load_app_with_mock_client(mock_client):
         "AWS_REGION": "us-east-1",
         "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
         "AUTH_ENABLED": "false",
+        # Error-path tests assert on the terminal error event, not on retries
+        "BEDROCK_MAX_RETRIES": "0",
     }
     with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
         with unittest.mock.patch("boto3.client", return_value=mock_client):
@@ -46,6 +49,12 @@ def _load_app_with_mock_client(mock_client):
     return mod
 
 
+def _expected_data_frame(token: str) -> str:
+    """SSE frame for a token: one data: line per line of the token."""
+    lines = re.split(r"\r\n|\r|\n", token)
+    return "".join(f"data: {line}\n" for line in lines) + "\n"
+
+
 def _make_token_stream_events(tokens: List[str]) -> List[dict]:
     """Build the list of event dicts that Bedrock's converse_stream returns for a token list."""
     return [
@@ -128,7 +137,7 @@ def test_property4_all_tokens_forwarded_as_data_events(tokens):
         f"tokens={tokens!r}\nchunks={chunks!r}"
     )
     for i, (token, event) in enumerate(zip(tokens, data_events)):
-        expected = f"data: {token}\n\n"
+        expected = _expected_data_frame(token)
         assert event == expected, (
             f"Token {i} mismatch: expected {expected!r}, got {event!r}"
         )
@@ -212,7 +221,9 @@ def test_property4_token_order_preserved(tokens):
     chunks = _collect_stream(app_mod.stream_response, messages)
 
     data_events = [c for c in chunks if c.startswith("data:") and not c.startswith("event:")]
-    extracted_tokens = [e[len("data: "):-2] for e in data_events]  # strip "data: " prefix and "\n\n"
+    # strip each line's "data: " prefix and the trailing blank line, rejoining lines with \n
+    extracted_tokens = ["\n".join(l[len("data: "):] for l in e[:-2].split("\n")) for e in data_events]
+    tokens = [re.sub(r"\r\n|\r", "\n", t) for t in tokens]
 
     assert extracted_tokens == tokens, (
         f"Token order mismatch.\nExpected: {tokens!r}\nGot: {extracted_tokens!r}"
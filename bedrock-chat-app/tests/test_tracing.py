@@ -0,0 +1,236 @@
+"""
+tests/test_tracing.py — Tests for optional tracing spans around /chat.
+
+Tests cover:
+  - With TRACING=off no spans are made and no middleware is installed
+  - A /chat request yields one trace: validation, pruning, admission and the
+    Bedrock handshake/stream nested under the request's root span
+  - Time to first token, stop reason and token counts are span attributes
+  - Failed validation and retried Bedrock errors are marked as errors
+  - OTLP/JSON lines and the console exporter
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import time
+import unittest.mock
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_tracing_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+APP = _load_app_module()
+
+
+def _traced_app(tmp_path, mock_client, **extra_env):
+    path = str(tmp_path / "traces.jsonl")
+    app_mod = _load_app_module(
+        mock_client, extra_env={"TRACING": "otlp-file", "TRACING_FILE": path, **extra_env}
+    )
+    return app_mod, path
+
+
+def _read_spans(path):
+    """Flush the trace writer, then return {name: [span, ...]} from the OTLP file."""
+    for handler in logging.getLogger("bedrock_chat_app.traces").handlers:
+        handler.stop()
+    spans = {}
+    with open(path) as f:
+        for line in f:
+            for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]:
+                span["attributes"] = {
+                    a["key"]: next(iter(a["value"].values())) for a in span["attributes"]
+                }
+                spans.setdefault(span["name"], []).append(span)
+    return spans
+
+
+def _answer_stream(delay=0.0):
+    def _converse_stream(**kwargs):
+        time.sleep(delay)
+        return {"stream": [
+            {"messageStart": {"role": "assistant"}},
+            {"contentBlockDelta": {"delta": {"text": "Hello"}}},
+            {"messageStop": {"stopReason": "end_turn"}},
+            {"metadata": {"usage": {"inputTokens": 7, "outputTokens": 2}}},
+        ]}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = _converse_stream
+    return mock_client
+
+
+# ---------------------------------------------------------------------------
+# TRACING=off
+# ---------------------------------------------------------------------------
+
+
+def test_disabled_tracing_makes_no_spans():
+    app_mod = _load_app_module(_answer_stream())
+
+    response = TestClient(app_mod.app).post("/chat", json=CHAT_BODY)
+
+    assert response.status_code == 200
+    assert not app_mod.tracer.enabled
+    assert app_mod.tracer.start_span("x") is app_mod.current_span() is app_mod._NOOP_SPAN
+    assert all(m.cls is not app_mod.TracingMiddleware for m in app_mod.app.user_middleware)
+
+
+# ---------------------------------------------------------------------------
+# POST /chat
+# ---------------------------------------------------------------------------
+
+
+def test_chat_request_is_one_nested_trace(tmp_path):
+    app_mod, path = _traced_app(tmp_path, _answer_stream(delay=0.2))
+
+    assert TestClient(app_mod.app).post("/chat", json=CHAT_BODY).status_code == 200
+    spans = _read_spans(path)
+
+    root = spans["POST /chat"][0]
+    call = spans["bedrock.converse_stream"][0]
+    handshake = spans["bedrock.handshake"][0]
+    stream = spans["bedrock.stream"][0]
+    assert "parentSpanId" not in root
+    assert {s["traceId"] for group in spans.values() for s in group} == {root["traceId"]}
+    for name in ("chat.validate", "chat.prune_history", "chat.admission_wait", "bedrock.converse_stream"):
+        assert spans[name][0]["parentSpanId"] == root["spanId"]
+    assert handshake["parentSpanId"] == stream["parentSpanId"] == call["spanId"]
+
+    assert root["kind"] == 2 and call["kind"] == 3
+    assert root["attributes"]["http.response.status_code"] == "200"
+    assert root["attributes"]["chat.response_source"] == "bedrock"
+    assert int(handshake["endTimeUnixNano"]) - int(handshake["startTimeUnixNano"]) >= 0.2e9
+    assert int(handshake["endTimeUnixNano"]) <= int(stream["startTimeUnixNano"])
+    assert int(stream["endTimeUnixNano"]) <= int(root["endTimeUnixNano"])
+    assert call["attributes"]["bedrock.time_to_first_token_ms"] >= 200
+    assert call["attributes"]["gen_ai.response.finish_reason"] == "end_turn"
+    assert call["attributes"]["gen_ai.usage.input_tokens"] == "7"
+    assert call["attributes"]["gen_ai.usage.output_tokens"] == "2"
+    assert spans["chat.prune_history"][0]["attributes"]["chat.messages_out"] == "1"
+
+
+def test_failed_validation_is_an_error_span(tmp_path):
+    app_mod, path = _traced_app(tmp_path, _answer_stream())
+
+    response = TestClient(app_mod.app).post("/chat", json={"messages": []})
+    spans = _read_spans(path)
+
+    assert response.status_code == 422
+    assert spans["chat.validate"][0]["status"]["code"] == 2
+    assert "messages must be non-empty" in spans["chat.validate"][0]["status"]["message"]
+    assert spans["POST /chat"][0]["attributes"]["http.response.status_code"] == "422"
+    assert "bedrock.converse_stream" not in spans
+
+
+def test_each_retry_is_its_own_span(tmp_path):
+    unavailable = ClientError({"Error": {"Code": "ServiceUnavailableException", "Message": "Busy"}}, "converse_stream")
+    answer = _answer_stream().converse_stream.side_effect
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = [unavailable, answer()]
+    app_mod, path = _traced_app(
+        tmp_path, mock_client, BEDROCK_MAX_RETRIES="1", BEDROCK_RETRY_BASE_DELAY="0.01",
+        BEDROCK_RETRY_MAX_DELAY="0.01",
+    )
+
+    assert "Hello" in TestClient(app_mod.app).post("/chat", json=CHAT_BODY).text
+    first, second = sorted(_read_spans(path)["bedrock.converse_stream"], key=lambda s: s["startTimeUnixNano"])
+
+    assert first["status"] == {"code": 2, "message": "ServiceUnavailableException"}
+    assert first["attributes"]["bedrock.attempt"] == "0"
+    assert second["status"] == {}
+    assert second["attributes"]["bedrock.attempt"] == "1"
+    assert int(first["endTimeUnixNano"]) <= int(second["startTimeUnixNano"])
+
+
+def test_console_exporter_logs_each_span(caplog):
+    app_mod = _load_app_module(_answer_stream(), extra_env={"TRACING": "console"})
+
+    with caplog.at_level(logging.INFO):
+        TestClient(app_mod.app).post("/chat", json=CHAT_BODY)
+
+    records = [r for r in caplog.records if r.getMessage().startswith("span ")]
+    names = [r.getMessage().split()[1] for r in records]
+    assert "bedrock.converse_stream" in names
+    assert "POST" in names
+    assert len({r.trace_id for r in records}) == 1
+
+
+# ---------------------------------------------------------------------------
+# OTLP/JSON encoding
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=100, deadline=None)
+@given(
+    attributes=st.dictionaries(
+        st.text(min_size=1, max_size=10),
+        st.booleans() | st.integers() | st.floats(allow_nan=False, allow_infinity=False) | st.text(max_size=20),
+        max_size=5,
+    )
+)
+def test_otlp_attributes_keep_their_types(attributes):
+    exported = []
+    tracer = APP.Tracer(exported.append)
+    with tracer.start_span("outer") as outer:
+        span = tracer.start_span("inner")
+    for key, value in attributes.items():
+        span.set_attribute(key, value)
+    span.end()
+
+    otlp = json.loads(APP.otlp_json_line(span))["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+
+    assert exported == [outer, span]
+    assert otlp["parentSpanId"] == outer.span_id
+    assert otlp["traceId"] == outer.trace_id and len(otlp["traceId"]) == 32
+    for attribute in otlp["attributes"]:
+        (kind, encoded), = attribute["value"].items()
+        value = attributes[attribute["key"]]
+        expected = {
+            "boolValue": value, "intValue": str(value), "doubleValue": value, "stringValue": value,
+        }[kind]
+        assert encoded == expected
+        assert kind == (
+            "boolValue" if isinstance(value, bool) else "intValue" if isinstance(value, int)
+            else "doubleValue" if isinstance(value, float) else "stringValue"
+        )
+
+
+def test_invalid_tracing_setting_exits_1():
+    with pytest.raises(SystemExit) as exc:
+        _load_app_module(extra_env={"TRACING": "zipkin"})
+    assert exc.value.code == 1
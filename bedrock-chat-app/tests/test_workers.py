@@ -0,0 +1,392 @@
+"""
+tests/test_workers.py — Tests for running several uvicorn worker processes.
+
+Tests cover:
+  - Each worker gets its share of the concurrency and rate limits
+  - With WORKERS > 1, conversations, quotas and cached responses use SQLite
+    files that every worker sees
+  - Shared quotas are checked and counted atomically across connections,
+    and open streams of dead workers are forgotten
+  - The shared response cache stays within its entry and byte limits
+  - A generation can be resumed, or kept alive, from any worker
+  - /admin/drain drains every worker and reports their streams together
+  - SQLite statements run on their own thread, so a worker waiting for
+    another's write lock does not stall its event loop
+"""
+
+import asyncio
+import importlib.util
+import re
+import sqlite3
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest.mock
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# ---------------------------------------------------------------------------
+# Helpers to load app.py with a mocked boto3 client
+# ---------------------------------------------------------------------------
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "app.py")
+
+CHAT_BODY = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+def _load_app_module(mock_client=None, extra_env=None):
+    """Import app.py with boto3.client patched to return mock_client."""
+    if mock_client is None:
+        mock_client = unittest.mock.MagicMock()
+        mock_client.converse_stream.return_value = {"stream": []}
+    env_patch = {
+        "AWS_BEARER_TOKEN_BEDROCK": "test-token-abc123",
+        "AWS_REGION": "us-east-1",
+        "BEDROCK_MODEL_ID": "anthropic.claude-3-5-sonnet-20241022-v2:0",
+        "AUTH_ENABLED": "false",
+        "BEDROCK_MAX_RETRIES": "0",
+        **(extra_env or {}),
+    }
+    with unittest.mock.patch.dict(os.environ, env_patch, clear=False):
+        with unittest.mock.patch("boto3.client", return_value=mock_client):
+            spec = importlib.util.spec_from_file_location("app_workers_test", APP_PATH)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+    return mod
+
+
+def _worker_env(tmp_path, **extra):
+    return {
+        "WORKERS": "2",
+        "SHARED_STATE_DB": str(tmp_path / "shared-state.db"),
+        "CONVERSATION_DB_PATH": str(tmp_path / "conversations.db"),
+        **extra,
+    }
+
+
+APP = _load_app_module()
+
+
+# ---------------------------------------------------------------------------
+# Per-worker limits and backends
+# ---------------------------------------------------------------------------
+
+
+def test_limits_are_split_between_workers(tmp_path):
+    app_mod = _load_app_module(extra_env=_worker_env(
+        tmp_path, WORKERS="4", MAX_CONCURRENT_STREAMS="10", MAX_QUEUED_STREAMS="0",
+        BEDROCK_RATE_LIMIT_MIN="1", BEDROCK_RATE_LIMIT_MAX="40",
+    ))
+
+    assert app_mod.admission.max_in_flight == 3
+    assert app_mod.admission.max_queued == 0
+    assert app_mod.rate_limiter.min_rate == 0.25
+    assert app_mod.rate_limiter.max_rate == 10.0
+
+
+def test_single_worker_keeps_in_memory_state():
+    assert APP.WORKERS == 1
+    assert isinstance(APP.conversation_store, APP.InMemoryConversationStore)
+    assert type(APP.quotas) is APP.QuotaTracker
+    assert APP.admission.max_in_flight == APP.MAX_CONCURRENT_STREAMS
+
+
+def test_workers_share_conversations_and_cached_responses(tmp_path):
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": [
+        {"contentBlockDelta": {"delta": {"text": "Hello"}}},
+    ]}
+    env = _worker_env(tmp_path, RESPONSE_CACHE="true", SSE_COALESCE_WINDOW_MS="0")
+    first = _load_app_module(mock_client, extra_env=env)
+    second = _load_app_module(mock_client, extra_env=env)
+
+    assert isinstance(first.conversation_store, first.SQLiteConversationStore)
+    assert isinstance(first.response_cache, first.SQLiteResponseCache)
+    assert isinstance(first.quotas, first.SharedQuotaTracker)
+
+    body = {**CHAT_BODY, "conversation_id": "conv-1"}
+    answered = TestClient(first.app).post("/chat", json=body)
+    replayed = TestClient(second.app).post("/chat", json=body)
+    follow_up = TestClient(second.app).post("/chat", json={
+        "messages": [{"role": "user", "content": "more"}],
+        "conversation_id": "conv-1",
+        "history_length": 2,
+    })
+
+    assert "data: Hello" in answered.text
+    assert replayed.text == answered.text
+    assert follow_up.status_code == 200
+    assert mock_client.converse_stream.call_count == 2
+    assert second.conversation_store.get("ip:testclient", "conv-1").total == 4
+    assert second.quotas.snapshot()["ip:testclient"]["requests_today"] == 2
+
+
+# ---------------------------------------------------------------------------
+# SharedQuotaTracker
+# ---------------------------------------------------------------------------
+
+
+def test_concurrent_stream_limit_holds_across_connections(tmp_path):
+    path = str(tmp_path / "quota.db")
+    trackers = [APP.SharedQuotaTracker(2, 0, 0, path) for _ in range(8)]
+    barrier = threading.Barrier(len(trackers))
+    leases, rejected = [], []
+
+    def _acquire(tracker):
+        barrier.wait()
+        try:
+            leases.append(tracker.acquire("user:alice"))
+        except APP.QuotaExceeded as exc:
+            rejected.append(exc.limit)
+
+    threads = [threading.Thread(target=_acquire, args=(t,)) for t in trackers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(leases) == 2
+    assert rejected == ["concurrent_streams"] * 6
+    leases[0].release()
+    leases[0].release()  # idempotent
+    APP.wait_for_db()
+    assert trackers[3].snapshot()["user:alice"]["active_streams"] == 1
+    trackers[3].acquire("user:alice")
+
+
+def test_limits_and_usage_are_shared(tmp_path):
+    path = str(tmp_path / "quota.db")
+    one = APP.SharedQuotaTracker(0, 2, 10, path)
+    two = APP.SharedQuotaTracker(0, 2, 10, path)
+
+    one.acquire("ip:1").release()
+    two.acquire("ip:1").release()
+    with pytest.raises(APP.QuotaExceeded) as exc:
+        one.acquire("ip:1")
+    assert exc.value.limit == "requests_per_minute"
+    assert 1 <= exc.value.retry_after <= 60
+
+    one.record_tokens("ip:2", {"inputTokens": 3, "outputTokens": 10})
+    APP.wait_for_db()
+    with pytest.raises(APP.QuotaExceeded) as exc:
+        two.acquire("ip:2")
+    assert exc.value.limit == "output_tokens_per_day"
+
+    usage = two.snapshot()
+    assert usage["ip:1"]["requests_last_minute"] == 2
+    assert usage["ip:1"]["active_streams"] == 0
+    assert usage["ip:2"]["input_tokens_today"] == 3
+
+
+def test_waiting_for_the_write_lock_does_not_block_the_loop(tmp_path):
+    path = str(tmp_path / "quota.db")
+    tracker = APP.SharedQuotaTracker(1, 0, 0, path)
+    other_worker = sqlite3.connect(path, isolation_level=None)
+    other_worker.execute("BEGIN IMMEDIATE")
+
+    async def _run():
+        ticks = 0
+        acquiring = asyncio.ensure_future(tracker.acquire_async("user:carol"))
+        while not acquiring.done():
+            ticks += 1
+            if ticks == 10:
+                other_worker.execute("COMMIT")
+            await asyncio.sleep(0.02)
+        return ticks, acquiring.result()
+
+    started = time.monotonic()
+    ticks, lease = asyncio.run(_run())
+
+    assert ticks >= 10 and time.monotonic() - started >= 0.2
+    lease.release()
+    APP.wait_for_db()
+    assert tracker.snapshot()["user:carol"]["active_streams"] == 0
+
+
+def test_streams_of_dead_workers_are_forgotten(tmp_path):
+    path = str(tmp_path / "quota.db")
+    tracker = APP.SharedQuotaTracker(1, 0, 0, path)
+    tracker.acquire("user:bob")
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                          capture_output=True, text=True, check=True)
+    tracker._conn.execute("UPDATE quota_streams SET pid = ?", (int(dead.stdout),))
+
+    restarted = APP.SharedQuotaTracker(1, 0, 0, path)
+
+    assert restarted.snapshot()["user:bob"]["active_streams"] == 0
+    restarted.acquire("user:bob")
+
+
+# ---------------------------------------------------------------------------
+# SQLiteResponseCache
+# ---------------------------------------------------------------------------
+
+
+@settings(max_examples=50, deadline=None)
+@given(
+    sizes=st.lists(st.integers(min_value=1, max_value=40), min_size=1, max_size=20),
+    max_entries=st.integers(min_value=1, max_value=5),
+)
+def test_shared_cache_stays_within_limits(tmp_path_factory, sizes, max_entries):
+    path = str(tmp_path_factory.mktemp("cache") / "shared-state.db")
+    cache = APP.SQLiteResponseCache(path, 300.0, max_entries, 100)
+    other = APP.SQLiteResponseCache(path, 300.0, max_entries, 100)
+
+    for i, size in enumerate(sizes):
+        cache._store(f"k{i}", (APP.StreamEvent("text", "x" * (size - 4), 1), APP.StreamEvent("done", "", 2)))
+
+    assert len(other) <= max_entries
+    assert other.bytes <= 100
+    last = other.get(f"k{len(sizes) - 1}")
+    assert last == (APP.StreamEvent("text", "x" * (sizes[-1] - 4), 1), APP.StreamEvent("done", "", 2))
+
+
+def test_finished_responses_are_written_off_the_loop(tmp_path):
+    cache = APP.SQLiteResponseCache(str(tmp_path / "shared-state.db"), 300.0, 10, 1000)
+    events = (APP.StreamEvent("text", "hi", 1), APP.StreamEvent("done", "", 2))
+    loop_thread = threading.get_ident()
+    writers = []
+    store = cache._store
+
+    def _store(key, stored):
+        writers.append(threading.get_ident())
+        store(key, stored)
+
+    with unittest.mock.patch.object(cache, "_store", side_effect=_store):
+        cache._keep("k", events)
+        APP.wait_for_db()
+
+    assert writers and loop_thread not in writers
+    assert asyncio.run(cache.get_async("k")) == events
+
+
+# ---------------------------------------------------------------------------
+# SQLiteGenerationRegistry
+# ---------------------------------------------------------------------------
+
+
+def test_a_dropped_stream_resumes_on_another_worker(tmp_path):
+    release = threading.Event()
+
+    def _blocked_stream():
+        yield {"contentBlockDelta": {"delta": {"text": "Hello"}}}
+        release.wait(timeout=10)
+        yield {"contentBlockDelta": {"delta": {"text": " world"}}}
+
+    mock_client = unittest.mock.MagicMock()
+    mock_client.converse_stream.side_effect = lambda **kwargs: {"stream": _blocked_stream()}
+    env = _worker_env(tmp_path, SSE_COALESCE_WINDOW_MS="0")
+    first = _load_app_module(mock_client, extra_env=env)
+    second = _load_app_module(mock_client, extra_env=env)
+    assert isinstance(second.generations, second.SQLiteGenerationRegistry)
+
+    async def _run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=first.app), base_url="http://test"
+        ) as client:
+            chat_task = asyncio.create_task(client.post("/chat", json=CHAT_BODY))
+            await asyncio.sleep(0.3)
+            generation_id = next(iter(first.generations._generations))
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=second.app), base_url="http://test"
+            ) as other:
+                resume_task = asyncio.create_task(other.get(
+                    f"/chat/generations/{generation_id}", headers={"Last-Event-ID": "1"}
+                ))
+                await asyncio.sleep(0.2)
+                release.set()
+                return await asyncio.wait_for(asyncio.gather(chat_task, resume_task), timeout=5)
+
+    try:
+        chat, resumed = asyncio.run(_run())
+    finally:
+        release.set()
+
+    assert resumed.status_code == 200
+    assert "data: Hello" in chat.text and "data: Hello" not in resumed.text
+    assert "data:  world" in resumed.text and "event: done" in resumed.text
+    ids = [int(i) for i in re.findall(r"^id: (\d+)$", resumed.text, re.MULTILINE)]
+    assert ids and ids[0] == 2
+    assert mock_client.converse_stream.call_count == 1
+
+
+def test_a_reader_on_another_worker_keeps_the_generation_alive(tmp_path):
+    env = _worker_env(tmp_path, GENERATION_ORPHAN_TIMEOUT="0.3")
+    first = _load_app_module(extra_env=env)
+    second = _load_app_module(extra_env=env)
+
+    async def _slow_source():
+        await asyncio.sleep(1.0)
+        yield first.StreamEvent("text", "late")
+        yield first.StreamEvent("done")
+
+    async def _run():
+        generation = first.generations.start(_slow_source(), "ip:1")
+        await asyncio.sleep(0.05)
+        stored = await second.generations.get_async(generation.generation_id)
+        assert "ip:1" in stored.owners
+        events = [e async for e in stored.subscribe()]
+        return generation, events
+
+    generation, events = asyncio.run(_run())
+
+    assert generation.complete
+    assert [(e.kind, e.data, e.id) for e in events] == [("text", "late", 1), ("done", "", 2)]
+
+
+def test_generations_of_a_stopped_worker_end_with_an_error(tmp_path):
+    registry = APP.SQLiteGenerationRegistry(str(tmp_path / "shared-state.db"), 16, 15.0, 60.0)
+    registry._write("g", ["ip:1"], [APP.StreamEvent("text", "partial", 1)], False)
+    registry._conn.execute("UPDATE generations SET updated = ?", (time.time() - 30.0,))
+
+    async def _run():
+        stored = await registry.get_async("g")
+        return [e async for e in stored.subscribe()]
+
+    events = asyncio.run(_run())
+
+    assert [e.kind for e in events] == ["text", "error"]
+    assert asyncio.run(registry.get_async("missing")) is None
+
+
+# ---------------------------------------------------------------------------
+# SharedDrainState
+# ---------------------------------------------------------------------------
+
+
+def test_drain_applies_to_every_worker(tmp_path):
+    env = _worker_env(tmp_path, ADMIN_ALLOW_LOCALHOST="true")
+    first = _load_app_module(extra_env=env)
+    second = _load_app_module(extra_env=env)
+    assert isinstance(second.drain, second.SharedDrainState)
+
+    async def _request(app_mod, method, path, **kwargs):
+        transport = httpx.ASGITransport(app=app_mod.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+
+    async def _run():
+        second.admission.in_flight = 2
+        drained = await _request(first, "POST", "/admin/drain")
+        await second.drain.refresh()
+        refused = await _request(second, "POST", "/chat", json=CHAT_BODY)
+        status = await _request(first, "GET", "/admin/drain")
+        second.admission.in_flight = 0
+        await _request(second, "DELETE", "/admin/drain")
+        await first.drain.refresh()
+        return drained, refused, status
+
+    drained, refused, status = asyncio.run(_run())
+
+    assert drained.json()["draining"] is True
+    assert refused.status_code == 503
+    assert status.json() == {"draining": True, "in_flight": 2, "queued": 0}
+    assert first.drain.draining is False
+    restarted = _load_app_module(extra_env=env)
+    assert restarted.drain.draining is False